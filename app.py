@@ -7,4 +7,10 @@ app = create_app()
 if __name__ == "__main__":
     port = int(os.getenv("PORT", "5000"))
     debug = os.getenv("FLASK_DEBUG", "0") == "1"
+    # Como en wsgi.py: el panel lee las aperturas que marca el scheduler. Con el reloader de
+    # debug este bloque corre en dos procesos; el scheduler, solo en el que sirve.
+    if not debug or os.getenv("WERKZEUG_RUN_MAIN") == "true":
+        from app.scheduler import iniciar_unlock_scheduler
+
+        iniciar_unlock_scheduler(app)
     app.run(debug=debug, port=port)
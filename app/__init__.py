@@ -1,14 +1,17 @@
 import os
+import threading
+import uuid
 from dotenv import load_dotenv
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
 from flask_login import LoginManager
 
+from .database import configurar_sqlite, opciones_engine
+from .passwords import DEFAULT_HASH_METHOD
+
 load_dotenv()
 
 db = SQLAlchemy()
-migrate = Migrate()
 login_manager = LoginManager()
 login_manager.login_view = "main.index"
 
@@ -20,6 +23,16 @@ def _env_bool(name: str, default: bool = False) -> bool:
     return raw.strip().lower() in {"1", "true", "yes", "on"}
 
 
+def _env_float(name: str, default: float) -> float:
+    raw = os.getenv(name)
+    if raw is None or not raw.strip():
+        return default
+    try:
+        return float(raw)
+    except ValueError:
+        return default
+
+
 def create_app():
     app = Flask(__name__, template_folder="../templates", static_folder="../static")
     app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", "dev-secret-change-me")
@@ -40,11 +53,78 @@ def create_app():
 
     app.config["SQLALCHEMY_DATABASE_URI"] = db_url
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    # Pool, pre-ping, recycle y statement_timeout (Postgres) o busy timeout (SQLite): DB_* en el entorno.
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = opciones_engine(db_url)
     app.config["PREMIUM_ENABLED"] = _env_bool("PREMIUM_ENABLED", default=False)
+    admin_emails = (os.getenv("ECO_ADMIN_EMAILS") or "").strip() or "celiafm17@gmail.com"
+    app.config["ADMIN_EMAILS"] = frozenset(e.strip().lower() for e in admin_emails.split(",") if e.strip())
+    # Algoritmo y coste del hash de contraseñas (formato de Werkzeug; por defecto, el suyo). Los hashes
+    # más débiles se actualizan al hacer login, nunca a la baja. PASSWORD_VERIFY_THREADS > 0 verifica en un pool acotado.
+    app.config["PASSWORD_HASH_METHOD"] = os.getenv("PASSWORD_HASH_METHOD") or DEFAULT_HASH_METHOD
+    app.config["PASSWORD_VERIFY_THREADS"] = int(_env_float("PASSWORD_VERIFY_THREADS", 0))
+    # Segundos que se reutiliza la identidad del usuario de la sesión sin ir a la BD (0 = siempre a la BD).
+    app.config["USER_CACHE_TTL_SECONDS"] = _env_float("USER_CACHE_TTL_SECONDS", 30)
+    # Tope del cuerpo de cualquier petición: la foto (máx 6 MB) más el resto del formulario.
+    app.config["MAX_CONTENT_LENGTH"] = int(_env_float("MAX_CONTENT_LENGTH", 7 * 1024 * 1024))
+    # Cambia en cada despliegue para que los ETags no sobrevivan a cambios de plantillas.
+    app.config["BUILD_ID"] = os.getenv("RENDER_GIT_COMMIT") or uuid.uuid4().hex[:12]
+    # Límite de búsquedas por usuario (token bucket): ráfaga máxima y recarga por segundo.
+    app.config["SEARCH_RATE_LIMIT_BURST"] = _env_float("SEARCH_RATE_LIMIT_BURST", 10)
+    app.config["SEARCH_RATE_LIMIT_PER_SECOND"] = _env_float("SEARCH_RATE_LIMIT_PER_SECOND", 1)
+    # Intentos de login/registro/recuperación por IP y por email en una ventana deslizante (0 = sin límite).
+    # Con varios workers, AUTH_RATE_LIMIT_BACKEND=sqlite comparte los contadores en un fichero.
+    app.config["AUTH_RATE_LIMIT_IP"] = int(_env_float("AUTH_RATE_LIMIT_IP", 30))
+    app.config["AUTH_RATE_LIMIT_IP_WINDOW"] = _env_float("AUTH_RATE_LIMIT_IP_WINDOW", 5 * 60)
+    app.config["AUTH_RATE_LIMIT_EMAIL"] = int(_env_float("AUTH_RATE_LIMIT_EMAIL", 10))
+    app.config["AUTH_RATE_LIMIT_EMAIL_WINDOW"] = _env_float("AUTH_RATE_LIMIT_EMAIL_WINDOW", 15 * 60)
+    app.config["AUTH_RATE_LIMIT_BACKEND"] = (os.getenv("AUTH_RATE_LIMIT_BACKEND") or "memory").strip().lower()
+    app.config["AUTH_RATE_LIMIT_PATH"] = os.getenv("AUTH_RATE_LIMIT_PATH") or os.path.join("/tmp", "eco_auth_rate_limit.sqlite3")
+
+    # Aperturas de cápsulas: cada cuánto relee el scheduler la tabla de trabajos y cuántos segundos
+    # antes de la apertura se queda abierto el SSE del ritual esperando el aviso.
+    app.config["UNLOCK_SCHEDULER_REFRESH_SECONDS"] = _env_float("UNLOCK_SCHEDULER_REFRESH_SECONDS", 300)
+    app.config["CAPSULE_EVENTS_HOLD_SECONDS"] = _env_float("CAPSULE_EVENTS_HOLD_SECONDS", 25)
+
+    # Dónde viven las fotos subidas: "filesystem" (static/uploads) o "s3" (S3, MinIO, R2...).
+    # Un STORAGE_ROOT fuera de static se sirve en /media/uploads/... (ver init_storage).
+    app.config["STORAGE_BACKEND"] = (os.getenv("STORAGE_BACKEND") or "filesystem").strip().lower()
+    app.config["STORAGE_ROOT"] = os.getenv("STORAGE_ROOT") or app.static_folder
+    # Temporales de las subidas: fuera de lo que se sirve y, a ser posible, en el disco de STORAGE_ROOT
+    # (así guardar() es un rename). Por defecto <STORAGE_ROOT>/tmp, o instance/tmp si STORAGE_ROOT es static.
+    app.config["STORAGE_TMP_DIR"] = os.getenv("STORAGE_TMP_DIR")
+    app.config["S3_BUCKET"] = os.getenv("S3_BUCKET")
+    app.config["S3_REGION"] = os.getenv("S3_REGION") or os.getenv("AWS_REGION") or "us-east-1"
+    app.config["S3_ENDPOINT_URL"] = os.getenv("S3_ENDPOINT_URL")
+    app.config["S3_ACCESS_KEY_ID"] = os.getenv("S3_ACCESS_KEY_ID") or os.getenv("AWS_ACCESS_KEY_ID")
+    app.config["S3_SECRET_ACCESS_KEY"] = os.getenv("S3_SECRET_ACCESS_KEY") or os.getenv("AWS_SECRET_ACCESS_KEY")
+    # Con URL pública (CDN o bucket público) no se firma nada; si no, URLs prefirmadas.
+    app.config["S3_PUBLIC_BASE_URL"] = os.getenv("S3_PUBLIC_BASE_URL")
+    app.config["S3_PRESIGN_EXPIRES"] = int(_env_float("S3_PRESIGN_EXPIRES", 3600))
+    if app.config["STORAGE_BACKEND"] == "s3" and not app.config["S3_BUCKET"]:
+        raise RuntimeError("STORAGE_BACKEND=s3 requiere S3_BUCKET.")
+
+    # Manifest de scripts/build_assets.py; sin él, url_for('static') sirve los ficheros tal cual.
+    app.config["ASSET_MANIFEST"] = os.getenv("ASSET_MANIFEST")
+
+    # Detrás del proxy de Render, remote_addr sería el del balanceador: se toma de X-Forwarded-For.
+    proxies = int(_env_float("PROXY_FIX_X_FOR", 1 if running_on_render else 0))
+    if proxies > 0:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies)
 
     db.init_app(app)
-    migrate.init_app(app, db)
+    with app.app_context():
+        configurar_sqlite(db.engine)
     login_manager.init_app(app)
+    if os.getenv("FLASK_RUN_FROM_CLI") == "true":
+        # Alembic (vía Flask-Migrate) solo hace falta para `flask db ...`; los workers no lo cargan.
+        from flask_migrate import Migrate
+        Migrate(app, db)
+
+    from .assets import init_assets
+    init_assets(app)
+    from .storage import init_storage
+    init_storage(app)
 
     from .auth import auth_bp
     from .main import main_bp
@@ -58,5 +138,18 @@ def create_app():
     return app
 
 
-# WSGI callable for production servers (e.g. gunicorn app:app)
-app = create_app()
+_app = None
+_app_lock = threading.Lock()
+
+
+def __getattr__(name):
+    # `app` se construye al pedirlo (gunicorn app:app, flask --app app.py), nunca al importar
+    # el paquete: wsgi.py, los scripts y los tests crean la suya con create_app().
+    global _app
+    if name != "app":
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if _app is None:
+        with _app_lock:
+            if _app is None:
+                _app = create_app()
+    return _app
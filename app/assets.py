@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import json
+import mimetypes
+import os
+
+from flask import current_app, request, send_from_directory, url_for
+from markupsafe import Markup
+
+
+BUILD_DIR = "build"
+MANIFEST_NAME = "manifest.json"
+CACHE_INMUTABLE = "public, max-age=31536000, immutable"
+# Orden de preferencia al negociar con Accept-Encoding.
+ENCODINGS_PRECOMPRIMIDOS = (("br", ".br"), ("gzip", ".gz"))
+MIME_VARIANTES = {"avif": "image/avif", "webp": "image/webp"}
+
+
+def cargar_manifest(path: str) -> dict:
+    """Manifest de scripts/build_assets.py; vacío si no se ha construido (desarrollo)."""
+    try:
+        with open(path, encoding="utf-8") as fichero:
+            manifest = json.load(fichero)
+    except (OSError, ValueError):
+        return {"files": {}, "variants": {}}
+    manifest.setdefault("files", {})
+    manifest.setdefault("variants", {})
+    return manifest
+
+
+def static_sources(filename: str) -> list[tuple[str, str]]:
+    """(tipo MIME, URL) de las variantes AVIF/WebP de una imagen, de la más ligera a la más pesada."""
+    variantes = current_app.extensions["eco_assets"]["variants"].get(filename, {})
+    return [
+        (MIME_VARIANTES[formato], url_for("static", filename=variantes[formato]))
+        for formato in MIME_VARIANTES
+        if formato in variantes
+    ]
+
+
+def static_image_set(filename: str) -> Markup:
+    """`image-set()` para CSS con las variantes y el original como último recurso."""
+    fuentes = static_sources(filename)
+    if not fuentes:
+        return Markup('url("{}")').format(url_for("static", filename=filename))
+    # El respaldo puede haber cambiado de formato en el build (PNG opaco -> JPEG).
+    respaldo = current_app.extensions["eco_assets"]["files"].get(filename, filename)
+    tipo_original = mimetypes.guess_type(respaldo)[0] or "image/png"
+    partes = [*fuentes, (tipo_original, url_for("static", filename=filename))]
+    return Markup("image-set({})").format(
+        Markup(", ").join(Markup('url("{}") type("{}")').format(url, tipo) for tipo, url in partes)
+    )
+
+
+def init_assets(app) -> None:
+    """Conecta el manifest de assets con fingerprint: `url_for('static', ...)` apunta a la copia con
+    hash, que se sirve precomprimida (br/gzip) y con Cache-Control inmutable."""
+    manifest_path = app.config.get("ASSET_MANIFEST") or os.path.join(app.static_folder, BUILD_DIR, MANIFEST_NAME)
+    app.extensions["eco_assets"] = cargar_manifest(manifest_path)
+    prefijo_build = f"{app.static_url_path}/{BUILD_DIR}/"
+
+    @app.url_defaults
+    def usar_asset_con_fingerprint(endpoint, values):
+        if endpoint != "static":
+            return
+        ruta = app.extensions["eco_assets"]["files"].get(values.get("filename"))
+        if ruta:
+            values["filename"] = ruta
+            # El hash ya rompe la caché; el ?v= manual sobra.
+            values.pop("v", None)
+
+    @app.before_request
+    def servir_asset_precomprimido():
+        if not request.path.startswith(prefijo_build):
+            return None
+        filename = request.path[len(app.static_url_path) + 1 :]
+        for encoding, sufijo in ENCODINGS_PRECOMPRIMIDOS:
+            if not request.accept_encodings[encoding]:
+                continue
+            if not os.path.isfile(os.path.join(app.static_folder, filename + sufijo)):
+                continue
+            response = send_from_directory(
+                app.static_folder,
+                filename + sufijo,
+                mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream",
+            )
+            response.headers["Content-Encoding"] = encoding
+            return response
+        return None
+
+    @app.after_request
+    def cachear_assets_inmutables(response):
+        if request.path.startswith(prefijo_build) and response.status_code in (200, 304):
+            response.headers["Cache-Control"] = CACHE_INMUTABLE
+            response.vary.add("Accept-Encoding")
+        return response
+
+    app.add_template_global(static_sources)
+    app.add_template_global(static_image_set)
@@ -1,11 +1,79 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
-from flask_login import login_user, logout_user, login_required
+import math
+import threading
+from collections import Counter
+
+from flask import Blueprint, current_app, jsonify, render_template, request, redirect, url_for, flash
+from flask_login import current_user, login_user, logout_user, login_required
+from .main import is_admin_user
 from .models import User
+from .rate_limit import MemoryCounterStore, SlidingWindowLimiter, SQLiteCounterStore
 from . import db
 
 auth_bp = Blueprint("auth", __name__)
 
 
+class AuthThrottle:
+    """Límites de login, registro y recuperación por IP y por email, y cuántos intentos se rechazan.
+
+    Los contadores pueden compartirse entre workers (SQLite); las métricas son del proceso.
+    """
+
+    def __init__(self, store, config):
+        self.por_ip = SlidingWindowLimiter(
+            store, config["AUTH_RATE_LIMIT_IP"], config["AUTH_RATE_LIMIT_IP_WINDOW"], prefix="ip"
+        )
+        self.por_email = SlidingWindowLimiter(
+            store, config["AUTH_RATE_LIMIT_EMAIL"], config["AUTH_RATE_LIMIT_EMAIL_WINDOW"], prefix="email"
+        )
+        self.rechazos: Counter[str] = Counter()
+        self._lock = threading.Lock()
+
+    def comprobar(self, endpoint: str, ip: str, email: str) -> float | None:
+        """Cuenta el intento; devuelve None si se permite o los segundos que hay que esperar."""
+        for dimension, limiter, clave in (("ip", self.por_ip, ip), ("email", self.por_email, email)):
+            if not clave:
+                continue
+            permitido, retry_after = limiter.hit(clave)
+            if not permitido:
+                with self._lock:
+                    self.rechazos[f"{endpoint}:{dimension}"] += 1
+                current_app.logger.warning("Intento de %s rechazado por límite de %s (ip=%s)", endpoint, dimension, ip)
+                return retry_after
+        return None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"rechazos": dict(self.rechazos), "total": sum(self.rechazos.values())}
+
+
+def throttle_auth() -> AuthThrottle:
+    throttle = current_app.extensions.get("eco_auth_throttle")
+    if throttle is None:
+        config = current_app.config
+        if config["AUTH_RATE_LIMIT_BACKEND"] == "sqlite":
+            store = SQLiteCounterStore(config["AUTH_RATE_LIMIT_PATH"])
+        else:
+            store = MemoryCounterStore()
+        throttle = current_app.extensions.setdefault("eco_auth_throttle", AuthThrottle(store, config))
+    return throttle
+
+
+def limitar_intento(email: str, template: str):
+    """429 con la plantilla del formulario si el intento supera algún límite; si no, None.
+
+    Se llama antes de buscar al usuario y de hashear nada: un ataque de credenciales
+    no llega a gastar CPU en PBKDF2.
+    """
+    retry_after = throttle_auth().comprobar(request.endpoint, request.remote_addr or "", email)
+    if retry_after is None:
+        return None
+    espera = max(1, math.ceil(min(retry_after, 3600)))
+    flash(f"Demasiados intentos. Prueba de nuevo en {espera} segundos.")
+    response = current_app.make_response((render_template(template), 429))
+    response.headers["Retry-After"] = str(espera)
+    return response
+
+
 @auth_bp.get("/register")
 def register():
     return render_template("register.html")
@@ -20,6 +88,10 @@ def register_post():
         flash("Email y contraseña son obligatorios.")
         return redirect(url_for("auth.register"))
 
+    bloqueo = limitar_intento(email, "register.html")
+    if bloqueo is not None:
+        return bloqueo
+
     if User.query.filter_by(email=email).first():
         flash("Ese email ya está registrado.")
         return redirect(url_for("auth.register"))
@@ -42,11 +114,20 @@ def login_post():
     email = request.form.get("email", "").strip().lower()
     password = request.form.get("password", "")
     remember = request.form.get("remember") == "1"
+    bloqueo = limitar_intento(email, "login.html")
+    if bloqueo is not None:
+        return bloqueo
+
     u = User.query.filter_by(email=email).first()
     if not u or not u.check_password(password):
         flash("Credenciales incorrectas.")
         return redirect(url_for("main.index", auth="login"))
 
+    if u.password_needs_rehash():
+        # La contraseña en claro solo la tenemos aquí: se aprovecha para subir el hash al método actual.
+        u.set_password(password)
+        db.session.commit()
+
     login_user(u, remember=remember)
     return redirect(url_for("main.index"))
 
@@ -74,6 +155,10 @@ def forgot_password_post():
         flash("Las contraseñas no coinciden.")
         return redirect(url_for("auth.forgot_password"))
 
+    bloqueo = limitar_intento(email, "forgot_password.html")
+    if bloqueo is not None:
+        return bloqueo
+
     u = User.query.filter_by(email=email).first()
     if not u:
         flash("No encontramos una cuenta con ese email.")
@@ -90,3 +175,11 @@ def forgot_password_post():
 def logout():
     logout_user()
     return redirect(url_for("main.index"))
+
+
+@auth_bp.get("/admin/auth-throttle")
+@login_required
+def admin_auth_throttle():
+    if not is_admin_user(current_user):
+        return jsonify({"ok": False, "error": "forbidden"}), 403
+    return jsonify({"ok": True, **throttle_auth().stats()})
@@ -1,20 +1,85 @@
 from datetime import datetime
 
-from flask import abort
+from flask import abort, current_app
+from sqlalchemy import case, func, or_, update
+
 from . import db
-from .models import Capsule
+from .models import Capsule, CapsuleUnlockJob, User
+
+
+# Cápsulas cerradas con fecha futura que puede tener a la vez un usuario del plan Free.
+FREE_SEALED_CAPSULES = 1
+
+
+def selladas_activas(user, ahora=None) -> int:
+    """Cápsulas cerradas de `user` cuya fecha aún no ha llegado, sin COUNT en el caso normal.
+
+    User.sealed_capsules solo puede bajar cuando vence la más próxima (sealed_capsules_until);
+    hasta entonces se lee tal cual y, pasado ese momento, se recalcula una vez con el índice.
+    """
+    ahora = ahora or datetime.utcnow()
+    hasta = user.sealed_capsules_until
+    if hasta is None or hasta > ahora:
+        return user.sealed_capsules
+
+    total, proxima = (
+        db.session.query(func.count(Capsule.id), func.min(Capsule.open_date))
+        .filter(Capsule.user_id == user.id, Capsule.opened_at.is_(None), Capsule.open_date > ahora)
+        .one()
+    )
+    # Condicionado a `hasta`: si otra petición lo ha tocado entretanto, su valor ya está al día.
+    db.session.execute(
+        update(User)
+        .where(User.id == user.id, User.sealed_capsules_until == hasta)
+        .values(sealed_capsules=total, sealed_capsules_until=proxima)
+    )
+    db.session.expire(user, ["sealed_capsules", "sealed_capsules_until"])
+    return total
 
 
 def can_create_capsule(user):
     if bool(user.is_premium):
         return True
+    return selladas_activas(user) < FREE_SEALED_CAPSULES
+
+
+def reservar_capsula(user, open_date, limite=None) -> bool:
+    """Suma al contador la cápsula que se va a crear; con `limite`, solo si aún cabe.
 
-    active_closed = Capsule.query.filter(
-        Capsule.user_id == user.id,
-        Capsule.opened_at.is_(None),
-        Capsule.open_date > datetime.utcnow(),
-    ).count()
-    return active_closed < 1
+    Es un UPDATE condicional sobre la fila del usuario: dos creaciones simultáneas se serializan
+    en ese bloqueo y la segunda ya ve el contador de la primera, así que no pueden colarse ambas.
+    """
+    selladas_activas(user)
+    hasta = User.sealed_capsules_until
+    stmt = (
+        update(User)
+        .where(User.id == user.id)
+        .values(
+            sealed_capsules=User.sealed_capsules + 1,
+            sealed_capsules_until=case((or_(hasta.is_(None), hasta > open_date), open_date), else_=hasta),
+        )
+    )
+    if limite is not None:
+        stmt = stmt.where(User.sealed_capsules < limite)
+    reservada = db.session.execute(stmt).rowcount == 1
+    db.session.expire(user, ["sealed_capsules", "sealed_capsules_until"])
+    return reservada
+
+
+def capsula_abrible(capsule) -> bool:
+    """Lo que muestran el panel y el ritual: abierta, o marcada ya por el scheduler.
+
+    Las vistas no vuelven a comparar open_date con la hora por cada fila: el scheduler marca
+    done_at en el momento de la apertura (y al arrancar, las que vencieron con él parado).
+    Solo una cápsula sin aviso, anterior a capsule_unlock_job, se decide por la hora. Abrirla
+    de verdad lo sigue validando open_capsule_or_403 con la hora del servidor.
+    """
+    if capsule.opened_at is not None:
+        return True
+    job = capsule.unlock_job
+    if job is None:
+        return datetime.utcnow() >= capsule.open_date
+    return job.done_at is not None
 
 
 def open_capsule_or_403(capsule):
@@ -24,3 +89,16 @@ def open_capsule_or_403(capsule):
     if capsule.opened_at is None:
         capsule.opened_at = now
         db.session.commit()
+
+
+def programar_apertura(capsule):
+    """Guarda el aviso de apertura en la misma transacción que la cápsula."""
+    db.session.flush()
+    db.session.add(CapsuleUnlockJob(capsule_id=capsule.id, run_at=capsule.open_date))
+
+
+def avisar_scheduler(capsule):
+    # Tras el commit: si el scheduler de este proceso ya corre, que la tenga en el heap sin esperar al refresco.
+    scheduler = current_app.extensions.get("eco_unlock_scheduler")
+    if scheduler is not None:
+        scheduler.programar(capsule.id, capsule.open_date)
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import os
+
+from sqlalchemy import event
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    raw = os.getenv(name)
+    if raw is None:
+        return default
+    return raw.strip().lower() in {"1", "true", "yes", "on"}
+
+
+def es_sqlite(db_url: str) -> bool:
+    return db_url.startswith("sqlite:")
+
+
+def opciones_engine(db_url: str) -> dict:
+    """SQLALCHEMY_ENGINE_OPTIONS a partir del entorno.
+
+    Postgres: pool por proceso dimensionado a los hilos de gunicorn más el hueco que piden los
+    hilos de previews, pre-ping y reciclado para no heredar conexiones que Render cortó mientras
+    el servicio dormía, y statement_timeout para que una consulta atascada no bloquee un worker.
+    SQLite: solo el busy timeout; los PRAGMA van en configurar_sqlite().
+    """
+    if es_sqlite(db_url):
+        return {"connect_args": {"timeout": _env_int("DB_BUSY_TIMEOUT_MS", 5000) / 1000}}
+
+    hilos = max(1, _env_int("GUNICORN_THREADS", 1))
+    connect_args = {
+        "connect_timeout": _env_int("DB_CONNECT_TIMEOUT", 5),
+        # Keepalives TCP: detectan antes una conexión muerta que el pre-ping no llega a ver.
+        "keepalives": 1,
+        "keepalives_idle": 30,
+        "keepalives_interval": 10,
+        "keepalives_count": 3,
+    }
+    statement_timeout_ms = _env_int("DB_STATEMENT_TIMEOUT_MS", 5000)
+    if statement_timeout_ms > 0:
+        connect_args["options"] = f"-c statement_timeout={statement_timeout_ms}"
+    return {
+        "pool_size": _env_int("DB_POOL_SIZE", hilos + 2),
+        "max_overflow": _env_int("DB_MAX_OVERFLOW", 5),
+        "pool_timeout": _env_int("DB_POOL_TIMEOUT", 10),
+        "pool_recycle": _env_int("DB_POOL_RECYCLE", 280),
+        "pool_pre_ping": _env_bool("DB_POOL_PRE_PING", True),
+        "connect_args": connect_args,
+    }
+
+
+def _pragmas_sqlite(dbapi_connection, _connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    try:
+        # WAL: los lectores no bloquean al escritor; NORMAL es seguro con WAL y evita un fsync por commit.
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={_env_int('DB_BUSY_TIMEOUT_MS', 5000)}")
+    finally:
+        cursor.close()
+
+
+def configurar_sqlite(engine) -> None:
+    """Aplica los PRAGMA a cada conexión nueva de un SQLite en fichero (no a :memory:)."""
+    if engine.dialect.name != "sqlite" or engine.url.database in (None, "", ":memory:"):
+        return
+    if _env_bool("DB_SQLITE_WAL", True):
+        event.listen(engine, "connect", _pragmas_sqlite)
@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import os
+import random
+import threading
+import time
+from typing import TYPE_CHECKING
+from urllib.parse import urlsplit
+
+if TYPE_CHECKING:
+    import requests
+
+# `requests` se importa en la primera petición saliente, no al arrancar el worker.
+
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+POOL_CONNECTIONS = _env_int("HTTP_POOL_CONNECTIONS", 4)
+POOL_MAXSIZE = _env_int("HTTP_POOL_MAXSIZE", 10)
+MAX_RETRIES = _env_int("HTTP_MAX_RETRIES", 2)
+BACKOFF_BASE_SECONDS = _env_float("HTTP_BACKOFF_BASE_SECONDS", 0.2)
+# Un Retry-After más largo que esto no merece bloquear al worker: devolvemos la respuesta tal cual.
+RETRY_AFTER_MAX_SECONDS = _env_float("HTTP_RETRY_AFTER_MAX_SECONDS", 3.0)
+BREAKER_THRESHOLD = _env_int("HTTP_BREAKER_THRESHOLD", 5)
+BREAKER_COOLDOWN_SECONDS = _env_float("HTTP_BREAKER_COOLDOWN_SECONDS", 30.0)
+
+
+class CircuitBreaker:
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN_SECONDS):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.cooldown:
+                # Semiabierto: dejamos pasar una petición de prueba.
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+_breakers: dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+_circuit_open_error: type | None = None
+
+
+def circuit_open_error() -> type:
+    """CircuitOpenError hereda de requests.RequestException, así que se define al primer uso."""
+    global _circuit_open_error
+    if _circuit_open_error is None:
+        with _session_lock:
+            if _circuit_open_error is None:
+                import requests
+
+                class CircuitOpenError(requests.RequestException):
+                    """El host ha fallado demasiadas veces seguidas y está en enfriamiento."""
+
+                _circuit_open_error = CircuitOpenError
+    return _circuit_open_error
+
+
+def __getattr__(name: str):
+    if name == "CircuitOpenError":
+        return circuit_open_error()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def get_breaker(host: str) -> CircuitBreaker:
+    with _breakers_lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = _breakers[host] = CircuitBreaker()
+        return breaker
+
+
+def reset() -> None:
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+    with _breakers_lock:
+        _breakers.clear()
+
+
+def _retry_after_seconds(response: requests.Response) -> float | None:
+    raw = (response.headers.get("Retry-After") or "").strip()
+    if not raw:
+        return None
+    try:
+        return max(0.0, float(raw))
+    except ValueError:
+        return None
+
+
+def _backoff(attempt: int) -> float:
+    # "Full jitter": espera aleatoria entre 0 y base * 2^intento.
+    return random.uniform(0, BACKOFF_BASE_SECONDS * (2**attempt))
+
+
+def request(method: str, url: str, **kwargs) -> requests.Response:
+    import requests
+
+    host = urlsplit(url).netloc
+    breaker = get_breaker(host)
+    if not breaker.allow():
+        raise circuit_open_error()(f"circuito abierto para {host}")
+
+    session = get_session()
+    attempt = 0
+    while True:
+        try:
+            response = session.request(method, url, **kwargs)
+        except requests.ConnectionError:
+            if attempt >= MAX_RETRIES:
+                breaker.record_failure()
+                raise
+            time.sleep(_backoff(attempt))
+            attempt += 1
+            continue
+        except requests.RequestException:
+            breaker.record_failure()
+            raise
+
+        if response.status_code not in RETRY_STATUSES:
+            breaker.record_success()
+            return response
+
+        wait_for = _retry_after_seconds(response)
+        if attempt >= MAX_RETRIES or (wait_for is not None and wait_for > RETRY_AFTER_MAX_SECONDS):
+            if response.status_code >= 500:
+                breaker.record_failure()
+            return response
+
+        response.close()
+        time.sleep(wait_for if wait_for is not None else _backoff(attempt))
+        attempt += 1
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import functools
+import logging
+import math
+import os
+import tempfile
+
+from .storage import StorageError, get_storage
+
+
+logger = logging.getLogger(__name__)
+
+# Ancho máximo (px) de cada variante; el original se conserva tal cual.
+VARIANTES = {
+    "thumb": 320,
+    "medium": 1080,
+}
+WEBP_QUALITY = 80
+# Tope de píxeles declarados en la cabecera: un PNG de pocos KB puede anunciar 20000x20000.
+# Deja pasar las fotos de 48-50 MP de los móviles; decodificado entero, son ~190 MB en RGB.
+MAX_PIXELES = 64_000_000
+ORIENTACION_EXIF = 0x0112
+
+
+def ruta_variante(path_relativo: str, variante: str) -> str:
+    """"uploads/ab12.jpg" -> "uploads/ab12.thumb.webp"."""
+    base, _ = os.path.splitext(path_relativo)
+    return f"{base}.{variante}.webp"
+
+
+def base_foto(path_relativo: str) -> str:
+    """Key sin extensión común al original y a sus variantes: "uploads/ab12.thumb.webp" -> "uploads/ab12"."""
+    for variante in VARIANTES:
+        if path_relativo.endswith(f".{variante}.webp"):
+            return path_relativo[: -len(f".{variante}.webp")]
+    base, _ = os.path.splitext(path_relativo)
+    return base
+
+
+class ImagenRechazada(Exception):
+    """La imagen declara más píxeles de los que se aceptan (posible bomba de descompresión)."""
+
+
+@functools.cache
+def _pillow():
+    """Importa Pillow la primera vez que hace falta y fija su tope de píxeles una sola vez."""
+    from PIL import Image, ImageOps
+
+    # Entre una y dos veces el tope Pillow solo avisa; por encima, open() ya lo rechaza.
+    Image.MAX_IMAGE_PIXELS = MAX_PIXELES
+    return Image, ImageOps
+
+
+def caja_variante_mayor(ancho: int, alto: int, girada: bool) -> tuple[int, int]:
+    """Tamaño (en la orientación guardada) que tendrá la variante mayor de una imagen ancho x alto.
+
+    Las variantes se ajustan a (w, 4w) una vez girada la imagen según su EXIF; pedirle a draft()
+    y reduce() esta caja y no una genérica es lo que les permite decodificar a menor escala.
+    """
+    ancho_mayor = max(VARIANTES.values())
+    visible_ancho, visible_alto = (alto, ancho) if girada else (ancho, alto)
+    escala = min(1.0, ancho_mayor / visible_ancho, ancho_mayor * 4 / visible_alto)
+    return max(1, math.ceil(ancho * escala)), max(1, math.ceil(alto * escala))
+
+
+def generar_variantes(path_relativo: str, origen: str) -> list[str]:
+    """Decodifica el original (`origen`, fichero local) una sola vez y sube cada variante en
+    WebP junto a él en el storage.
+
+    Se decodifica ya reducido (draft() en JPEG, reduce() en el resto) hasta la escala más
+    pequeña que aún cubre la variante mayor, y cada variante sale de la anterior. Lanza
+    ImagenRechazada si la cabecera declara más de MAX_PIXELES, antes de decodificar nada; sin
+    Pillow, o si la imagen no se puede leer, no se genera nada y las plantillas siguen usando
+    el original.
+    """
+    try:
+        Image, ImageOps = _pillow()
+    except ImportError:
+        logger.warning("Pillow no está instalado; no se generan miniaturas.")
+        return []
+
+    generadas = []
+    try:
+        with Image.open(origen) as original:
+            ancho, alto = original.size
+            if ancho * alto > MAX_PIXELES:
+                raise ImagenRechazada(f"{ancho}x{alto}")
+            girada = original.getexif().get(ORIENTACION_EXIF) in (5, 6, 7, 8)
+            caja = caja_variante_mayor(ancho, alto, girada)
+            # En JPEG, draft() decodifica directamente a 1/2, 1/4 u 1/8 de la resolución.
+            original.draft("RGB", caja)
+            ancho, alto = original.size
+            imagen = original
+            if imagen.mode not in ("RGB", "RGBA"):
+                tiene_alfa = imagen.mode in ("LA", "PA") or "transparency" in imagen.info
+                imagen = imagen.convert("RGBA" if tiene_alfa else "RGB")
+            # reduce() por el mayor factor entero que aún deja la imagen por encima de la caja.
+            factor = int(min(ancho / caja[0], alto / caja[1]))
+            imagen = imagen.reduce(factor) if factor >= 2 else imagen.copy()
+            imagen.info = dict(original.info)
+        imagen = ImageOps.exif_transpose(imagen)
+    except Image.DecompressionBombError as exc:
+        raise ImagenRechazada(str(exc)) from exc
+    except (OSError, ValueError) as exc:
+        logger.warning("No se pudo leer %s para generar miniaturas: %s", path_relativo, exc)
+        return []
+
+    storage = get_storage()
+    # De mayor a menor y sobre la misma imagen: la miniatura sale de la variante medium.
+    for variante, ancho in sorted(VARIANTES.items(), key=lambda item: item[1], reverse=True):
+        imagen.thumbnail((ancho, ancho * 4))
+        destino = ruta_variante(path_relativo, variante)
+        fd, tmp_path = tempfile.mkstemp(dir=storage.directorio_temporal(), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fichero:
+                imagen.save(fichero, "WEBP", quality=WEBP_QUALITY, method=4)
+            storage.guardar(destino, tmp_path, "image/webp")
+        except (OSError, StorageError) as exc:
+            logger.warning("No se pudo guardar %s: %s", destino, exc)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            continue
+        generadas.append(destino)
+    return generadas
+
+
+def borrar_variantes(path_relativo: str) -> None:
+    storage = get_storage()
+    for variante in VARIANTES:
+        storage.borrar(ruta_variante(path_relativo, variante))
+
+
+def variantes_guardadas(path_relativo: str | None) -> str | None:
+    """Variantes de la foto que hay en el storage ("thumb,medium"), para guardarlas con la referencia.
+
+    Se consulta una vez al subir (o al regenerar con scripts/generar_miniaturas.py); al pintar,
+    foto_url() y foto_srcset() leen lo guardado y no preguntan al storage (un HEAD por foto en S3).
+    """
+    if not path_relativo:
+        return None
+    storage = get_storage()
+    return ",".join(v for v in VARIANTES if storage.existe(ruta_variante(path_relativo, v)))
+
+
+def _tiene_variante(variantes: str | None, variante: str) -> bool:
+    return variante in (variantes or "").split(",")
+
+
+def foto_url(path_relativo: str | None, variante: str = "thumb", variantes: str | None = None) -> str:
+    """URL de la variante si consta en `variantes`; si no (o está sin registrar), la del original."""
+    if not path_relativo:
+        return ""
+    ruta = ruta_variante(path_relativo, variante) if _tiene_variante(variantes, variante) else path_relativo
+    return get_storage().url(ruta)
+
+
+def foto_srcset(path_relativo: str | None, variantes: str | None = None) -> str:
+    if not path_relativo:
+        return ""
+    storage = get_storage()
+    return ", ".join(
+        f"{storage.url(ruta_variante(path_relativo, variante))} {ancho}w"
+        for variante, ancho in VARIANTES.items()
+        if _tiene_variante(variantes, variante)
+    )
+
+
+def url_cover(cover_url: str | None) -> str:
+    """Las cápsulas guardan la key de su foto subida ("uploads/ab12.medium.webp"), o la URL
+    "/static/uploads/..." en filas antiguas, o una URL externa (portada de Spotify)."""
+    if not cover_url:
+        return ""
+    if cover_url.startswith("/static/uploads/"):
+        cover_url = cover_url[len("/static/"):]
+    if cover_url.startswith("uploads/"):
+        return get_storage().url(cover_url)
+    return cover_url
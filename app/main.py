@@ -1,35 +1,114 @@
 from __future__ import annotations
 
+import base64
+import hashlib
+import json
+import math
 import os
-import uuid
-from datetime import datetime, timezone
-
-import requests
-from flask import Blueprint, current_app, jsonify, make_response, redirect, render_template, request, url_for
+import queue
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+
+from flask import (
+    Blueprint,
+    Response,
+    current_app,
+    has_app_context,
+    jsonify,
+    make_response,
+    redirect,
+    render_template,
+    request,
+    stream_with_context,
+    url_for,
+)
 from flask_login import current_user, login_required
-from werkzeug.exceptions import HTTPException
-from werkzeug.utils import secure_filename
-
-from . import db
-from .capsules import can_create_capsule, open_capsule_or_403
-from .models import Capsule, Memory
+from sqlalchemy import and_, func, or_
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import contains_eager, load_only
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge
+
+from . import db, http_client
+from .capsules import (
+    FREE_SEALED_CAPSULES,
+    avisar_scheduler,
+    can_create_capsule,
+    capsula_abrible,
+    open_capsule_or_403,
+    programar_apertura,
+    reservar_capsula,
+)
+from .images import (
+    MAX_PIXELES,
+    ImagenRechazada,
+    base_foto,
+    borrar_variantes,
+    foto_srcset,
+    foto_url,
+    generar_variantes,
+    ruta_variante,
+    url_cover,
+    variantes_guardadas,
+)
+from .memories import (
+    biblioteca_cache,
+    etag_biblioteca,
+    etiqueta_anio,
+    library_stats,
+    marcar_biblioteca_modificada,
+    version_biblioteca,
+)
+from .models import Capsule, CapsuleUnlockJob, Memory, TrackPreview
+from .rate_limit import TokenBucketLimiter
+from .scheduler import get_unlock_scheduler
+from .search_cache import get_search_cache, normalizar_consulta
+from .storage import StorageError, get_storage
 
 
 main_bp = Blueprint("main", __name__)
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-UPLOAD_DIR = os.path.join(BASE_DIR, "static", "uploads")
-ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "webp", "gif"}
+main_bp.add_app_template_global(foto_url)
+main_bp.add_app_template_global(foto_srcset)
+main_bp.add_app_template_global(url_cover)
 MAX_IMAGE_BYTES = 6 * 1024 * 1024
-
-
-def anio_desde_fecha(fecha_str: str) -> str:
-    fecha_str = (fecha_str or "").strip()
-    if not fecha_str:
-        return "Sin año"
-    try:
-        return datetime.strptime(fecha_str, "%d/%m/%Y %H:%M").strftime("%Y")
-    except ValueError:
-        return fecha_str[6:10] if len(fecha_str) >= 10 else "Sin año"
+UPLOAD_CHUNK_BYTES = 64 * 1024
+FORMATO_NO_PERMITIDO = "Formato de imagen no permitido. Usa png/jpg/jpeg/webp/gif."
+RESOLUCION_EXCESIVA = f"La imagen tiene demasiada resolución (máx {MAX_PIXELES // 1_000_000} megapíxeles)."
+UPLOAD_INMUTABLE_RE = re.compile(r"^/static/uploads/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.")
+BIBLIOTECA_PAGE_SIZE = 24
+BIBLIOTECA_MAX_PAGE_SIZE = 100
+CAPSULAS_PAGE_SIZE = 24
+CAPSULAS_MAX_PAGE_SIZE = 100
+ESTADOS_CAPSULA = ("cerradas", "abiertas")
+
+SPOTIFY_TOKEN_URL = "https://accounts.spotify.com/api/token"
+# Renovamos el token un poco antes de que caduque para no usarlo ya vencido.
+SPOTIFY_TOKEN_MARGIN_SECONDS = 60
+# Tras una renovación fallida, cuánto esperamos antes de volver a pedir token (mientras, iTunes).
+SPOTIFY_TOKEN_RETRY_SECONDS = 30
+_spotify_token_lock = threading.Lock()
+_spotify_token_cache = {"access_token": None, "expires_at": 0.0, "reintentar_en": 0.0}
+
+# Las previews de iTunes se piden en paralelo con un plazo global para todo el lote;
+# las que no lleguen a tiempo se devuelven con preview_url=None.
+PREVIEW_LOOKUP_DEADLINE_SECONDS = 3.0
+_preview_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="eco-preview")
+# Las previews encontradas se guardan en la tabla track_preview; los "no encontrado" caducan antes.
+PREVIEW_CACHE_MAX_AGE = timedelta(days=7)
+PREVIEW_CACHE_NEGATIVE_MAX_AGE = timedelta(days=1)
+# Claves con un refresco de preview caducada ya encolado: cada una se refresca una sola vez a la vez.
+_refrescos_en_vuelo: set[str] = set()
+_refrescos_en_vuelo_lock = threading.Lock()
+
+# Búsquedas idénticas simultáneas comparten una sola llamada a Spotify/iTunes.
+SEARCH_COALESCE_WAIT_SECONDS = 15.0
+_busquedas_en_vuelo: dict[str, Future] = {}
+_busquedas_en_vuelo_lock = threading.Lock()
 
 
 def premium_enabled() -> bool:
@@ -37,54 +116,187 @@ def premium_enabled() -> bool:
 
 
 def is_admin_user(user) -> bool:
-    configured = (os.getenv("ECO_ADMIN_EMAILS") or "").strip()
-    if configured:
-        allowed = {e.strip().lower() for e in configured.split(",") if e.strip()}
-        return (user.email or "").strip().lower() in allowed
-    return (user.email or "").strip().lower() == "celiafm17@gmail.com"
+    return (user.email or "").strip().lower() in current_app.config["ADMIN_EMAILS"]
+
+
+def _pedir_spotify_token(client_id: str, client_secret: str) -> tuple[str, float] | None:
+    try:
+        auth_response = http_client.post(
+            SPOTIFY_TOKEN_URL,
+            data={"grant_type": "client_credentials"},
+            auth=(client_id, client_secret),
+            timeout=8,
+        )
+        auth_data = auth_response.json()
+    except Exception:
+        return None
+
+    access_token = auth_data.get("access_token")
+    if not access_token:
+        return None
+    try:
+        expires_in = float(auth_data.get("expires_in") or 3600)
+    except (TypeError, ValueError):
+        expires_in = 3600.0
+    return access_token, time.monotonic() + expires_in
 
 
 def get_spotify_token() -> str | None:
+    """Token de client-credentials del proceso, renovado por un solo hilo a la vez.
+
+    Mientras un hilo lo renueva, los demás siguen con el token anterior si aún no ha caducado
+    (está dentro del margen) y solo esperan al lock si no les queda ninguno válido. Si la
+    renovación falla, nadie la repite hasta pasados SPOTIFY_TOKEN_RETRY_SECONDS.
+    """
     client_id = os.getenv("SPOTIFY_CLIENT_ID")
     client_secret = os.getenv("SPOTIFY_CLIENT_SECRET")
     if not client_id or not client_secret:
         return None
 
-    auth_response = requests.post(
-        "https://accounts.spotify.com/api/token",
-        data={"grant_type": "client_credentials"},
-        auth=(client_id, client_secret),
-        timeout=8,
-    )
-    auth_data = auth_response.json()
-    return auth_data.get("access_token")
-
-
-def buscar_preview_itunes(titulo: str, artista: str) -> str | None:
+    # Camino rápido: token vigente en caché, sin bloquear.
+    token = _spotify_token_cache["access_token"]
+    expires_at = _spotify_token_cache["expires_at"]
+    now = time.monotonic()
+    if token and now < expires_at - SPOTIFY_TOKEN_MARGIN_SECONDS:
+        return token
+
+    aun_valido = bool(token) and now < expires_at
+    if not _spotify_token_lock.acquire(blocking=not aun_valido):
+        # Otro hilo ya lo está renovando y el actual todavía sirve.
+        return token
+    try:
+        # Otro hilo puede haberlo renovado mientras esperábamos el lock.
+        token = _spotify_token_cache["access_token"]
+        expires_at = _spotify_token_cache["expires_at"]
+        now = time.monotonic()
+        if token and now < expires_at - SPOTIFY_TOKEN_MARGIN_SECONDS:
+            return token
+        anterior = token if token and now < expires_at else None
+        if now < _spotify_token_cache["reintentar_en"]:
+            return anterior
+
+        nuevo = _pedir_spotify_token(client_id, client_secret)
+        if nuevo is None:
+            # Si la renovación falla pero el token anterior aún no ha caducado, seguimos usándolo.
+            _spotify_token_cache["reintentar_en"] = now + SPOTIFY_TOKEN_RETRY_SECONDS
+            return anterior
+
+        _spotify_token_cache["access_token"], _spotify_token_cache["expires_at"] = nuevo
+        _spotify_token_cache["reintentar_en"] = 0.0
+        return nuevo[0]
+    finally:
+        _spotify_token_lock.release()
+
+
+def invalidar_spotify_token(token: str | None = None) -> None:
+    """Descarta `token` si sigue siendo el de la caché; sin argumento, vacía la caché entera.
+
+    Con `token`, un 401 que llega tarde no tira el token que otro hilo acaba de renovar.
+    """
+    with _spotify_token_lock:
+        if token is not None and _spotify_token_cache["access_token"] != token:
+            return
+        _spotify_token_cache["access_token"] = None
+        _spotify_token_cache["expires_at"] = 0.0
+        if token is None:
+            _spotify_token_cache["reintentar_en"] = 0.0
+
+
+def consultar_preview_itunes(titulo: str, artista: str) -> str | None:
+    """Pregunta a iTunes; devuelve None si no hay preview y propaga los errores de red."""
     if not titulo:
         return None
 
     term = " ".join(filter(None, [titulo, artista]))
+    response = http_client.get(
+        "https://itunes.apple.com/search",
+        params={"term": term, "entity": "song", "limit": 1},
+        timeout=5,
+    )
+    data = response.json()
+    items = data.get("results", [])
+    if not items:
+        return None
+    return items[0].get("previewUrl")
+
+
+def buscar_preview_itunes(titulo: str, artista: str) -> str | None:
     try:
-        response = requests.get(
-            "https://itunes.apple.com/search",
-            params={"term": term, "entity": "song", "limit": 1},
-            timeout=5,
-        )
-        data = response.json()
-        items = data.get("results", [])
-        if not items:
-            return None
-        return items[0].get("previewUrl")
+        return consultar_preview_itunes(titulo, artista)
     except Exception:
         return None
 
 
+def clave_preview(titulo: str, artista: str) -> str:
+    return f"{normalizar_consulta(titulo)}|{normalizar_consulta(artista)}"[:512]
+
+
+def preview_caducada(fila: TrackPreview, now: datetime) -> bool:
+    max_age = PREVIEW_CACHE_NEGATIVE_MAX_AGE if fila.not_found else PREVIEW_CACHE_MAX_AGE
+    return now - fila.fetched_at >= max_age
+
+
+def guardar_preview(clave: str, titulo: str, artista: str, preview_url: str | None) -> None:
+    fila = TrackPreview.query.filter_by(lookup_key=clave).first()
+    if fila is None:
+        fila = TrackPreview(lookup_key=clave, titulo=(titulo or "")[:255], artista=(artista or "")[:255] or None)
+        db.session.add(fila)
+    fila.preview_url = preview_url
+    fila.not_found = preview_url is None
+    fila.fetched_at = datetime.utcnow()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Otro hilo/worker la insertó a la vez; nos vale su versión.
+        db.session.rollback()
+
+
+def resolver_preview(app, clave: str, titulo: str, artista: str) -> str | None:
+    # Un fallo de red no es un "no hay preview": no se guarda y se propaga, para que quien
+    # espera el lote lo cuente como pendiente y no cachee la búsqueda como completa.
+    preview_url = consultar_preview_itunes(titulo, artista)
+
+    if app is not None:
+        try:
+            with app.app_context():
+                guardar_preview(clave, titulo, artista, preview_url)
+        except Exception:
+            app.logger.exception("No se pudo guardar la preview de %s", clave)
+    return preview_url
+
+
+def refrescar_preview(app, clave: str, titulo: str, artista: str) -> bool:
+    """Encola el refresco en segundo plano de una preview caducada, salvo que ya haya uno en vuelo.
+
+    Devuelve si lo ha encolado.
+    """
+    with _refrescos_en_vuelo_lock:
+        if clave in _refrescos_en_vuelo:
+            return False
+        _refrescos_en_vuelo.add(clave)
+
+    def refrescar():
+        try:
+            return resolver_preview(app, clave, titulo, artista)
+        finally:
+            with _refrescos_en_vuelo_lock:
+                _refrescos_en_vuelo.discard(clave)
+
+    try:
+        _preview_executor.submit(refrescar)
+    except RuntimeError:
+        # Executor apagado (fin del proceso): no queda nadie que libere la clave.
+        with _refrescos_en_vuelo_lock:
+            _refrescos_en_vuelo.discard(clave)
+        return False
+    return True
+
+
 def buscar_canciones_itunes(query: str) -> list[dict]:
     if not query:
         return []
     try:
-        response = requests.get(
+        response = http_client.get(
             "https://itunes.apple.com/search",
             params={"term": query, "entity": "song", "limit": 5},
             timeout=8,
@@ -111,86 +323,269 @@ def buscar_canciones_itunes(query: str) -> list[dict]:
     return resultados
 
 
+def unirse_a_busqueda(clave: str) -> tuple[Future, bool]:
+    """Future de la búsqueda en vuelo para `clave` y si nos toca hacerla (líder) o esperarla."""
+    with _busquedas_en_vuelo_lock:
+        en_vuelo = _busquedas_en_vuelo.get(clave)
+        if en_vuelo is not None:
+            return en_vuelo, False
+        en_vuelo = _busquedas_en_vuelo[clave] = Future()
+        return en_vuelo, True
+
+
+def terminar_busqueda(clave: str, en_vuelo: Future, resultados=None, error: BaseException | None = None) -> None:
+    """Publica el resultado del líder a quien espera y deja libre la clave."""
+    with _busquedas_en_vuelo_lock:
+        _busquedas_en_vuelo.pop(clave, None)
+    if en_vuelo.done():
+        return
+    if error is not None:
+        en_vuelo.set_exception(error)
+    else:
+        en_vuelo.set_result(resultados)
+
+
+def esperar_busqueda(en_vuelo: Future) -> list[dict] | None:
+    """Resultados del líder (copiados), o None si falló o tarda demasiado."""
+    try:
+        return [dict(r) for r in en_vuelo.result(timeout=SEARCH_COALESCE_WAIT_SECONDS)]
+    except Exception:
+        return None
+
+
 def buscar_canciones(query: str) -> list[dict]:
-    token = get_spotify_token()
-    if not query:
+    clave = normalizar_consulta(query)
+    if not clave:
         return []
+
+    cache = get_search_cache()
+    resultados = cache.get(clave)
+    if resultados is not None:
+        return resultados
+
+    en_vuelo, es_lider = unirse_a_busqueda(clave)
+    if not es_lider:
+        resultados = esperar_busqueda(en_vuelo)
+        # La búsqueda compartida falló o tarda demasiado: lo intentamos por nuestra cuenta.
+        return resultados if resultados is not None else buscar_canciones_sin_cache(query)[0]
+
+    try:
+        resultados, completos = buscar_canciones_sin_cache(query)
+        cache.set(clave, resultados, completos)
+    except BaseException as exc:
+        terminar_busqueda(clave, en_vuelo, error=exc)
+        raise
+    terminar_busqueda(clave, en_vuelo, resultados)
+    return [dict(r) for r in resultados]
+
+
+def buscar_canciones_sin_cache(query: str) -> tuple[list[dict], bool]:
+    """Resultados y si todas sus previews quedaron resueltas (hay preview o consta que no la hay)."""
+    resultados, pendientes = buscar_tracks(query)
+    return resultados, completar_previews(resultados, pendientes)
+
+
+def buscar_tracks(query: str) -> tuple[list[dict], list[tuple[str, str]]]:
+    """Resultados sin preview más los pares (título, artista) cuya preview falta por buscar.
+
+    Si la búsqueda acaba en iTunes, las previews ya vienen incluidas y no queda nada pendiente.
+    """
+    if not query:
+        return [], []
+    token = get_spotify_token()
     if not token:
-        return buscar_canciones_itunes(query)
+        return buscar_canciones_itunes(query), []
 
     headers = {"Authorization": f"Bearer {token}"}
     params = {"q": query, "type": "track", "limit": 5}
     try:
-        response = requests.get("https://api.spotify.com/v1/search", headers=headers, params=params, timeout=8)
+        response = http_client.get("https://api.spotify.com/v1/search", headers=headers, params=params, timeout=8)
+        if response.status_code == 401:
+            # Token revocado o caducado antes de tiempo: lo descartamos para la siguiente búsqueda.
+            invalidar_spotify_token(token)
+            return buscar_canciones_itunes(query), []
         data = response.json()
     except Exception:
-        return buscar_canciones_itunes(query)
+        return buscar_canciones_itunes(query), []
     tracks = data.get("tracks", {}).get("items", [])
     if not tracks:
-        return buscar_canciones_itunes(query)
+        return buscar_canciones_itunes(query), []
 
     resultados = []
+    pendientes = []
     for t in tracks:
         imagenes = t.get("album", {}).get("images", [])
         portada = imagenes[0]["url"] if imagenes else None
         artistas = ", ".join(a.get("name", "") for a in t.get("artists", []))
         primer_artista = t.get("artists", [{}])[0].get("name", "")
-        preview_url = buscar_preview_itunes(t.get("name", ""), primer_artista)
         resultados.append(
             {
                 "titulo": t.get("name"),
                 "artista": artistas,
                 "portada": portada,
                 "spotify_url": t.get("external_urls", {}).get("spotify"),
-                "preview_url": preview_url,
+                "preview_url": None,
             }
         )
+        pendientes.append((t.get("name", ""), primer_artista))
 
-    return resultados
+    return resultados, pendientes
 
 
-def extension_permitida(filename: str) -> bool:
-    return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
+def completar_previews(
+    resultados: list[dict],
+    pendientes: list[tuple[str, str]],
+    deadline: float | None = None,
+) -> bool:
+    """Rellena las previews que lleguen a tiempo; False si alguna quedó sin resolver."""
+    resueltas = 0
+    for indice, preview_url in iterar_previews(pendientes, deadline):
+        resultados[indice]["preview_url"] = preview_url
+        resueltas += 1
+    return resueltas == len(pendientes)
 
 
-def guardar_foto_personal(file_storage):
-    if not file_storage or not file_storage.filename:
-        return None, None
+def iterar_previews(pendientes: list[tuple[str, str]], deadline: float | None = None):
+    """Genera (índice, preview_url) según van llegando, hasta agotar el plazo del lote.
 
-    filename = secure_filename(file_storage.filename)
-    if not filename or not extension_permitida(filename):
-        return None, "Formato de imagen no permitido. Usa png/jpg/jpeg/webp/gif."
+    Las que no llegan a tiempo o fallan por red no se generan: siguen pendientes.
+    """
+    if not pendientes:
+        return
+    if deadline is None:
+        deadline = PREVIEW_LOOKUP_DEADLINE_SECONDS
+
+    app = current_app._get_current_object() if has_app_context() else None
+    claves = [clave_preview(titulo, artista) for titulo, artista in pendientes]
+    cacheadas = {}
+    if app is not None:
+        try:
+            filas = TrackPreview.query.filter(TrackPreview.lookup_key.in_(set(claves))).all()
+            cacheadas = {f.lookup_key: f for f in filas}
+        except SQLAlchemyError:
+            db.session.rollback()
 
+    now = datetime.utcnow()
+    futuros = {}
+    for indice, (clave, (titulo, artista)) in enumerate(zip(claves, pendientes)):
+        fila = cacheadas.get(clave)
+        if fila is None:
+            futuro = _preview_executor.submit(resolver_preview, app, clave, titulo, artista)
+            futuros[futuro] = indice
+            continue
+        if preview_caducada(fila, now):
+            # Servimos el valor guardado y lo refrescamos en segundo plano (una vez por clave).
+            refrescar_preview(app, clave, titulo, artista)
+        yield indice, fila.preview_url
+
+    if not futuros:
+        return
     try:
-        file_storage.stream.seek(0, os.SEEK_END)
-        size = file_storage.stream.tell()
-        file_storage.stream.seek(0)
-    except Exception:
-        size = 0
+        for futuro in as_completed(futuros, timeout=deadline):
+            try:
+                preview_url = futuro.result()
+            except Exception:
+                continue
+            yield futuros[futuro], preview_url
+    except FuturesTimeoutError:
+        return
 
-    if size and size > MAX_IMAGE_BYTES:
-        return None, "La imagen es demasiado grande (máx 6 MB)."
 
-    os.makedirs(UPLOAD_DIR, exist_ok=True)
-    ext = filename.rsplit(".", 1)[1].lower()
-    unique_name = f"{uuid.uuid4().hex}.{ext}"
-    save_path = os.path.join(UPLOAD_DIR, unique_name)
-    file_storage.save(save_path)
-    return f"uploads/{unique_name}", None
+def ruta_por_contenido(digest: str, ext: str) -> str:
+    """Key en el storage de un blob direccionado por contenido: uploads/ab/cd/<sha256>.<ext>."""
+    return f"uploads/{digest[:2]}/{digest[2:4]}/{digest}.{ext}"
 
 
-def borrar_foto_personal(path_relativo: str | None) -> None:
-    if not path_relativo:
-        return
-    normalizado = os.path.normpath(path_relativo).replace("\\", "/")
-    if not normalizado.startswith("uploads/"):
-        return
-    ruta_absoluta = os.path.join(BASE_DIR, "static", normalizado)
+def detectar_tipo_imagen(cabecera: bytes) -> str | None:
+    """Extensión según los magic bytes del fichero; None si no es una imagen admitida."""
+    if cabecera.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if cabecera.startswith(b"\xff\xd8\xff"):
+        return "jpg"
+    if cabecera[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if cabecera[:4] == b"RIFF" and cabecera[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+class ImagenDemasiadoGrande(Exception):
+    """La subida supera MAX_IMAGE_BYTES."""
+
+
+def guardar_foto_personal(file_storage):
+    """Copia la subida a un temporal por bloques: detecta el tipo por su contenido, corta en
+    cuanto supera MAX_IMAGE_BYTES, calcula el SHA-256 y la entrega al storage bajo su key
+    definitiva (rename atómico en disco, PUT en S3).
+
+    No es la primera lectura del cuerpo: al parsear el multipart, Werkzeug ya lo ha volcado a
+    memoria o a un temporal anónimo (con MAX_CONTENT_LENGTH como tope). Ese temporal no tiene
+    nombre, así que no se puede mover al storage; esta copia lee de él, no de la red."""
+    if not file_storage or not file_storage.filename:
+        return None, None
+
+    stream = file_storage.stream
+    primer_bloque = stream.read(UPLOAD_CHUNK_BYTES)
+    ext = detectar_tipo_imagen(primer_bloque)
+    if ext is None:
+        return None, FORMATO_NO_PERMITIDO
+
+    storage = get_storage()
+    hasher = hashlib.sha256()
+    total = 0
+    fd, tmp_path = tempfile.mkstemp(dir=storage.directorio_temporal(), suffix=".tmp")
     try:
-        if os.path.exists(ruta_absoluta):
-            os.remove(ruta_absoluta)
-    except OSError:
-        pass
+        with os.fdopen(fd, "wb") as destino:
+            bloque = primer_bloque
+            while bloque:
+                total += len(bloque)
+                if total > MAX_IMAGE_BYTES:
+                    raise ImagenDemasiadoGrande()
+                hasher.update(bloque)
+                destino.write(bloque)
+                bloque = stream.read(UPLOAD_CHUNK_BYTES)
+
+        path_relativo = ruta_por_contenido(hasher.hexdigest(), ext)
+        content_type = f"image/{'jpeg' if ext == 'jpg' else ext}"
+        # Misma foto ya subida (por este u otro recuerdo/cápsula): se reutiliza el blob. tocar()
+        # le renueva la fecha, así scripts/limpiar_uploads.py no lo borra mientras esta petición
+        # guarda la referencia aunque ahora mismo nadie más lo use.
+        if storage.tocar(path_relativo, content_type):
+            os.remove(tmp_path)
+            return path_relativo, None
+        # Las variantes salen del temporal local antes de entregarlo, sin volver a leerlo del storage.
+        generar_variantes(path_relativo, tmp_path)
+        storage.guardar(path_relativo, tmp_path, content_type)
+    except ImagenDemasiadoGrande:
+        os.remove(tmp_path)
+        return None, "La imagen es demasiado grande (máx 6 MB)."
+    except ImagenRechazada:
+        os.remove(tmp_path)
+        return None, RESOLUCION_EXCESIVA
+    except StorageError:
+        current_app.logger.exception("No se pudo guardar la foto en el storage")
+        borrar_variantes(path_relativo)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None, "No se pudo guardar la imagen. Inténtalo de nuevo."
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return path_relativo, None
+
+
+def foto_referenciada(path_relativo: str) -> bool:
+    """¿Algún recuerdo o cápsula sigue apuntando a este blob (o a sus variantes)?
+
+    Las fotos no se borran al soltarlas: con blobs compartidos entre recuerdos y cápsulas, otra
+    subida puede estar reutilizando el mismo en ese momento. Solo scripts/limpiar_uploads.py borra,
+    y únicamente lo que no se ha tocado en su periodo de gracia.
+    """
+    if Memory.query.filter(Memory.foto_personal == path_relativo).first() is not None:
+        return True
+    return Capsule.query.filter(Capsule.foto_key == base_foto(path_relativo)).first() is not None
 
 
 def memory_to_dict(memory: Memory) -> dict:
@@ -209,21 +604,22 @@ def memory_to_dict(memory: Memory) -> dict:
     }
 
 
-def capsule_to_dict(capsule: Capsule) -> dict:
-    now = datetime.utcnow()
-    return {
+def capsule_to_dict(capsule: Capsule, incluir_mensaje: bool = True) -> dict:
+    data = {
         "id": capsule.id,
         "spotify_id": capsule.spotify_id,
         "title": capsule.title,
         "artist": capsule.artist,
-        "cover_url": capsule.cover_url,
-        "message": capsule.message,
+        "cover_url": url_cover(capsule.cover_url),
         "open_date": capsule.open_date.isoformat() + "Z",
         "opened_at": capsule.opened_at.isoformat() + "Z" if capsule.opened_at else None,
         "created_at": capsule.created_at.isoformat() + "Z",
         "is_opened": capsule.opened_at is not None,
-        "is_unlockable_now": now >= capsule.open_date,
+        "is_unlockable_now": capsula_abrible(capsule),
     }
+    if incluir_mensaje:
+        data["message"] = capsule.message
+    return data
 
 
 def parse_open_date(raw_value: str) -> datetime | None:
@@ -250,20 +646,181 @@ def cargar_recuerdos(user_id: int) -> list[Memory]:
     return Memory.query.filter_by(user_id=user_id).order_by(Memory.created_at.desc()).all()
 
 
+def codificar_cursor(fila: Memory | Capsule) -> str:
+    crudo = f"{fila.created_at.isoformat()}|{fila.id}"
+    return base64.urlsafe_b64encode(crudo.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decodificar_cursor(cursor: str | None) -> tuple[datetime, str] | None:
+    if not cursor:
+        return None
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        crudo = base64.urlsafe_b64decode(cursor + relleno).decode("utf-8")
+        created_at_raw, memory_id = crudo.split("|", 1)
+        return datetime.fromisoformat(created_at_raw), memory_id
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def cargar_pagina_recuerdos(user_id: int, cursor: str | None = None, limit: int | None = None):
+    """Página keyset ordenada por (created_at, id) descendente; devuelve (recuerdos, siguiente_cursor)."""
+    if limit is None:
+        limit = BIBLIOTECA_PAGE_SIZE
+    query = Memory.query.filter(Memory.user_id == user_id)
+    posicion = decodificar_cursor(cursor)
+    if posicion is not None:
+        created_at, memory_id = posicion
+        query = query.filter(
+            or_(
+                Memory.created_at < created_at,
+                and_(Memory.created_at == created_at, Memory.id < memory_id),
+            )
+        )
+    filas = query.order_by(Memory.created_at.desc(), Memory.id.desc()).limit(limit + 1).all()
+    siguiente = codificar_cursor(filas[limit - 1]) if len(filas) > limit else None
+    return filas[:limit], siguiente
+
+
+def decodificar_cursor_capsulas(cursor: str | None) -> tuple[datetime, int] | None:
+    posicion = decodificar_cursor(cursor)
+    if posicion is None or not posicion[1].isdigit():
+        return None
+    return posicion[0], int(posicion[1])
+
+
+def cargar_pagina_capsulas(user_id: int, estado: str, cursor: str | None = None, limit: int | None = None):
+    """Página keyset de cápsulas abiertas o cerradas, por (created_at, id) descendente.
+
+    El reparto lo hace el WHERE, y de las cerradas ni se lee el mensaje: el panel no lo pinta.
+    """
+    if limit is None:
+        limit = CAPSULAS_PAGE_SIZE
+    columnas = [
+        Capsule.id,
+        Capsule.spotify_id,
+        Capsule.title,
+        Capsule.artist,
+        Capsule.cover_url,
+        Capsule.open_date,
+        Capsule.opened_at,
+        Capsule.created_at,
+    ]
+    # El aviso de apertura viene en la misma consulta: su done_at dice si ya es abrible.
+    query = (
+        Capsule.query.outerjoin(Capsule.unlock_job)
+        .options(contains_eager(Capsule.unlock_job).load_only(CapsuleUnlockJob.done_at))
+        .filter(Capsule.user_id == user_id)
+    )
+    if estado == "abiertas":
+        query = query.filter(Capsule.opened_at.is_not(None)).options(load_only(*columnas, Capsule.message))
+    else:
+        query = query.filter(Capsule.opened_at.is_(None)).options(load_only(*columnas))
+    posicion = decodificar_cursor_capsulas(cursor)
+    if posicion is not None:
+        created_at, capsule_id = posicion
+        query = query.filter(
+            or_(
+                Capsule.created_at < created_at,
+                and_(Capsule.created_at == created_at, Capsule.id < capsule_id),
+            )
+        )
+    filas = query.order_by(Capsule.created_at.desc(), Capsule.id.desc()).limit(limit + 1).all()
+    siguiente = codificar_cursor(filas[limit - 1]) if len(filas) > limit else None
+    capsulas = [capsule_to_dict(c, incluir_mensaje=estado == "abiertas") for c in filas[:limit]]
+    return capsulas, siguiente
+
+
+def respuesta_no_modificada(etag: str):
+    """304 si el cliente ya tiene esta versión; se comprueba antes de consultar nada de la biblioteca."""
+    if request.if_none_match.contains(etag):
+        response = make_response("", 304)
+        return preparar_cache_privada(response, etag)
+    return None
+
+
+def preparar_cache_privada(response, etag: str):
+    # Páginas por usuario: nunca en cachés compartidas, y siempre revalidadas con el ETag.
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.vary.add("Cookie")
+    return response
+
+
+def recuerdo_para_estanteria(memory: Memory) -> dict:
+    data = memory_to_dict(memory)
+    if memory.foto_personal:
+        data["cover"] = foto_url(memory.foto_personal, "thumb", memory.foto_variantes)
+        data["cover_detalle"] = foto_url(memory.foto_personal, "medium", memory.foto_variantes)
+        data["cover_srcset"] = foto_srcset(memory.foto_personal, memory.foto_variantes)
+    else:
+        data["cover"] = data["cover_detalle"] = memory.portada or ""
+        data["cover_srcset"] = ""
+    data["year"] = etiqueta_anio(memory.year)
+    return data
+
+
 def obtener_capsula_usuario(capsule_id: int) -> Capsule | None:
     return Capsule.query.filter_by(id=capsule_id, user_id=current_user.id).first()
 
 
+def limitador_busquedas() -> TokenBucketLimiter:
+    limiter = current_app.extensions.get("eco_search_limiter")
+    if limiter is None:
+        limiter = current_app.extensions.setdefault(
+            "eco_search_limiter",
+            TokenBucketLimiter(
+                capacity=current_app.config["SEARCH_RATE_LIMIT_BURST"],
+                refill_per_second=current_app.config["SEARCH_RATE_LIMIT_PER_SECOND"],
+            ),
+        )
+    return limiter
+
+
+def limitar_busquedas(view):
+    """Rechaza con 429 las búsquedas que exceden el cubo del usuario en vez de encolarlas."""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        permitido, retry_after = limitador_busquedas().consume(current_user.id)
+        if not permitido:
+            response = jsonify({"ok": False, "error": "Demasiadas búsquedas seguidas.", "resultados": []})
+            response.status_code = 429
+            response.headers["Retry-After"] = str(max(1, math.ceil(min(retry_after, 3600))))
+            return response
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
 @main_bp.after_app_request
 def evitar_cache_html(response):
     content_type = (response.content_type or "").lower()
-    if content_type.startswith("text/html"):
+    # Las vistas que gestionan su propia caché privada (ETag) no se tocan.
+    if content_type.startswith("text/html") and "private" not in response.headers.get("Cache-Control", ""):
         response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
         response.headers["Pragma"] = "no-cache"
         response.headers["Expires"] = "0"
     return response
 
 
+@main_bp.app_errorhandler(RequestEntityTooLarge)
+def peticion_demasiado_grande(_error):
+    # MAX_CONTENT_LENGTH corta el cuerpo antes de que Werkzeug lo lea entero.
+    mensaje = "La imagen es demasiado grande (máx 6 MB)."
+    if request.endpoint == "main.recuerdos":
+        return redirect(url_for("main.recuerdos", crear=1, error=mensaje))
+    return jsonify({"ok": False, "error": mensaje}), 413
+
+
+@main_bp.after_app_request
+def cachear_uploads_inmutables(response):
+    # Los blobs direccionados por contenido nunca cambian: el navegador puede guardarlos para siempre.
+    if response.status_code in (200, 304) and UPLOAD_INMUTABLE_RE.match(request.path):
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+
 @main_bp.route("/")
 def index():
     response = make_response(render_template("index.html"))
@@ -312,17 +869,19 @@ def recuerdos():
             preview_url=(preview_url or "").strip() or None,
             nota=nota,
             foto_personal=foto_personal,
+            foto_variantes=variantes_guardadas(foto_personal),
             fecha=datetime.now().strftime("%d/%m/%Y %H:%M"),
             favorito=False,
         )
         db.session.add(recuerdo)
+        marcar_biblioteca_modificada(current_user)
         db.session.commit()
 
         return redirect(url_for("main.biblioteca"))
 
-    recuerdos_guardados = cargar_recuerdos(current_user.id)
     if not crear_mode:
         return redirect(url_for("main.biblioteca"), code=308)
+    recuerdos_guardados = cargar_recuerdos(current_user.id)
 
     return render_template(
         "recuerdos.html",
@@ -335,27 +894,63 @@ def recuerdos():
 @main_bp.route("/biblioteca")
 @login_required
 def biblioteca():
-    recuerdos_ordenados = cargar_recuerdos(current_user.id)
-    ultimos = recuerdos_ordenados[:24]
-    favoritos = [r for r in recuerdos_ordenados if r.favorito]
+    etag = etag_biblioteca(current_user, "html")
+    no_modificada = respuesta_no_modificada(etag)
+    if no_modificada is not None:
+        return no_modificada
+
+    cache = biblioteca_cache()
+    version = (version_biblioteca(current_user), get_storage().url_epoch())
+    html = cache.get(current_user.id, "html", version)
+    if html is None:
+        # Solo se pinta la primera balda; el resto llega paginado desde /biblioteca/recuerdos.
+        recuerdos_pagina, next_cursor = cargar_pagina_recuerdos(current_user.id)
+        html = render_template(
+            "biblioteca.html",
+            recuerdos=recuerdos_pagina,
+            next_cursor=next_cursor,
+            stats=library_stats(current_user),
+        )
+        cache.set(current_user.id, "html", version, html)
+    return preparar_cache_privada(make_response(html), etag)
 
-    por_ano = {}
-    for r in recuerdos_ordenados:
-        ano = anio_desde_fecha(r.fecha)
-        por_ano.setdefault(ano, []).append(r)
 
-    anos_numericos = sorted([a for a in por_ano.keys() if a.isdigit()], reverse=True)
-    anos_otros = sorted([a for a in por_ano.keys() if not a.isdigit()])
-    anos = anos_numericos + anos_otros
+@main_bp.route("/biblioteca/stats")
+@login_required
+def biblioteca_stats():
+    etag = etag_biblioteca(current_user, "stats")
+    no_modificada = respuesta_no_modificada(etag)
+    if no_modificada is not None:
+        return no_modificada
+    return preparar_cache_privada(jsonify({"ok": True, **library_stats(current_user)}), etag)
 
-    return render_template(
-        "biblioteca.html",
-        recuerdos=recuerdos_ordenados,
-        ultimos=ultimos,
-        favoritos=favoritos,
-        por_ano=por_ano,
-        anos=anos,
+
+@main_bp.route("/biblioteca/recuerdos")
+@login_required
+def biblioteca_recuerdos():
+    cursor = request.args.get("cursor")
+    if cursor and decodificar_cursor(cursor) is None:
+        return jsonify({"ok": False, "error": "cursor inválido"}), 400
+    try:
+        limit = int(request.args.get("limit", BIBLIOTECA_PAGE_SIZE))
+    except ValueError:
+        limit = BIBLIOTECA_PAGE_SIZE
+    limit = max(1, min(limit, BIBLIOTECA_MAX_PAGE_SIZE))
+
+    etag = etag_biblioteca(current_user, "page", hashlib.sha1(f"{cursor}|{limit}".encode()).hexdigest()[:16])
+    no_modificada = respuesta_no_modificada(etag)
+    if no_modificada is not None:
+        return no_modificada
+
+    recuerdos_pagina, next_cursor = cargar_pagina_recuerdos(current_user.id, cursor, limit)
+    response = jsonify(
+        {
+            "ok": True,
+            "recuerdos": [recuerdo_para_estanteria(r) for r in recuerdos_pagina],
+            "next_cursor": next_cursor,
+        }
     )
+    return preparar_cache_privada(response, etag)
 
 
 @main_bp.route("/biblioteca/favorito", methods=["POST"])
@@ -369,6 +964,7 @@ def toggle_favorito():
     recuerdo = obtener_recuerdo_usuario(recuerdo_id)
     if recuerdo:
         recuerdo.favorito = not bool(recuerdo.favorito)
+        marcar_biblioteca_modificada(current_user)
         db.session.commit()
         return jsonify({"ok": True, "id": recuerdo_id, "favorito": recuerdo.favorito})
 
@@ -378,10 +974,34 @@ def toggle_favorito():
 @main_bp.route("/capsulas", methods=["GET"])
 @login_required
 def listar_capsulas():
-    capsulas = Capsule.query.filter_by(user_id=current_user.id).order_by(Capsule.created_at.desc()).all()
-    abiertas = [capsule_to_dict(c) for c in capsulas if c.opened_at is not None]
-    cerradas = [capsule_to_dict(c) for c in capsulas if c.opened_at is None]
-    return jsonify({"ok": True, "abiertas": abiertas, "cerradas": cerradas, "total": len(capsulas)})
+    estado = request.args.get("estado")
+    cursor = request.args.get("cursor")
+    if estado is not None and estado not in ESTADOS_CAPSULA:
+        return jsonify({"ok": False, "error": "estado debe ser abiertas o cerradas"}), 400
+    if cursor and (estado is None or decodificar_cursor_capsulas(cursor) is None):
+        return jsonify({"ok": False, "error": "cursor inválido"}), 400
+    try:
+        limit = int(request.args.get("limit", CAPSULAS_PAGE_SIZE))
+    except ValueError:
+        limit = CAPSULAS_PAGE_SIZE
+    limit = max(1, min(limit, CAPSULAS_MAX_PAGE_SIZE))
+
+    if estado is not None:
+        capsulas, next_cursor = cargar_pagina_capsulas(current_user.id, estado, cursor, limit)
+        return jsonify({"ok": True, "estado": estado, "capsulas": capsulas, "next_cursor": next_cursor})
+
+    # Sin estado: la primera página de cada lista, que es lo que pinta el panel al cargar.
+    paginas = {e: cargar_pagina_capsulas(current_user.id, e, limit=limit) for e in ESTADOS_CAPSULA}
+    total = db.session.query(func.count(Capsule.id)).filter(Capsule.user_id == current_user.id).scalar()
+    return jsonify(
+        {
+            "ok": True,
+            "abiertas": paginas["abiertas"][0],
+            "cerradas": paginas["cerradas"][0],
+            "next_cursor": {e: paginas[e][1] for e in ESTADOS_CAPSULA},
+            "total": total,
+        }
+    )
 
 
 @main_bp.route("/capsulas/panel")
@@ -416,9 +1036,70 @@ def capsula_ritual(capsule_id: int):
     if capsule is None:
         return redirect(url_for("main.capsulas_panel"))
 
-    now = datetime.utcnow()
-    unlockable = (capsule.opened_at is not None) or (now >= capsule.open_date)
-    return render_template("capsula_ritual.html", capsule=capsule, unlockable=unlockable)
+    return render_template("capsula_ritual.html", capsule=capsule, unlockable=capsula_abrible(capsule))
+
+
+@main_bp.route("/capsulas/<int:capsule_id>/eventos")
+@login_required
+def capsula_eventos(capsule_id: int):
+    """SSE con el momento de apertura de la cápsula, para que el ritual no tenga que recargar.
+
+    La conexión solo se mantiene abierta los últimos CAPSULE_EVENTS_HOLD_SECONDS: antes se
+    responde "programada" con la hora del servidor y un `retry:` que hace que el navegador
+    vuelva justo a tiempo, para no ocupar un hilo del worker durante días.
+    """
+    capsule = obtener_capsula_usuario(capsule_id)
+    if capsule is None:
+        return jsonify({"ok": False, "error": "capsula no encontrada"}), 404
+    open_date = capsule.open_date
+    abierta = capsule.opened_at is not None
+    hold = current_app.config["CAPSULE_EVENTS_HOLD_SECONDS"]
+    restante = (open_date - datetime.utcnow()).total_seconds()
+    scheduler = get_unlock_scheduler() if not abierta and 0 < restante <= hold else None
+
+    def evento(nombre: str, retry_ms: int | None = None) -> str:
+        datos = json.dumps(
+            {
+                "capsule_id": capsule_id,
+                "open_date": open_date.isoformat() + "Z",
+                "ahora": datetime.utcnow().isoformat() + "Z",
+            }
+        )
+        retry = f"retry: {retry_ms}\n" if retry_ms is not None else ""
+        return f"{retry}event: {nombre}\ndata: {datos}\n\n"
+
+    def generar():
+        if scheduler is None:
+            if abierta or restante <= 0:
+                yield evento("abrible")
+            else:
+                # Reconexión cuando falte `hold` para la apertura, como mucho dentro de una hora.
+                yield evento("programada", retry_ms=int(min(restante - hold + 1, 3600) * 1000))
+            return
+
+        cola = scheduler.suscribir(capsule_id)
+        try:
+            scheduler.programar(capsule_id, open_date)
+            while True:
+                pendiente = (open_date - datetime.utcnow()).total_seconds()
+                try:
+                    # Si el aviso se perdiera (p. ej. disparó justo antes de suscribirse), basta la hora.
+                    cola.get(timeout=min(15.0, max(pendiente, 0.0) + 1.0))
+                    break
+                except queue.Empty:
+                    if pendiente <= 0:
+                        break
+                    yield ": ping\n\n"
+            yield evento("abrible")
+        finally:
+            scheduler.cancelar(capsule_id, cola)
+
+    # Sin stream_with_context: el contexto (y la conexión a la BD) se libera antes de esperar.
+    return Response(
+        generar(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"},
+    )
 
 
 @main_bp.route("/capsulas", methods=["POST"])
@@ -427,6 +1108,7 @@ def crear_capsula():
     if premium_enabled() and not can_create_capsule(current_user):
         return jsonify({"ok": False, "error": "Plan Free: solo una cápsula cerrada activa."}), 403
 
+    foto_key = None
     if request.is_json:
         payload = request.get_json(silent=True) or {}
         title = (payload.get("title") or "").strip()
@@ -453,7 +1135,10 @@ def crear_capsula():
         if foto_error:
             return jsonify({"ok": False, "error": foto_error}), 400
         if foto_capsula:
-            cover_url = url_for("static", filename=foto_capsula)
+            # Se guarda la key, no la URL: con S3 la URL prefirmada caduca.
+            medium = ruta_variante(foto_capsula, "medium")
+            cover_url = medium if "medium" in variantes_guardadas(foto_capsula).split(",") else foto_capsula
+            foto_key = base_foto(foto_capsula)
 
     if not title:
         return jsonify({"ok": False, "error": "title es obligatorio"}), 400
@@ -466,17 +1151,26 @@ def crear_capsula():
     if open_date <= datetime.utcnow():
         return jsonify({"ok": False, "error": "open_date debe ser futura"}), 400
 
+    # can_create_capsule() da el error rápido; la reserva es la que no deja pasar a dos a la vez.
+    limite = FREE_SEALED_CAPSULES if premium_enabled() and not current_user.is_premium else None
+    if not reservar_capsula(current_user, open_date, limite):
+        db.session.rollback()
+        return jsonify({"ok": False, "error": "Plan Free: solo una cápsula cerrada activa."}), 403
+
     capsule = Capsule(
         user_id=current_user.id,
         spotify_id=spotify_id,
         title=title,
         artist=artist,
         cover_url=cover_url,
+        foto_key=foto_key,
         message=message or None,
         open_date=open_date,
     )
     db.session.add(capsule)
+    programar_apertura(capsule)
     db.session.commit()
+    avisar_scheduler(capsule)
     return jsonify({"ok": True, "capsula": capsule_to_dict(capsule)}), 201
 
 
@@ -525,6 +1219,7 @@ def editar_recuerdo(recuerdo_id):
     if fecha:
         recuerdo.fecha = fecha
 
+    marcar_biblioteca_modificada(current_user)
     db.session.commit()
     return jsonify({"ok": True, "recuerdo": memory_to_dict(recuerdo)})
 
@@ -542,9 +1237,9 @@ def cambiar_foto_recuerdo(recuerdo_id):
     if not foto_personal:
         return jsonify({"ok": False, "error": "Debes seleccionar una imagen."}), 400
 
-    if recuerdo.foto_personal:
-        borrar_foto_personal(recuerdo.foto_personal)
     recuerdo.foto_personal = foto_personal
+    recuerdo.foto_variantes = variantes_guardadas(foto_personal)
+    marcar_biblioteca_modificada(current_user)
     db.session.commit()
 
     return jsonify(
@@ -552,7 +1247,8 @@ def cambiar_foto_recuerdo(recuerdo_id):
             "ok": True,
             "id": recuerdo_id,
             "foto_personal": recuerdo.foto_personal,
-            "foto_url": url_for("static", filename=recuerdo.foto_personal),
+            "foto_url": foto_url(recuerdo.foto_personal, "thumb", recuerdo.foto_variantes),
+            "foto_url_detalle": foto_url(recuerdo.foto_personal, "medium", recuerdo.foto_variantes),
         }
     )
 
@@ -564,14 +1260,15 @@ def borrar_recuerdo(recuerdo_id):
     if recuerdo is None:
         return jsonify({"ok": False, "error": "recuerdo no encontrado"}), 404
 
-    borrar_foto_personal(recuerdo.foto_personal)
     db.session.delete(recuerdo)
+    marcar_biblioteca_modificada(current_user)
     db.session.commit()
     return jsonify({"ok": True, "id": recuerdo_id})
 
 
 @main_bp.route("/buscar_spotify")
 @login_required
+@limitar_busquedas
 def buscar_spotify_api():
     query = request.args.get("q")
     if not query:
@@ -581,8 +1278,71 @@ def buscar_spotify_api():
     return {"resultados": resultados}
 
 
+@main_bp.route("/buscar_spotify/stream")
+@login_required
+@limitar_busquedas
+def buscar_spotify_stream():
+    """Variante NDJSON de /buscar_spotify: una línea por canción en cuanto se conoce y
+    otra por cada preview_url que llega después desde iTunes."""
+    query = request.args.get("q") or ""
+    clave = normalizar_consulta(query)
+
+    def linea(evento: dict) -> str:
+        return json.dumps(evento, ensure_ascii=False) + "\n"
+
+    def generar():
+        if not clave:
+            yield linea({"tipo": "fin", "total": 0})
+            return
+
+        cache = get_search_cache()
+        resultados = cache.get(clave)
+        if resultados is not None:
+            for indice, resultado in enumerate(resultados):
+                yield linea({"tipo": "track", "indice": indice, "track": resultado})
+            yield linea({"tipo": "fin", "total": len(resultados)})
+            return
+
+        # Misma búsqueda en vuelo que /buscar_spotify: una ráfaga de peticiones iguales hace una
+        # sola llamada a Spotify/iTunes y las demás reciben el resultado completo del líder.
+        en_vuelo, es_lider = unirse_a_busqueda(clave)
+        if not es_lider:
+            resultados = esperar_busqueda(en_vuelo)
+            if resultados is None:
+                resultados = buscar_canciones_sin_cache(query)[0]
+            for indice, resultado in enumerate(resultados):
+                yield linea({"tipo": "track", "indice": indice, "track": resultado})
+            yield linea({"tipo": "fin", "total": len(resultados)})
+            return
+
+        try:
+            resultados, pendientes = buscar_tracks(query)
+            for indice, resultado in enumerate(resultados):
+                yield linea({"tipo": "track", "indice": indice, "track": dict(resultado)})
+            resueltas = 0
+            for indice, preview_url in iterar_previews(pendientes):
+                resultados[indice]["preview_url"] = preview_url
+                resueltas += 1
+                if preview_url:
+                    yield linea({"tipo": "preview", "indice": indice, "preview_url": preview_url})
+            cache.set(clave, resultados, resueltas == len(pendientes))
+        except BaseException as exc:
+            # Incluye el GeneratorExit de un cliente que corta: los que esperan buscan por su cuenta.
+            terminar_busqueda(clave, en_vuelo, error=exc)
+            raise
+        terminar_busqueda(clave, en_vuelo, resultados)
+        yield linea({"tipo": "fin", "total": len(resultados)})
+
+    return Response(
+        stream_with_context(generar()),
+        mimetype="application/x-ndjson",
+        headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"},
+    )
+
+
 @main_bp.route("/test_spotify")
 @login_required
+@limitar_busquedas
 def test_spotify():
     resultado = buscar_canciones("Robe El hombre pajaro")
     return {"resultados": resultado}
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+from sqlalchemy import case, func
+
+from . import db
+from .models import Memory, User
+from .storage import get_storage
+
+
+SIN_ANO = "Sin año"
+BIBLIOTECA_CACHE_MAX_ENTRIES = 256
+
+
+class VersionedCache:
+    """LRU por (user_id, nombre) que solo devuelve lo guardado para la versión actual de la biblioteca.
+
+    La versión vive en `User.library_version`, así que es la misma para todos los workers y
+    sobrevive a reinicios: basta con subirla para que todo lo cacheado del usuario deje de valer.
+    Se lee de la identidad cacheada de la sesión (ver models.CAMPOS_IDENTIDAD), sin ir a la BD.
+    """
+
+    def __init__(self, max_entries: int = BIBLIOTECA_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data: OrderedDict[tuple[int, str], tuple[object, object]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int, name: str, version):
+        with self._lock:
+            entry = self._data.get((user_id, name))
+            if entry is None or entry[0] != version:
+                return None
+            self._data.move_to_end((user_id, name))
+            return entry[1]
+
+    def set(self, user_id: int, name: str, version, value) -> None:
+        with self._lock:
+            self._data[(user_id, name)] = (version, value)
+            self._data.move_to_end((user_id, name))
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+
+def biblioteca_cache() -> VersionedCache:
+    return current_app.extensions.setdefault("eco_biblioteca_cache", VersionedCache())
+
+
+def version_biblioteca(user) -> int:
+    return int(user.library_version or 0)
+
+
+def marcar_biblioteca_modificada(user) -> None:
+    """Sube la versión de la biblioteca en la misma transacción que la escritura que la cambia."""
+    user.library_version = User.library_version + 1
+
+
+def etag_biblioteca(user, *partes) -> str:
+    build_id = current_app.config.get("BUILD_ID", "")
+    # La época de URLs del storage cambia cuando caducarían las URLs prefirmadas de las fotos.
+    url_epoch = get_storage().url_epoch()
+    return "-".join(str(p) for p in ("bib", user.id, version_biblioteca(user), url_epoch, build_id, *partes))
+
+
+def etiqueta_anio(year: int | None) -> str:
+    return str(year) if year is not None else SIN_ANO
+
+
+def calcular_stats(user_id: int) -> dict:
+    """Totales por año, favoritos y total en una sola consulta con GROUP BY."""
+    filas = (
+        db.session.query(
+            Memory.year,
+            func.count(Memory.id),
+            func.sum(case((Memory.favorito.is_(True), 1), else_=0)),
+        )
+        .filter(Memory.user_id == user_id)
+        .group_by(Memory.year)
+        .order_by(Memory.year.is_(None), Memory.year.desc())
+        .all()
+    )
+    por_ano = [
+        {"year": etiqueta_anio(year), "total": int(total), "favoritos": int(favoritos or 0)}
+        for year, total, favoritos in filas
+    ]
+    return {
+        "total": sum(a["total"] for a in por_ano),
+        "favoritos": sum(a["favoritos"] for a in por_ano),
+        "por_ano": por_ano,
+    }
+
+
+def library_stats(user) -> dict:
+    cache = biblioteca_cache()
+    version = version_biblioteca(user)
+    stats = cache.get(user.id, "stats", version)
+    if stats is None:
+        stats = calcular_stats(user.id)
+        cache.set(user.id, "stats", version, stats)
+    return stats
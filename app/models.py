@@ -1,8 +1,31 @@
 from datetime import datetime
 import uuid
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session, make_transient_to_detached, object_session, validates
 from flask_login import UserMixin
 from . import db, login_manager
+from .passwords import generar_hash, necesita_rehash, verificar_password
+from .search_cache import MemoryBackend
+
+
+USER_CACHE_MAX_ENTRIES = 1024
+# Lo que se cachea de la identidad. library_version va incluida para que un 304 de la biblioteca
+# no cueste un SELECT: el worker que la sube invalida su entrada al hacer commit y en los demás
+# (o tras una escritura desde scripts/) puede ir atrasada como mucho USER_CACHE_TTL_SECONDS.
+CAMPOS_IDENTIDAD = ("email", "password_hash", "is_premium", "created_at", "library_version")
+
+
+def anio_desde_fecha(fecha_str: str | None) -> int | None:
+    """Año de una fecha "dd/mm/YYYY HH:MM"; None si no se puede sacar un año numérico."""
+    fecha_str = (fecha_str or "").strip()
+    if not fecha_str:
+        return None
+    try:
+        return datetime.strptime(fecha_str, "%d/%m/%Y %H:%M").year
+    except ValueError:
+        candidato = fecha_str[6:10] if len(fecha_str) >= 10 else ""
+        return int(candidato) if candidato.isdigit() else None
 
 
 class User(UserMixin, db.Model):
@@ -10,21 +33,74 @@ class User(UserMixin, db.Model):
     email = db.Column(db.String(255), unique=True, nullable=False, index=True)
     password_hash = db.Column(db.String(255), nullable=False)
     is_premium = db.Column(db.Boolean, default=False, nullable=False)
+    # Se incrementa con cada cambio en sus recuerdos; alimenta ETags y cachés de la biblioteca.
+    library_version = db.Column(db.Integer, default=0, server_default="0", nullable=False)
+    # Cápsulas cerradas cuya fecha aún no ha llegado y cuándo vence la más próxima: hasta entonces
+    # el contador es exacto (ver capsules.selladas_activas). Tampoco pasan por la caché de identidad.
+    sealed_capsules = db.Column(db.Integer, default=0, server_default="0", nullable=False)
+    sealed_capsules_until = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
     capsules = db.relationship("Capsule", backref="user", lazy=True)
     memories = db.relationship("Memory", backref="user", lazy=True, cascade="all, delete-orphan")
 
     def set_password(self, password: str):
-        self.password_hash = generate_password_hash(password, method="pbkdf2:sha256")
+        self.password_hash = generar_hash(password)
 
     def check_password(self, password: str) -> bool:
-        return check_password_hash(self.password_hash, password)
+        return verificar_password(self.password_hash, password)
+
+    def password_needs_rehash(self) -> bool:
+        return necesita_rehash(self.password_hash)
+
+
+def cache_usuarios() -> MemoryBackend:
+    return current_app.extensions.setdefault("eco_user_cache", MemoryBackend(max_entries=USER_CACHE_MAX_ENTRIES))
 
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+    ttl = float(current_app.config.get("USER_CACHE_TTL_SECONDS", 0))
+    if ttl <= 0:
+        return db.session.get(User, user_id)
+
+    datos = cache_usuarios().get(str(user_id))
+    if datos is not None:
+        # Instancia "detached" con lo cacheado; merge(load=False) la adjunta a la sesión sin SELECT.
+        user = User(id=user_id, **datos)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+    user = db.session.get(User, user_id)
+    if user is not None:
+        cache_usuarios().set(str(user_id), {campo: getattr(user, campo) for campo in CAMPOS_IDENTIDAD}, ttl)
+    return user
+
+
+@event.listens_for(User.is_premium, "set")
+@event.listens_for(User.password_hash, "set")
+@event.listens_for(User.library_version, "set")
+def _identidad_modificada(target, value, oldvalue, initiator):
+    session = object_session(target)
+    if session is not None and target.id is not None:
+        session.info.setdefault("eco_usuarios_modificados", set()).add(target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidar_identidades(session):
+    modificados = session.info.pop("eco_usuarios_modificados", None)
+    if modificados and has_app_context() and "eco_user_cache" in current_app.extensions:
+        for user_id in modificados:
+            cache_usuarios().delete(str(user_id))
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_identidades(session):
+    session.info.pop("eco_usuarios_modificados", None)
 
 
 class Capsule(db.Model):
@@ -35,6 +111,9 @@ class Capsule(db.Model):
     title = db.Column(db.String(255), nullable=False)
     artist = db.Column(db.String(255), nullable=True)
     cover_url = db.Column(db.String(500), nullable=True)
+    # Foto subida como portada: su key sin extensión ("uploads/ab/cd/<sha256>"), compartida por el
+    # original y sus variantes; cover_url guarda la variante que se muestra.
+    foto_key = db.Column(db.String(255), nullable=True, index=True)
 
     message = db.Column(db.Text, nullable=True)
 
@@ -43,11 +122,39 @@ class Capsule(db.Model):
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
+    # Aviso de apertura; su done_at, puesto por el scheduler, es lo que leen las vistas.
+    unlock_job = db.relationship("CapsuleUnlockJob", uselist=False, lazy="select", passive_deletes=True)
+
+    __table_args__ = (
+        db.Index("ix_capsule_user_id_created_at", "user_id", "created_at"),
+        # En Postgres, parcial: el límite del plan Free solo mira las cerradas.
+        db.Index(
+            "ix_capsule_user_id_sealed",
+            "user_id",
+            "opened_at",
+            "open_date",
+            postgresql_where=db.text("opened_at IS NULL"),
+        ),
+    )
+
     @property
     def is_opened(self):
         return self.opened_at is not None
 
 
+class CapsuleUnlockJob(db.Model):
+    """Apertura pendiente de una cápsula; sobrevive a reinicios para que el scheduler la recoja."""
+
+    __tablename__ = "capsule_unlock_job"
+
+    capsule_id = db.Column(db.Integer, db.ForeignKey("capsule.id", ondelete="CASCADE"), primary_key=True)
+    run_at = db.Column(db.DateTime, nullable=False)
+    # Cuándo la marcó el scheduler como abrible; NULL mientras está pendiente.
+    done_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (db.Index("ix_capsule_unlock_job_pending", "done_at", "run_at"),)
+
+
 class Memory(db.Model):
     id = db.Column(db.String(32), primary_key=True, default=lambda: uuid.uuid4().hex)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, index=True)
@@ -59,8 +166,36 @@ class Memory(db.Model):
     portada = db.Column(db.String(500), nullable=True)
     preview_url = db.Column(db.String(500), nullable=True)
     nota = db.Column(db.Text, nullable=False)
-    foto_personal = db.Column(db.String(500), nullable=True)
+    # Indexada: la limpieza de uploads pregunta por cada blob si algún recuerdo lo usa.
+    foto_personal = db.Column(db.String(500), nullable=True, index=True)
+    # Variantes de la foto que hay en el storage ("thumb,medium"); NULL si nunca se registraron.
+    foto_variantes = db.Column(db.String(64), nullable=True)
     fecha = db.Column(db.String(20), nullable=False)
     favorito = db.Column(db.Boolean, default=False, nullable=False)
+    # Derivado de `fecha` al escribir, para agrupar y filtrar por año en la base de datos.
+    year = db.Column(db.Integer, nullable=True)
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_memory_user_id_created_at", "user_id", "created_at"),
+        db.Index("ix_memory_user_id_favorito", "user_id", "favorito"),
+        db.Index("ix_memory_user_id_year", "user_id", "year"),
+    )
+
+    @validates("fecha")
+    def _sincronizar_year(self, key, fecha):
+        self.year = anio_desde_fecha(fecha)
+        return fecha
+
+
+class TrackPreview(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    lookup_key = db.Column(db.String(512), unique=True, nullable=False, index=True)
+
+    titulo = db.Column(db.String(255), nullable=False)
+    artista = db.Column(db.String(255), nullable=True)
+    preview_url = db.Column(db.String(500), nullable=True)
+    not_found = db.Column(db.Boolean, default=False, nullable=False)
+
+    fetched_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
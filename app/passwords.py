@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, has_app_context
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+
+# Sin iteraciones explícitas: las que traiga Werkzeug (1.000.000 en 3.1). Bajarlas para ahorrar
+# CPU por login es decisión del despliegue vía PASSWORD_HASH_METHOD; scripts/benchmark_hash.py ayuda a elegir.
+DEFAULT_HASH_METHOD = "pbkdf2:sha256"
+SCRYPT_DEFAULTS = ("32768", "8", "1")
+# Orden de fuerza entre algoritmos: pasar a uno más débil nunca justifica reescribir el hash.
+FUERZA_ALGORITMO = {
+    "pbkdf2:sha1": 0,
+    "pbkdf2:sha224": 1,
+    "pbkdf2:sha256": 2,
+    "pbkdf2:sha384": 3,
+    "pbkdf2:sha512": 4,
+    "scrypt": 5,
+}
+
+
+def normalizar_metodo(metodo: str) -> str:
+    """Forma completa del prefijo que guarda Werkzeug: "pbkdf2:sha256" -> "pbkdf2:sha256:1000000"."""
+    partes = metodo.strip().split(":")
+    if partes[0] == "pbkdf2":
+        hash_name = partes[1] if len(partes) > 1 else "sha256"
+        iteraciones = partes[2] if len(partes) > 2 else str(DEFAULT_PBKDF2_ITERATIONS)
+        return f"pbkdf2:{hash_name}:{iteraciones}"
+    if partes[0] == "scrypt":
+        n, r, p = (*partes[1:], *SCRYPT_DEFAULTS[len(partes) - 1 :])[:3]
+        return f"scrypt:{n}:{r}:{p}"
+    return metodo
+
+
+def metodo_hash() -> str:
+    if has_app_context():
+        return current_app.config.get("PASSWORD_HASH_METHOD") or DEFAULT_HASH_METHOD
+    return DEFAULT_HASH_METHOD
+
+
+def generar_hash(password: str) -> str:
+    return generate_password_hash(password, method=metodo_hash())
+
+
+def _algoritmo_y_coste(metodo: str) -> tuple[str, tuple[int, ...]]:
+    """"pbkdf2:sha256:600000" -> ("pbkdf2:sha256", (600000,)); "scrypt:32768:8:1" -> ("scrypt", (32768, 8, 1))."""
+    partes = normalizar_metodo(metodo).split(":")
+    if partes[0] == "pbkdf2":
+        return ":".join(partes[:2]), (int(partes[2]),)
+    if partes[0] == "scrypt":
+        return "scrypt", tuple(int(parte) for parte in partes[1:])
+    return metodo, ()
+
+
+def necesita_rehash(password_hash: str) -> bool:
+    """¿El hash guardado es más débil que el configurado (peor algoritmo o menos coste)?
+
+    Uno más fuerte se deja como está: bajar PASSWORD_HASH_METHOD no debilita las contraseñas ya guardadas.
+    """
+    try:
+        algoritmo, coste = _algoritmo_y_coste(password_hash.split("$", 1)[0])
+        algoritmo_conf, coste_conf = _algoritmo_y_coste(metodo_hash())
+    except ValueError:
+        return True
+    if algoritmo != algoritmo_conf:
+        fuerza = FUERZA_ALGORITMO.get(algoritmo, -1)
+        return fuerza < FUERZA_ALGORITMO.get(algoritmo_conf, -1) or fuerza < 0
+    return any(actual < configurado for actual, configurado in zip(coste, coste_conf))
+
+
+def _pool_hash(max_workers: int) -> ThreadPoolExecutor:
+    pool = current_app.extensions.get("eco_hash_pool")
+    if pool is None:
+        pool = current_app.extensions.setdefault(
+            "eco_hash_pool", ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="eco-hash")
+        )
+    return pool
+
+
+def verificar_password(password_hash: str, password: str) -> bool:
+    """Comprueba la contraseña; con PASSWORD_VERIFY_THREADS > 0 lo hace en un pool acotado.
+
+    hashlib suelta el GIL mientras deriva la clave, así que en el pool el resto de hilos del
+    worker siguen atendiendo peticiones, y una ráfaga de logins no ocupa más de ese número de
+    hilos en hashear: las demás esperan turno.
+    """
+    hilos = int(current_app.config.get("PASSWORD_VERIFY_THREADS", 0)) if has_app_context() else 0
+    if hilos <= 0:
+        return check_password_hash(password_hash, password)
+    return _pool_hash(hilos).submit(check_password_hash, password_hash, password).result()
@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class TokenBucketLimiter:
+    """Un cubo de fichas por clave (p. ej. user_id), recargado a ritmo constante.
+
+    Los cubos inactivos se descartan cuando hay demasiados para que la memoria no crezca sin límite.
+    """
+
+    def __init__(self, capacity: float, refill_per_second: float, max_keys: int = 10_000):
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self.max_keys = max_keys
+        self._buckets: dict[object, tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def _refill(self, tokens: float, last: float, now: float) -> float:
+        return min(self.capacity, tokens + (now - last) * self.refill_per_second)
+
+    def consume(self, key, cost: float = 1.0) -> tuple[bool, float]:
+        """Devuelve (permitido, segundos hasta que haya ficha disponible)."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(key, (self.capacity, now))
+            tokens = self._refill(tokens, last, now)
+            if tokens >= cost:
+                self._buckets[key] = (tokens - cost, now)
+                allowed, retry_after = True, 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                if self.refill_per_second > 0:
+                    retry_after = (cost - tokens) / self.refill_per_second
+                else:
+                    retry_after = math.inf
+                allowed = False
+            if len(self._buckets) > self.max_keys:
+                self._evict(now)
+        return allowed, retry_after
+
+    def _evict(self, now: float) -> None:
+        # Un cubo que ya se habría rellenado del todo equivale a no tenerlo.
+        llenos = [k for k, (t, last) in self._buckets.items() if self._refill(t, last, now) >= self.capacity]
+        for key in llenos:
+            del self._buckets[key]
+        if len(self._buckets) > self.max_keys:
+            mas_antiguos = sorted(self._buckets, key=lambda k: self._buckets[k][1])
+            for key in mas_antiguos[: len(self._buckets) - self.max_keys]:
+                del self._buckets[key]
+
+
+def _ventana_deslizante(
+    estado: tuple[int, int, int] | None, now: float, window: float, limit: int
+) -> tuple[tuple[int, int, int], bool, float]:
+    """Contador de ventana deslizante aproximada: la ventana fija actual más la anterior ponderada.
+
+    El estado es (índice de ventana, intentos en la actual, intentos en la anterior): tres enteros
+    por clave en vez de un timestamp por intento. Devuelve (estado nuevo, permitido, retry_after).
+    Los intentos rechazados no cuentan, así que el bloqueo caduca aunque sigan llegando.
+    """
+    indice = int(now // window)
+    actual = anterior = 0
+    if estado is not None:
+        indice_guardado, actual_guardado, anterior_guardado = estado
+        if indice_guardado == indice:
+            actual, anterior = actual_guardado, anterior_guardado
+        elif indice_guardado == indice - 1:
+            anterior = actual_guardado
+    transcurrido = (now - indice * window) / window
+    estimado = anterior * (1 - transcurrido) + actual
+    if estimado + 1 <= limit:
+        return (indice, actual + 1, anterior), True, 0.0
+
+    if actual + 1 <= limit:
+        # Basta con que pese menos la ventana anterior: anterior * (1 - f) <= limit - 1 - actual.
+        fraccion = 1 - (limit - 1 - actual) / anterior
+        retry_after = (fraccion - transcurrido) * window
+    else:
+        # La actual ya está llena: hay que esperar a que pase a ser la anterior y pierda peso.
+        fraccion = 1 - (limit - 1) / actual
+        retry_after = (1 - transcurrido + fraccion) * window
+    return (indice, actual, anterior), False, max(retry_after, 0.0)
+
+
+class MemoryCounterStore:
+    """Contadores de ventana deslizante en memoria del proceso, con tope de claves (LRU)."""
+
+    def __init__(self, max_keys: int = 10_000):
+        self.max_keys = max_keys
+        self._data: OrderedDict[str, tuple[int, int, int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key: str, limit: int, window: float, now: float | None = None) -> tuple[bool, float]:
+        now = time.time() if now is None else now
+        with self._lock:
+            estado, permitido, retry_after = _ventana_deslizante(self._data.get(key), now, window, limit)
+            self._data[key] = estado
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_keys:
+                # La menos usada: si lleva dos ventanas sin tocarse ya no cuenta nada.
+                self._data.popitem(last=False)
+        return permitido, retry_after
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class SQLiteCounterStore:
+    """Los mismos contadores en un fichero SQLite, compartidos entre workers de gunicorn."""
+
+    PURGA_CADA = 256
+
+    def __init__(self, path: str):
+        self.path = path
+        self._escrituras = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limit ("
+                " key TEXT PRIMARY KEY,"
+                " ventana INTEGER NOT NULL,"
+                " actual INTEGER NOT NULL,"
+                " anterior INTEGER NOT NULL,"
+                " caduca REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=5, isolation_level=None)
+
+    def hit(self, key: str, limit: int, window: float, now: float | None = None) -> tuple[bool, float]:
+        now = time.time() if now is None else now
+        conn = self._connect()
+        try:
+            # BEGIN IMMEDIATE: leer y escribir el contador sin que otro worker se cuele en medio.
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT ventana, actual, anterior FROM rate_limit WHERE key = ?", (key,)).fetchone()
+            estado, permitido, retry_after = _ventana_deslizante(row, now, window, limit)
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_limit (key, ventana, actual, anterior, caduca) VALUES (?, ?, ?, ?, ?)",
+                (key, *estado, (estado[0] + 2) * window),
+            )
+            self._escrituras += 1
+            if self._escrituras % self.PURGA_CADA == 0:
+                conn.execute("DELETE FROM rate_limit WHERE caduca <= ?", (now,))
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            # Si el fichero falla no se bloquea a nadie: mejor sin límite que sin login.
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            return True, 0.0
+        finally:
+            conn.close()
+        return permitido, retry_after
+
+    def clear(self) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM rate_limit")
+
+
+class SlidingWindowLimiter:
+    """Como mucho `limit` intentos por clave en cualquier intervalo de `window` segundos."""
+
+    def __init__(self, store, limit: int, window: float, prefix: str):
+        self.store = store
+        self.limit = int(limit)
+        self.window = float(window)
+        self.prefix = prefix
+
+    def hit(self, key: str) -> tuple[bool, float]:
+        """Cuenta un intento; devuelve (permitido, segundos hasta el siguiente intento permitido)."""
+        if self.limit <= 0:
+            return True, 0.0
+        return self.store.hit(f"{self.prefix}:{key}", self.limit, self.window)
@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import heapq
+import queue
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import update
+
+from . import db
+from .models import CapsuleUnlockJob
+
+
+DEFAULT_REFRESH_SECONDS = 300
+
+
+class UnlockScheduler:
+    """Despierta a la hora exacta de apertura de las cápsulas y avisa a quien esté esperando.
+
+    Un hilo por proceso con un min-heap de (run_at, capsule_id). Solo se cargan los trabajos que
+    vencen antes del siguiente refresco; los lejanos siguen en capsule_unlock_job hasta entonces,
+    así que el heap no crece con cápsulas que se abren dentro de años. Al disparar, marca done_at
+    en la tabla (idempotente: con varios workers, el primero gana) y avisa a sus suscriptores SSE.
+    """
+
+    def __init__(self, app, refresh_seconds: float = DEFAULT_REFRESH_SECONDS):
+        self.app = app
+        self.refresh_seconds = refresh_seconds
+        self.disparadas = 0
+        self._heap: list[tuple[datetime, int]] = []
+        # run_at vigente por cápsula: las entradas del heap que no coinciden están obsoletas.
+        self._programadas: dict[int, datetime] = {}
+        self._suscriptores: dict[int, set[queue.SimpleQueue]] = {}
+        self._cargado_hasta = datetime.min
+        self._cond = threading.Condition()
+        self._hilo: threading.Thread | None = None
+        self._parar = False
+
+    def iniciar(self) -> None:
+        with self._cond:
+            if self._hilo is not None:
+                return
+            self._hilo = threading.Thread(target=self._bucle, name="eco-unlock-scheduler", daemon=True)
+            self._hilo.start()
+
+    def detener(self) -> None:
+        with self._cond:
+            self._parar = True
+            self._cond.notify_all()
+        if self._hilo is not None:
+            self._hilo.join(timeout=5)
+
+    def programar(self, capsule_id: int, run_at: datetime) -> None:
+        """Añade (o adelanta) una apertura; si vence después del siguiente refresco ya la cargará."""
+        with self._cond:
+            if run_at > self._cargado_hasta or self._programadas.get(capsule_id) == run_at:
+                return
+            self._programadas[capsule_id] = run_at
+            heapq.heappush(self._heap, (run_at, capsule_id))
+            self._cond.notify()
+
+    def suscribir(self, capsule_id: int) -> queue.SimpleQueue:
+        cola: queue.SimpleQueue = queue.SimpleQueue()
+        with self._cond:
+            self._suscriptores.setdefault(capsule_id, set()).add(cola)
+        return cola
+
+    def cancelar(self, capsule_id: int, cola: queue.SimpleQueue) -> None:
+        with self._cond:
+            colas = self._suscriptores.get(capsule_id)
+            if colas is not None:
+                colas.discard(cola)
+                if not colas:
+                    del self._suscriptores[capsule_id]
+
+    def _cargar(self, ahora: datetime) -> None:
+        hasta = ahora + timedelta(seconds=2 * self.refresh_seconds)
+        with self.app.app_context():
+            try:
+                pendientes = (
+                    db.session.query(CapsuleUnlockJob.capsule_id, CapsuleUnlockJob.run_at)
+                    .filter(CapsuleUnlockJob.done_at.is_(None), CapsuleUnlockJob.run_at <= hasta)
+                    .order_by(CapsuleUnlockJob.run_at)
+                    .all()
+                )
+            finally:
+                db.session.remove()
+        with self._cond:
+            self._cargado_hasta = hasta
+            for capsule_id, run_at in pendientes:
+                if self._programadas.get(capsule_id) != run_at:
+                    self._programadas[capsule_id] = run_at
+                    heapq.heappush(self._heap, (run_at, capsule_id))
+
+    def _vencidas(self, ahora: datetime) -> list[int]:
+        vencidas = []
+        while self._heap and self._heap[0][0] <= ahora:
+            run_at, capsule_id = heapq.heappop(self._heap)
+            if self._programadas.get(capsule_id) == run_at:
+                del self._programadas[capsule_id]
+                vencidas.append(capsule_id)
+        return vencidas
+
+    def _disparar(self, capsule_ids: list[int], ahora: datetime) -> None:
+        with self.app.app_context():
+            try:
+                db.session.execute(
+                    update(CapsuleUnlockJob)
+                    .where(CapsuleUnlockJob.capsule_id.in_(capsule_ids), CapsuleUnlockJob.done_at.is_(None))
+                    .values(done_at=ahora)
+                )
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                current_app.logger.exception("No se pudieron marcar las aperturas %s", capsule_ids)
+            finally:
+                db.session.remove()
+        with self._cond:
+            self.disparadas += len(capsule_ids)
+            avisos = [(cola, capsule_id) for capsule_id in capsule_ids for cola in self._suscriptores.get(capsule_id, ())]
+        for cola, capsule_id in avisos:
+            cola.put(capsule_id)
+
+    def _bucle(self) -> None:
+        proximo_refresco = datetime.min
+        while True:
+            ahora = datetime.utcnow()
+            if ahora >= proximo_refresco:
+                try:
+                    self._cargar(ahora)
+                except Exception:
+                    self.app.logger.exception("No se pudieron cargar las aperturas pendientes")
+                proximo_refresco = ahora + timedelta(seconds=self.refresh_seconds)
+            with self._cond:
+                if self._parar:
+                    return
+                vencidas = self._vencidas(datetime.utcnow())
+                if not vencidas:
+                    siguiente = self._heap[0][0] if self._heap else proximo_refresco
+                    espera = (min(siguiente, proximo_refresco) - datetime.utcnow()).total_seconds()
+                    self._cond.wait(timeout=max(espera, 0.0))
+                    continue
+            self._disparar(vencidas, datetime.utcnow())
+
+
+def iniciar_unlock_scheduler(app) -> UnlockScheduler:
+    """Crea (una vez por app) y arranca el hilo del scheduler de `app`."""
+    scheduler = app.extensions.get("eco_unlock_scheduler")
+    if scheduler is None:
+        scheduler = app.extensions.setdefault(
+            "eco_unlock_scheduler",
+            UnlockScheduler(app, refresh_seconds=app.config["UNLOCK_SCHEDULER_REFRESH_SECONDS"]),
+        )
+    scheduler.iniciar()
+    return scheduler
+
+
+def get_unlock_scheduler() -> UnlockScheduler:
+    """El scheduler del proceso. En gunicorn ya arrancó con el worker (wsgi.py); en desarrollo y
+    en los tests arranca aquí, con el primer cliente que espera una apertura."""
+    return iniciar_unlock_scheduler(current_app._get_current_object())
@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_TTL_HIT_SECONDS = 6 * 60 * 60
+DEFAULT_TTL_EMPTY_SECONDS = 5 * 60
+
+_ESPACIOS = re.compile(r"\s+")
+
+
+def normalizar_consulta(query: str | None) -> str:
+    """Clave de caché: minúsculas, sin tildes y con los espacios colapsados."""
+    texto = unicodedata.normalize("NFKD", (query or "").casefold())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return _ESPACIOS.sub(" ", texto).strip()
+
+
+class MemoryBackend:
+    """LRU en memoria del proceso; cada entrada guarda su propia caducidad."""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data: OrderedDict[str, tuple[float, list[dict]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> list[dict] | None:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if time.time() >= expires_at:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: list[dict], ttl: float) -> None:
+        with self._lock:
+            self._data[key] = (time.time() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class SQLiteBackend:
+    """Caché compartida entre workers de gunicorn a través de un fichero SQLite."""
+
+    def __init__(self, path: str, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        directorio = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directorio, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS search_cache ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, key: str) -> list[dict] | None:
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT value, expires_at FROM search_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                if now >= row[1]:
+                    conn.execute("DELETE FROM search_cache WHERE key = ?", (key,))
+                    return None
+                conn.execute("UPDATE search_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        except sqlite3.Error:
+            return None
+        return json.loads(row[0])
+
+    def set(self, key: str, value: list[dict], ttl: float) -> None:
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO search_cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value), now + ttl, now),
+                )
+                conn.execute("DELETE FROM search_cache WHERE expires_at <= ?", (now,))
+                conn.execute(
+                    "DELETE FROM search_cache WHERE key IN ("
+                    " SELECT key FROM search_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+        except sqlite3.Error:
+            pass
+
+    def clear(self) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM search_cache")
+
+
+class SearchCache:
+    def __init__(
+        self,
+        backend,
+        ttl_hit: float = DEFAULT_TTL_HIT_SECONDS,
+        ttl_empty: float = DEFAULT_TTL_EMPTY_SECONDS,
+    ):
+        self.backend = backend
+        self.ttl_hit = ttl_hit
+        self.ttl_empty = ttl_empty
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> list[dict] | None:
+        value = self.backend.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if value is None:
+            return None
+        # Copias para que quien llame no modifique lo que hay en la caché.
+        return [dict(r) for r in value]
+
+    def set(self, key: str, resultados: list[dict], completos: bool = True) -> None:
+        """Guarda la búsqueda; vacía o con previews aún pendientes, solo durante ttl_empty."""
+        ttl = self.ttl_hit if resultados and completos else self.ttl_empty
+        self.backend.set(key, [dict(r) for r in resultados], ttl)
+
+    def clear(self) -> None:
+        self.backend.clear()
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def crear_search_cache_desde_env() -> SearchCache:
+    max_entries = int(_env_float("SEARCH_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+    backend_name = (os.getenv("SEARCH_CACHE_BACKEND") or "memory").strip().lower()
+    if backend_name == "sqlite":
+        path = os.getenv("SEARCH_CACHE_PATH") or os.path.join("/tmp", "eco_search_cache.sqlite3")
+        backend = SQLiteBackend(path, max_entries=max_entries)
+    else:
+        backend = MemoryBackend(max_entries=max_entries)
+    return SearchCache(
+        backend,
+        ttl_hit=_env_float("SEARCH_CACHE_TTL_SECONDS", DEFAULT_TTL_HIT_SECONDS),
+        ttl_empty=_env_float("SEARCH_CACHE_EMPTY_TTL_SECONDS", DEFAULT_TTL_EMPTY_SECONDS),
+    )
+
+
+_search_cache: SearchCache | None = None
+_search_cache_lock = threading.Lock()
+
+
+def get_search_cache() -> SearchCache:
+    global _search_cache
+    if _search_cache is None:
+        with _search_cache_lock:
+            if _search_cache is None:
+                _search_cache = crear_search_cache_desde_env()
+    return _search_cache
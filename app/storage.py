@@ -0,0 +1,419 @@
+from __future__ import annotations
+
+import errno
+import hashlib
+import hmac
+import os
+import shutil
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from datetime import datetime, timezone
+from urllib.parse import quote, urlsplit
+
+from flask import abort, current_app, send_from_directory, url_for
+
+from . import http_client
+
+
+DEFAULT_PRESIGN_EXPIRES_SECONDS = 3600
+EXISTENCIA_TTL_SECONDS = 300
+EXISTENCIA_MAX_ENTRIES = 4096
+UNSIGNED_PAYLOAD = "UNSIGNED-PAYLOAD"
+CACHE_BLOB = "public, max-age=31536000, immutable"
+
+
+class StorageError(RuntimeError):
+    """El backend no pudo guardar, leer o borrar un blob."""
+
+
+class FilesystemStorage:
+    """Blobs bajo `root`, servidos por la ruta `static` de Flask si `root` es la carpeta static y
+    por la ruta `uploads` de init_storage() si es otra (p. ej. un disco persistente).
+
+    Los temporales de las subidas van a `tmp_dir`, que no se sirve: por defecto `<root>/tmp`,
+    fuera de uploads/ (lo único que publica /media/) y en el mismo disco que el destino.
+    """
+
+    nombre = "filesystem"
+
+    def __init__(self, root: str, endpoint: str = "static", tmp_dir: str | None = None):
+        self.root = root
+        self.endpoint = endpoint
+        self.tmp_dir = tmp_dir or os.path.join(root, "tmp")
+
+    def _absoluta(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def directorio_temporal(self) -> str:
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        return self.tmp_dir
+
+    def temporales(self):
+        """(ruta, tamaño, mtime) de los temporales que hayan dejado subidas interrumpidas."""
+        try:
+            nombres = sorted(os.listdir(self.tmp_dir))
+        except OSError:
+            return
+        for nombre in nombres:
+            ruta = os.path.join(self.tmp_dir, nombre)
+            try:
+                stat = os.stat(ruta)
+            except OSError:
+                continue
+            if nombre.endswith(".tmp"):
+                yield ruta, stat.st_size, stat.st_mtime
+
+    def guardar(self, key: str, origen: str, content_type: str | None = None) -> None:
+        """Mueve el fichero local `origen` a `key`."""
+        destino = self._absoluta(key)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        try:
+            os.replace(origen, destino)
+        except OSError as exc:
+            if exc.errno != errno.EXDEV:
+                raise
+            # tmp_dir en otro disco: se copia junto al destino y se renombra, para que nunca
+            # se vea un blob a medias.
+            fd, parcial = tempfile.mkstemp(dir=os.path.dirname(destino), prefix=".", suffix=".tmp")
+            os.close(fd)
+            try:
+                shutil.copyfile(origen, parcial)
+                os.replace(parcial, destino)
+            except BaseException:
+                os.remove(parcial)
+                raise
+            os.remove(origen)
+
+    def existe(self, key: str) -> bool:
+        return os.path.exists(self._absoluta(key))
+
+    def tocar(self, key: str, content_type: str | None = None) -> bool:
+        """Renueva la fecha de `key` para que la limpieza no lo dé por huérfano; False si no existe."""
+        try:
+            os.utime(self._absoluta(key))
+        except OSError:
+            return False
+        return True
+
+    def borrar(self, key: str) -> None:
+        try:
+            os.remove(self._absoluta(key))
+        except OSError:
+            pass
+
+    def descargar(self, key: str, destino: str) -> None:
+        try:
+            shutil.copyfile(self._absoluta(key), destino)
+        except OSError as exc:
+            raise StorageError(f"No se pudo leer {key}: {exc}") from exc
+
+    def listar(self, prefijo: str):
+        """(key, tamaño, mtime) de cada blob bajo `prefijo`."""
+        for raiz, _, ficheros in os.walk(self._absoluta(prefijo)):
+            for nombre in sorted(ficheros):
+                ruta = os.path.join(raiz, nombre)
+                try:
+                    stat = os.stat(ruta)
+                except OSError:
+                    continue
+                key = os.path.relpath(ruta, self.root).replace(os.sep, "/")
+                yield key, stat.st_size, stat.st_mtime
+
+    def url(self, key: str) -> str:
+        return url_for(self.endpoint, filename=key)
+
+    def url_epoch(self) -> int:
+        return 0
+
+
+class S3Storage:
+    """Bucket S3 o compatible (MinIO, R2...) firmado con SigV4 sobre el cliente HTTP compartido.
+
+    Las fotos se sirven con URL directa (`public_base_url`, p. ej. un CDN o bucket público) o
+    prefirmada, así que los bytes nunca pasan por los workers de Flask. Las URLs prefirmadas se
+    fechan por ventanas de media caducidad: son estables (cacheables) dentro de cada ventana y
+    siempre les queda al menos esa media caducidad de vida.
+    """
+
+    nombre = "s3"
+
+    def __init__(
+        self,
+        bucket: str,
+        access_key: str,
+        secret_key: str,
+        region: str = "us-east-1",
+        endpoint_url: str | None = None,
+        path_style: bool | None = None,
+        public_base_url: str | None = None,
+        presign_expires: int = DEFAULT_PRESIGN_EXPIRES_SECONDS,
+        timeout: float = 10.0,
+    ):
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        if path_style is None:
+            # Los compatibles (MinIO) suelen ir por ruta; AWS, por subdominio.
+            path_style = bool(endpoint_url)
+        if not endpoint_url:
+            endpoint_url = f"https://{bucket}.s3.{region}.amazonaws.com"
+        endpoint_url = endpoint_url.rstrip("/")
+        self.base_url = f"{endpoint_url}/{bucket}" if path_style else endpoint_url
+        self.host = urlsplit(endpoint_url).netloc
+        self.public_base_url = public_base_url.rstrip("/") if public_base_url else None
+        self.presign_expires = max(2, int(presign_expires))
+        self.timeout = timeout
+        self._existencia: OrderedDict[str, tuple[bool, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    # --- Firma SigV4 -------------------------------------------------------------------------
+
+    def _ruta(self, key: str = "") -> str:
+        return urlsplit(f"{self.base_url}/{quote(key, safe='/~')}").path
+
+    def _scope(self, fecha: str) -> str:
+        return f"{fecha}/{self.region}/s3/aws4_request"
+
+    def _clave_firma(self, fecha: str) -> bytes:
+        clave = ("AWS4" + self.secret_key).encode()
+        for parte in (fecha, self.region, "s3", "aws4_request"):
+            clave = hmac.new(clave, parte.encode(), hashlib.sha256).digest()
+        return clave
+
+    def _firma(self, metodo: str, ruta: str, query: dict, headers: dict, payload_hash: str, amz_date: str) -> str:
+        query_canonica = "&".join(
+            f"{quote(k, safe='-_.~')}={quote(str(v), safe='-_.~')}" for k, v in sorted(query.items())
+        )
+        cabeceras = sorted((k.lower(), " ".join(str(v).split())) for k, v in headers.items())
+        peticion_canonica = "\n".join(
+            [
+                metodo,
+                ruta,
+                query_canonica,
+                "".join(f"{k}:{v}\n" for k, v in cabeceras),
+                ";".join(k for k, _ in cabeceras),
+                payload_hash,
+            ]
+        )
+        a_firmar = "\n".join(
+            [
+                "AWS4-HMAC-SHA256",
+                amz_date,
+                self._scope(amz_date[:8]),
+                hashlib.sha256(peticion_canonica.encode()).hexdigest(),
+            ]
+        )
+        return hmac.new(self._clave_firma(amz_date[:8]), a_firmar.encode(), hashlib.sha256).hexdigest()
+
+    def _peticion(self, metodo: str, key: str = "", query: dict | None = None, **kwargs):
+        import requests
+
+        query = query or {}
+        amz_date = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        extra = kwargs.pop("headers", {})
+        headers = {"host": self.host, "x-amz-content-sha256": UNSIGNED_PAYLOAD, "x-amz-date": amz_date}
+        # S3 exige que las cabeceras x-amz-* (p. ej. x-amz-copy-source) vayan firmadas.
+        headers.update({k.lower(): v for k, v in extra.items() if k.lower().startswith("x-amz-")})
+        ruta = self._ruta(key)
+        firma = self._firma(metodo, ruta, query, headers, UNSIGNED_PAYLOAD, amz_date)
+        headers["Authorization"] = (
+            f"AWS4-HMAC-SHA256 Credential={self.access_key}/{self._scope(amz_date[:8])}, "
+            f"SignedHeaders={';'.join(sorted(headers))}, Signature={firma}"
+        )
+        del headers["host"]
+        headers.update({k: v for k, v in extra.items() if not k.lower().startswith("x-amz-")})
+        url = f"{self.base_url}/{quote(key, safe='/~')}"
+        try:
+            if "data" in kwargs:
+                # Un cuerpo en streaming no se puede reintentar: va directo a la sesión compartida.
+                return http_client.get_session().request(
+                    metodo, url, params=query, headers=headers, timeout=self.timeout, **kwargs
+                )
+            return http_client.request(metodo, url, params=query, headers=headers, timeout=self.timeout, **kwargs)
+        except requests.RequestException as exc:
+            raise StorageError(f"{metodo} {key}: {exc}") from exc
+
+    def url_prefirmada(self, key: str, ahora: float | None = None, expires: int | None = None) -> str:
+        expires = expires or self.presign_expires
+        if ahora is None:
+            ventana = max(1, expires // 2)
+            ahora = (time.time() // ventana) * ventana
+        amz_date = datetime.fromtimestamp(ahora, timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        query = {
+            "X-Amz-Algorithm": "AWS4-HMAC-SHA256",
+            "X-Amz-Credential": f"{self.access_key}/{self._scope(amz_date[:8])}",
+            "X-Amz-Date": amz_date,
+            "X-Amz-Expires": str(expires),
+            "X-Amz-SignedHeaders": "host",
+        }
+        ruta = self._ruta(key)
+        query["X-Amz-Signature"] = self._firma("GET", ruta, query, {"host": self.host}, UNSIGNED_PAYLOAD, amz_date)
+        query_string = "&".join(f"{quote(k, safe='-_.~')}={quote(v, safe='-_.~')}" for k, v in query.items())
+        return f"{self.base_url}/{quote(key, safe='/~')}?{query_string}"
+
+    # --- Caché de existencia (evita un HEAD por foto en cada render) ------------------------
+
+    def _recordar(self, key: str, existe: bool) -> None:
+        with self._lock:
+            self._existencia[key] = (existe, time.monotonic() + EXISTENCIA_TTL_SECONDS)
+            self._existencia.move_to_end(key)
+            while len(self._existencia) > EXISTENCIA_MAX_ENTRIES:
+                self._existencia.popitem(last=False)
+
+    # --- API común -------------------------------------------------------------------------
+
+    def directorio_temporal(self) -> str:
+        return tempfile.gettempdir()
+
+    def temporales(self):
+        # Los temporales viven en el tmp del sistema, que ya limpia el propio sistema.
+        return iter(())
+
+    def guardar(self, key: str, origen: str, content_type: str | None = None) -> None:
+        """Sube el fichero local `origen` a `key` y lo borra de disco."""
+        headers = {"Cache-Control": CACHE_BLOB}
+        if content_type:
+            headers["Content-Type"] = content_type
+        with open(origen, "rb") as cuerpo:
+            headers["Content-Length"] = str(os.fstat(cuerpo.fileno()).st_size)
+            resp = self._peticion("PUT", key, data=cuerpo, headers=headers)
+        if resp.status_code >= 300:
+            raise StorageError(f"PUT {key}: HTTP {resp.status_code}")
+        os.remove(origen)
+        self._recordar(key, True)
+
+    def existe(self, key: str) -> bool:
+        with self._lock:
+            entrada = self._existencia.get(key)
+            if entrada is not None and entrada[1] > time.monotonic():
+                return entrada[0]
+        try:
+            resp = self._peticion("HEAD", key)
+        except StorageError:
+            return False
+        if resp.status_code >= 500:
+            return False
+        existe = resp.status_code < 300
+        self._recordar(key, existe)
+        return existe
+
+    def tocar(self, key: str, content_type: str | None = None) -> bool:
+        """Copia el objeto sobre sí mismo (REPLACE) para renovar su LastModified; False si no existe."""
+        headers = {
+            "x-amz-copy-source": quote(f"/{self.bucket}/{key}", safe="/~"),
+            "x-amz-metadata-directive": "REPLACE",
+            "Cache-Control": CACHE_BLOB,
+        }
+        if content_type:
+            headers["Content-Type"] = content_type
+        try:
+            resp = self._peticion("PUT", key, headers=headers)
+        except StorageError:
+            return False
+        existe = resp.status_code < 300
+        self._recordar(key, existe)
+        return existe
+
+    def borrar(self, key: str) -> None:
+        try:
+            self._peticion("DELETE", key)
+        except StorageError:
+            pass
+        self._recordar(key, False)
+
+    def descargar(self, key: str, destino: str) -> None:
+        resp = self._peticion("GET", key, stream=True)
+        if resp.status_code != 200:
+            raise StorageError(f"GET {key}: HTTP {resp.status_code}")
+        with open(destino, "wb") as fichero:
+            for bloque in resp.iter_content(64 * 1024):
+                fichero.write(bloque)
+
+    def listar(self, prefijo: str):
+        """(key, tamaño, mtime) de cada objeto bajo `prefijo`, paginando ListObjectsV2."""
+        token = None
+        while True:
+            query = {"list-type": "2", "prefix": prefijo.rstrip("/") + "/"}
+            if token:
+                query["continuation-token"] = token
+            resp = self._peticion("GET", "", query=query)
+            if resp.status_code != 200:
+                raise StorageError(f"ListObjectsV2 {prefijo}: HTTP {resp.status_code}")
+            raiz = ET.fromstring(resp.content)
+            ns = raiz.tag[: raiz.tag.index("}") + 1] if raiz.tag.startswith("{") else ""
+            for obj in raiz.iter(f"{ns}Contents"):
+                modificado = datetime.strptime(obj.findtext(f"{ns}LastModified")[:19], "%Y-%m-%dT%H:%M:%S")
+                yield (
+                    obj.findtext(f"{ns}Key"),
+                    int(obj.findtext(f"{ns}Size") or 0),
+                    modificado.replace(tzinfo=timezone.utc).timestamp(),
+                )
+            token = raiz.findtext(f"{ns}NextContinuationToken")
+            if raiz.findtext(f"{ns}IsTruncated") != "true" or not token:
+                return
+
+    def url(self, key: str) -> str:
+        if self.public_base_url:
+            return f"{self.public_base_url}/{quote(key, safe='/~')}"
+        return self.url_prefirmada(key)
+
+    def url_epoch(self) -> int:
+        """Cambia cuando cambian las URLs prefirmadas; entra en los ETags y cachés de HTML."""
+        if self.public_base_url:
+            return 0
+        return int(time.time() // max(1, self.presign_expires // 2))
+
+
+def crear_storage(app) -> FilesystemStorage | S3Storage:
+    config = app.config
+    if (config.get("STORAGE_BACKEND") or "filesystem").lower() == "s3":
+        return S3Storage(
+            bucket=config["S3_BUCKET"],
+            access_key=config["S3_ACCESS_KEY_ID"],
+            secret_key=config["S3_SECRET_ACCESS_KEY"],
+            region=config.get("S3_REGION") or "us-east-1",
+            endpoint_url=config.get("S3_ENDPOINT_URL"),
+            public_base_url=config.get("S3_PUBLIC_BASE_URL"),
+            presign_expires=int(config.get("S3_PRESIGN_EXPIRES") or DEFAULT_PRESIGN_EXPIRES_SECONDS),
+        )
+    root = config.get("STORAGE_ROOT") or app.static_folder
+    if sirve_static(app, root):
+        # Todo lo que hay bajo static es público: los temporales van a la carpeta instance.
+        tmp_dir = config.get("STORAGE_TMP_DIR") or os.path.join(app.instance_path, "tmp")
+        return FilesystemStorage(root, endpoint="static", tmp_dir=tmp_dir)
+    return FilesystemStorage(root, endpoint="uploads", tmp_dir=config.get("STORAGE_TMP_DIR"))
+
+
+def sirve_static(app, root: str) -> bool:
+    return os.path.realpath(root) == os.path.realpath(app.static_folder)
+
+
+def init_storage(app) -> None:
+    """Con STORAGE_ROOT fuera de la carpeta static, registra la ruta que sirve sus uploads/."""
+    if (app.config.get("STORAGE_BACKEND") or "filesystem").lower() != "filesystem":
+        return
+    root = app.config.get("STORAGE_ROOT") or app.static_folder
+    if sirve_static(app, root):
+        return
+
+    def servir_upload(filename: str):
+        # Solo las fotos: el resto de STORAGE_ROOT (temporales incluidos) no se publica.
+        if not filename.startswith("uploads/") or filename.endswith(".tmp"):
+            abort(404)
+        response = send_from_directory(root, filename)
+        # Keys por contenido: una URL nunca cambia de bytes.
+        response.headers["Cache-Control"] = CACHE_BLOB
+        return response
+
+    app.add_url_rule("/media/<path:filename>", endpoint="uploads", view_func=servir_upload)
+
+
+def get_storage() -> FilesystemStorage | S3Storage:
+    storage = current_app.extensions.get("eco_storage")
+    if storage is None:
+        storage = current_app.extensions.setdefault("eco_storage", crear_storage(current_app))
+    return storage
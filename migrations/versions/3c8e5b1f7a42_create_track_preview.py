@@ -0,0 +1,39 @@
+"""create track_preview cache table
+
+Revision ID: 3c8e5b1f7a42
+Revises: 6f1d9a4be2b7
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "3c8e5b1f7a42"
+down_revision = "6f1d9a4be2b7"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "track_preview",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("lookup_key", sa.String(length=512), nullable=False),
+        sa.Column("titulo", sa.String(length=255), nullable=False),
+        sa.Column("artista", sa.String(length=255), nullable=True),
+        sa.Column("preview_url", sa.String(length=500), nullable=True),
+        sa.Column("not_found", sa.Boolean(), nullable=False),
+        sa.Column("fetched_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_track_preview_lookup_key"), "track_preview", ["lookup_key"], unique=True)
+
+
+def downgrade():
+    op.drop_index(op.f("ix_track_preview_lookup_key"), table_name="track_preview")
+    op.drop_table("track_preview")
@@ -0,0 +1,68 @@
+"""add memory.year and composite indexes
+
+Revision ID: 8a4d2c6e9b13
+Revises: 3c8e5b1f7a42
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "8a4d2c6e9b13"
+down_revision = "3c8e5b1f7a42"
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 500
+
+
+def _anio_desde_fecha(fecha_raw: str | None) -> int | None:
+    fecha = (fecha_raw or "").strip()
+    if not fecha:
+        return None
+    try:
+        return datetime.strptime(fecha, "%d/%m/%Y %H:%M").year
+    except ValueError:
+        candidato = fecha[6:10] if len(fecha) >= 10 else ""
+        return int(candidato) if candidato.isdigit() else None
+
+
+def upgrade():
+    op.add_column("memory", sa.Column("year", sa.Integer(), nullable=True))
+
+    bind = op.get_bind()
+    memory_table = sa.table(
+        "memory",
+        sa.column("id", sa.String(length=32)),
+        sa.column("fecha", sa.String(length=20)),
+        sa.column("year", sa.Integer()),
+    )
+    filas = bind.execute(sa.select(memory_table.c.id, memory_table.c.fecha)).fetchall()
+    cambios = [{"b_id": memory_id, "b_year": _anio_desde_fecha(fecha)} for memory_id, fecha in filas]
+    cambios = [c for c in cambios if c["b_year"] is not None]
+    update = (
+        memory_table.update()
+        .where(memory_table.c.id == sa.bindparam("b_id"))
+        .values(year=sa.bindparam("b_year"))
+    )
+    for inicio in range(0, len(cambios), BATCH_SIZE):
+        bind.execute(update, cambios[inicio : inicio + BATCH_SIZE])
+
+    op.create_index("ix_memory_user_id_created_at", "memory", ["user_id", "created_at"], unique=False)
+    op.create_index("ix_memory_user_id_favorito", "memory", ["user_id", "favorito"], unique=False)
+    op.create_index("ix_memory_user_id_year", "memory", ["user_id", "year"], unique=False)
+
+
+def downgrade():
+    op.drop_index("ix_memory_user_id_year", table_name="memory")
+    op.drop_index("ix_memory_user_id_favorito", table_name="memory")
+    op.drop_index("ix_memory_user_id_created_at", table_name="memory")
+    with op.batch_alter_table("memory", schema=None) as batch_op:
+        batch_op.drop_column("year")
@@ -0,0 +1,59 @@
+"""index memory.foto_personal and add capsule.foto_key
+
+Revision ID: a93e6c1d5f28
+Revises: f2c9d4b7a810
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+
+from __future__ import annotations
+
+import os
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "a93e6c1d5f28"
+down_revision = "f2c9d4b7a810"
+branch_labels = None
+depends_on = None
+
+SUFIJOS_VARIANTE = (".thumb.webp", ".medium.webp")
+
+
+def base_foto(cover_url: str) -> str | None:
+    if cover_url.startswith("/static/"):
+        cover_url = cover_url[len("/static/"):]
+    if not cover_url.startswith("uploads/"):
+        return None
+    for sufijo in SUFIJOS_VARIANTE:
+        if cover_url.endswith(sufijo):
+            return cover_url[: -len(sufijo)]
+    return os.path.splitext(cover_url)[0]
+
+
+def upgrade():
+    op.create_index("ix_memory_foto_personal", "memory", ["foto_personal"], unique=False)
+    with op.batch_alter_table("capsule", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("foto_key", sa.String(length=255), nullable=True))
+    op.create_index("ix_capsule_foto_key", "capsule", ["foto_key"], unique=False)
+
+    # Portadas subidas antes de esta columna: la key sale de la cover_url que apunta a uploads/.
+    capsule = sa.table("capsule", sa.column("id"), sa.column("cover_url"), sa.column("foto_key"))
+    bind = op.get_bind()
+    filas = bind.execute(
+        sa.select(capsule.c.id, capsule.c.cover_url).where(capsule.c.cover_url.like("%uploads/%"))
+    ).all()
+    for capsule_id, cover_url in filas:
+        foto_key = base_foto(cover_url)
+        if foto_key:
+            bind.execute(capsule.update().where(capsule.c.id == capsule_id).values(foto_key=foto_key))
+
+
+def downgrade():
+    op.drop_index("ix_capsule_foto_key", table_name="capsule")
+    with op.batch_alter_table("capsule", schema=None) as batch_op:
+        batch_op.drop_column("foto_key")
+    op.drop_index("ix_memory_foto_personal", table_name="memory")
@@ -0,0 +1,29 @@
+"""add user.library_version
+
+Revision ID: b27f4e8d1c05
+Revises: 8a4d2c6e9b13
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "b27f4e8d1c05"
+down_revision = "8a4d2c6e9b13"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("user", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("library_version", sa.Integer(), server_default="0", nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table("user", schema=None) as batch_op:
+        batch_op.drop_column("library_version")
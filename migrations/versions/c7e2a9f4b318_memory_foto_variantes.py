@@ -0,0 +1,31 @@
+"""add memory.foto_variantes
+
+Revision ID: c7e2a9f4b318
+Revises: a93e6c1d5f28
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "c7e2a9f4b318"
+down_revision = "a93e6c1d5f28"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Sin backfill aquí: depende del storage. scripts/generar_miniaturas.py registra las variantes
+    # de las fotos ya subidas; hasta entonces se pintan con el original.
+    with op.batch_alter_table("memory", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("foto_variantes", sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table("memory", schema=None) as batch_op:
+        batch_op.drop_column("foto_variantes")
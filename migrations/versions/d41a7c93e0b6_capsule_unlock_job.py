@@ -0,0 +1,42 @@
+"""create capsule_unlock_job
+
+Revision ID: d41a7c93e0b6
+Revises: b27f4e8d1c05
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "d41a7c93e0b6"
+down_revision = "b27f4e8d1c05"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "capsule_unlock_job",
+        sa.Column("capsule_id", sa.Integer(), nullable=False),
+        sa.Column("run_at", sa.DateTime(), nullable=False),
+        sa.Column("done_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["capsule_id"], ["capsule.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("capsule_id"),
+    )
+    op.create_index("ix_capsule_unlock_job_pending", "capsule_unlock_job", ["done_at", "run_at"], unique=False)
+
+    # Las cápsulas selladas que ya existen también necesitan su aviso de apertura.
+    op.execute(
+        "INSERT INTO capsule_unlock_job (capsule_id, run_at) "
+        "SELECT id, open_date FROM capsule WHERE opened_at IS NULL"
+    )
+
+
+def downgrade():
+    op.drop_index("ix_capsule_unlock_job_pending", table_name="capsule_unlock_job")
+    op.drop_table("capsule_unlock_job")
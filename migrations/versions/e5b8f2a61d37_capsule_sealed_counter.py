@@ -0,0 +1,55 @@
+"""add capsule sealed index and user.sealed_capsules counter
+
+Revision ID: e5b8f2a61d37
+Revises: d41a7c93e0b6
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "e5b8f2a61d37"
+down_revision = "d41a7c93e0b6"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_capsule_user_id_sealed",
+        "capsule",
+        ["user_id", "opened_at", "open_date"],
+        unique=False,
+        postgresql_where=sa.text("opened_at IS NULL"),
+    )
+    with op.batch_alter_table("user", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("sealed_capsules", sa.Integer(), server_default="0", nullable=False))
+        batch_op.add_column(sa.Column("sealed_capsules_until", sa.DateTime(), nullable=True))
+
+    user = sa.table("user", sa.column("id"), sa.column("sealed_capsules"), sa.column("sealed_capsules_until"))
+    capsule = sa.table("capsule", sa.column("id"), sa.column("user_id"), sa.column("opened_at"), sa.column("open_date"))
+    activas = sa.and_(
+        capsule.c.user_id == user.c.id,
+        capsule.c.opened_at.is_(None),
+        capsule.c.open_date > datetime.utcnow(),
+    )
+    op.execute(
+        user.update().values(
+            sealed_capsules=sa.select(sa.func.count(capsule.c.id)).where(activas).scalar_subquery(),
+            sealed_capsules_until=sa.select(sa.func.min(capsule.c.open_date)).where(activas).scalar_subquery(),
+        )
+    )
+
+
+def downgrade():
+    with op.batch_alter_table("user", schema=None) as batch_op:
+        batch_op.drop_column("sealed_capsules_until")
+        batch_op.drop_column("sealed_capsules")
+    op.drop_index("ix_capsule_user_id_sealed", table_name="capsule")
@@ -0,0 +1,26 @@
+"""add capsule (user_id, created_at) index
+
+Revision ID: f2c9d4b7a810
+Revises: e5b8f2a61d37
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+
+from __future__ import annotations
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "f2c9d4b7a810"
+down_revision = "e5b8f2a61d37"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("ix_capsule_user_id_created_at", "capsule", ["user_id", "created_at"], unique=False)
+
+
+def downgrade():
+    op.drop_index("ix_capsule_user_id_created_at", table_name="capsule")
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from app.passwords import normalizar_metodo
+
+# De menos a más coste dentro de cada familia.
+CANDIDATOS = (
+    "pbkdf2:sha256:210000",
+    "pbkdf2:sha256:300000",
+    "pbkdf2:sha256:600000",
+    "pbkdf2:sha256:1000000",
+    "scrypt:16384:8:1",
+    "scrypt:32768:8:1",
+    "scrypt:65536:8:1",
+)
+
+
+def medir(metodo: str, repeticiones: int) -> float:
+    """Mediana en ms de verificar una contraseña (lo que cuesta cada login)."""
+    password_hash = generate_password_hash("contraseña-de-prueba", method=metodo)
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        check_password_hash(password_hash, "contraseña-de-prueba")
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tiempos)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Mide el coste de cada método de hash y propone uno para PASSWORD_HASH_METHOD.")
+    parser.add_argument("--budget-ms", type=float, default=250.0, help="Tiempo máximo por login (por defecto 250 ms).")
+    parser.add_argument("--repeticiones", type=int, default=5, help="Verificaciones por método (por defecto 5).")
+    parser.add_argument("--metodo", action="append", help="Método a medir (repetible); por defecto, una lista de candidatos.")
+    args = parser.parse_args()
+
+    candidatos = args.metodo or list(CANDIDATOS)
+    resultados = []
+    print(f"{'Método':<26}{'ms':>10}")
+    for metodo in candidatos:
+        ms = medir(metodo, args.repeticiones)
+        resultados.append((metodo, ms))
+        print(f"{normalizar_metodo(metodo):<26}{ms:>10.1f}")
+
+    # El más caro que cabe en el presupuesto: más coste = más resistencia a fuerza bruta.
+    dentro = [(metodo, ms) for metodo, ms in resultados if ms <= args.budget_ms]
+    print()
+    if not dentro:
+        print(f"[AVISO] Ningún método cabe en {args.budget_ms:.0f} ms en esta máquina.")
+        return 1
+    metodo, ms = max(dentro, key=lambda item: item[1])
+    print(f"[OK] PASSWORD_HASH_METHOD={normalizar_metodo(metodo)} ({ms:.0f} ms por login)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import os
+import posixpath
+import re
+import shutil
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from app.assets import BUILD_DIR, MANIFEST_NAME
+
+STATIC_DIR = os.path.join(BASE_DIR, "static")
+OMITIR = ("uploads/", f"{BUILD_DIR}/")
+# Imágenes grandes de portada/fondo: ancho máximo (px) al que se reducen, con WebP/AVIF al lado.
+HERO_IMAGES = {
+    "fondo_home.png": 1280,
+    "portada_eco.jpg": 960,
+    "vinilo_eco.png": 480,
+    "superlogo_luna.png": 400,
+}
+COMPRIMIBLES = (".css", ".js", ".svg", ".json", ".txt", ".map")
+MIN_BYTES_COMPRIMIR = 1024
+CSS_URL_RE = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+
+
+def huella(contenido: bytes) -> str:
+    return hashlib.sha256(contenido).hexdigest()[:12]
+
+
+def nombre_con_huella(path_relativo: str, contenido: bytes, ext: str | None = None) -> str:
+    base, ext_original = posixpath.splitext(path_relativo)
+    return f"{BUILD_DIR}/{base}.{huella(contenido)}{ext or ext_original}"
+
+
+def listar_assets() -> list[str]:
+    assets = []
+    for raiz, _, ficheros in os.walk(STATIC_DIR):
+        for nombre in sorted(ficheros):
+            if nombre.startswith(".") or nombre.endswith(".tmp"):
+                continue
+            path_relativo = os.path.relpath(os.path.join(raiz, nombre), STATIC_DIR).replace(os.sep, "/")
+            if not path_relativo.startswith(OMITIR):
+                assets.append(path_relativo)
+    return assets
+
+
+def escribir(path_relativo: str, contenido: bytes) -> None:
+    destino = os.path.join(STATIC_DIR, path_relativo)
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    with open(destino, "wb") as fichero:
+        fichero.write(contenido)
+
+
+def optimizar_hero(path_relativo: str, contenido: bytes, ancho: int) -> tuple[str, dict[str, bytes]]:
+    """Reduce la imagen a `ancho` y la codifica para navegadores antiguos (su formato, o JPEG si es un
+    PNG sin transparencia), WebP y, si Pillow puede, AVIF. Devuelve la extensión del respaldo."""
+    from PIL import Image, ImageOps, features
+
+    with Image.open(io.BytesIO(contenido)) as original:
+        imagen = ImageOps.exif_transpose(original)
+        imagen.load()
+    imagen.thumbnail((ancho, ancho * 4))
+
+    salidas = {}
+    ext = posixpath.splitext(path_relativo)[1].lower()
+    buffer = io.BytesIO()
+    if ext in (".jpg", ".jpeg") or imagen.mode == "RGB":
+        ext = ".jpg"
+        imagen.convert("RGB").save(buffer, "JPEG", quality=82, optimize=True, progressive=True)
+    else:
+        imagen.save(buffer, "PNG", optimize=True)
+    # Si reducir no ahorra nada, se queda el original.
+    if buffer.tell() < len(contenido):
+        salidas["original"] = buffer.getvalue()
+    else:
+        ext = posixpath.splitext(path_relativo)[1]
+        salidas["original"] = contenido
+
+    buffer = io.BytesIO()
+    imagen.save(buffer, "WEBP", quality=80, method=6)
+    salidas["webp"] = buffer.getvalue()
+    if features.check("avif"):
+        buffer = io.BytesIO()
+        imagen.save(buffer, "AVIF", quality=55)
+        salidas["avif"] = buffer.getvalue()
+    return ext, salidas
+
+
+def reescribir_urls_css(path_relativo: str, css: str, files: dict[str, str]) -> str:
+    """Apunta los url(...) del CSS a las copias con huella."""
+
+    def sustituir(match: re.Match) -> str:
+        ref = match.group(2).strip()
+        if ref.startswith(("data:", "http:", "https:", "//", "#")):
+            return match.group(0)
+        ruta = ref.split("?", 1)[0].split("#", 1)[0]
+        if ruta.startswith("/static/"):
+            clave = ruta[len("/static/") :]
+        else:
+            clave = posixpath.normpath(posixpath.join(posixpath.dirname(path_relativo), ruta))
+        destino = files.get(clave)
+        if destino is None:
+            return match.group(0)
+        return f"url('/static/{destino}')"
+
+    return CSS_URL_RE.sub(sustituir, css)
+
+
+def precomprimir(path_relativo: str, contenido: bytes, brotli) -> list[str]:
+    generados = []
+    comprimido = gzip.compress(contenido, compresslevel=9, mtime=0)
+    if len(comprimido) < len(contenido):
+        escribir(path_relativo + ".gz", comprimido)
+        generados.append("gz")
+    if brotli is not None:
+        comprimido = brotli.compress(contenido, quality=11)
+        if len(comprimido) < len(contenido):
+            escribir(path_relativo + ".br", comprimido)
+            generados.append("br")
+    return generados
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Copia static/ a static/build/ con huella en el nombre, precomprime y optimiza las imágenes de portada."
+    )
+    parser.add_argument("--sin-imagenes", action="store_true", help="No reduce ni convierte las imágenes de portada.")
+    args = parser.parse_args()
+
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+        print("[AVISO] Brotli no está instalado; solo se genera gzip.")
+
+    build_abs = os.path.join(STATIC_DIR, BUILD_DIR)
+    shutil.rmtree(build_abs, ignore_errors=True)
+
+    files: dict[str, str] = {}
+    variants: dict[str, dict[str, str]] = {}
+    bytes_origen = 0
+    bytes_build = 0
+    comprimidos = 0
+    assets = listar_assets()
+    # El CSS va al final: sus url(...) tienen que apuntar ya a las imágenes con huella.
+    assets.sort(key=lambda p: p.endswith(".css"))
+
+    for path_relativo in assets:
+        with open(os.path.join(STATIC_DIR, path_relativo), "rb") as fichero:
+            contenido = fichero.read()
+        bytes_origen += len(contenido)
+
+        if path_relativo.endswith(".css"):
+            contenido = reescribir_urls_css(path_relativo, contenido.decode("utf-8"), files).encode("utf-8")
+
+        ext = None
+        if path_relativo in HERO_IMAGES and not args.sin_imagenes:
+            ext, salidas = optimizar_hero(path_relativo, contenido, HERO_IMAGES[path_relativo])
+            contenido = salidas.pop("original")
+            for formato, datos in salidas.items():
+                destino = nombre_con_huella(path_relativo, datos, f".{formato}")
+                escribir(destino, datos)
+                variants.setdefault(path_relativo, {})[formato] = destino
+            print(
+                f"[HERO] {path_relativo}: "
+                + ", ".join(f"{f} {len(d) / 1024:.0f} KB" for f, d in [("original", contenido), *salidas.items()])
+            )
+
+        destino = nombre_con_huella(path_relativo, contenido, ext)
+        escribir(destino, contenido)
+        files[path_relativo] = destino
+        bytes_build += len(contenido)
+        if path_relativo.endswith(COMPRIMIBLES) and len(contenido) >= MIN_BYTES_COMPRIMIR:
+            if precomprimir(destino, contenido, brotli):
+                comprimidos += 1
+
+    with open(os.path.join(build_abs, MANIFEST_NAME), "w", encoding="utf-8") as fichero:
+        json.dump({"files": files, "variants": variants}, fichero, indent=2, sort_keys=True)
+
+    print(f"[OK] Assets con huella: {len(files)} (precomprimidos: {comprimidos})")
+    print(f"[OK] Tamaño: {bytes_origen / (1024 * 1024):.1f} MB -> {bytes_build / (1024 * 1024):.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import tempfile
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from sqlalchemy import and_, or_, select, update
+
+from app import create_app, db
+from app.images import VARIANTES, ImagenRechazada, generar_variantes, ruta_variante
+from app.models import Memory, User
+from app.storage import StorageError, get_storage
+
+SUFIJOS_VARIANTE = tuple(f".{variante}.webp" for variante in VARIANTES)
+LOTE_VERSIONES = 500
+
+
+def inventario(storage) -> dict[str, set[str]]:
+    """Originales de uploads/ con las variantes que ya tienen, en un solo listado del storage."""
+    originales: dict[str, set[str]] = {}
+    por_base: dict[str, set[str]] = {}
+    for key, _, _ in storage.listar("uploads"):
+        if os.path.basename(key).startswith(".") or key.endswith(".tmp"):
+            continue
+        for variante, sufijo in zip(VARIANTES, SUFIJOS_VARIANTE):
+            if key.endswith(sufijo):
+                por_base.setdefault(key[: -len(sufijo)], set()).add(variante)
+                break
+        else:
+            originales[key] = set()
+    for original in originales:
+        originales[original] = set(por_base.get(os.path.splitext(original)[0], ()))
+    return originales
+
+
+def generar_desde_storage(storage, path_relativo: str) -> list[str]:
+    """Baja el original a un temporal local, genera sus variantes y lo descarta."""
+    fd, tmp_path = tempfile.mkstemp(suffix=os.path.splitext(path_relativo)[1])
+    os.close(fd)
+    try:
+        storage.descargar(path_relativo, tmp_path)
+        return generar_variantes(path_relativo, tmp_path)
+    except (ImagenRechazada, StorageError):
+        return []
+    finally:
+        os.remove(tmp_path)
+
+
+def registrar_variantes(existentes: dict[str, set[str]]) -> int:
+    """Guarda en cada recuerdo las variantes que tiene su foto y sube library_version de quien haya
+    cambiado: su biblioteca ya no se pinta igual, así que ETags y HTML cacheados dejan de valer.
+    Devuelve cuántos usuarios."""
+    por_valor: dict[str, list[str]] = {}
+    for path_relativo, variantes in existentes.items():
+        valor = ",".join(v for v in VARIANTES if v in variantes)
+        por_valor.setdefault(valor, []).append(path_relativo)
+
+    duenos: set[int] = set()
+    for valor, paths in por_valor.items():
+        for inicio in range(0, len(paths), LOTE_VERSIONES):
+            lote = paths[inicio : inicio + LOTE_VERSIONES]
+            distinto = and_(
+                Memory.foto_personal.in_(lote),
+                or_(Memory.foto_variantes.is_(None), Memory.foto_variantes != valor),
+            )
+            duenos.update(db.session.scalars(select(Memory.user_id).where(distinto).distinct()))
+            db.session.execute(update(Memory).where(distinto).values(foto_variantes=valor))
+
+    ids = sorted(duenos)
+    for inicio in range(0, len(ids), LOTE_VERSIONES):
+        lote = ids[inicio : inicio + LOTE_VERSIONES]
+        db.session.execute(
+            update(User).where(User.id.in_(lote)).values(library_version=User.library_version + 1)
+        )
+    db.session.commit()
+    return len(ids)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Genera las miniaturas WebP de las fotos ya subidas al storage.")
+    parser.add_argument("--force", action="store_true", help="Regenera también las que ya tienen variantes.")
+    parser.add_argument("--dry-run", action="store_true", help="Solo lista lo que se generaría.")
+    args = parser.parse_args()
+
+    app = create_app()
+    generadas = []
+    fallidas = 0
+    with app.app_context():
+        storage = get_storage()
+        existentes = inventario(storage)
+        pendientes = [p for p, hechas in existentes.items() if args.force or len(hechas) < len(VARIANTES)]
+        for path_relativo in pendientes:
+            if args.dry_run:
+                print(f"[SIMULACION] {path_relativo}")
+                continue
+            claves = generar_desde_storage(storage, path_relativo)
+            if claves:
+                generadas.append(path_relativo)
+                existentes[path_relativo] |= {v for v in VARIANTES if ruta_variante(path_relativo, v) in claves}
+            else:
+                fallidas += 1
+                print(f"[ERROR] {path_relativo}")
+        # También registra las fotos que ya tenían variantes de antes de guardarlas en el recuerdo.
+        usuarios = 0 if args.dry_run else registrar_variantes(existentes)
+
+    mode = "SIMULACION" if args.dry_run else "OK"
+    print(f"[{mode}] Fotos pendientes: {len(pendientes)}")
+    print(f"[{mode}] Con miniaturas generadas: {len(generadas)}")
+    print(f"[{mode}] Bibliotecas actualizadas: {usuarios}")
+    print(f"[{mode}] Fallidas: {fallidas}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
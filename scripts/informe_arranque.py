@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Módulos que no deberían cargarse al arrancar un worker: se importan en su primer uso.
+DIFERIDOS = ("requests", "alembic", "flask_migrate", "PIL", "brotli")
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+\d+ \| \s*(\S+)$")
+ARRANQUE = """
+import sys, time
+inicio = time.perf_counter()
+from app import create_app
+importado = time.perf_counter()
+create_app()
+fin = time.perf_counter()
+print(f"{(importado - inicio) * 1000:.1f} {(fin - importado) * 1000:.1f}")
+print(" ".join(sorted(m for m in sys.modules if "." not in m)))
+"""
+
+
+def medir_arranque() -> tuple[float, float, dict[str, float], set[str]]:
+    """Arranca la app en un proceso limpio con -X importtime.
+
+    Devuelve (ms de imports, ms de create_app, ms acumulados por paquete raíz, módulos cargados).
+    """
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    env.pop("FLASK_RUN_FROM_CLI", None)
+    proceso = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", ARRANQUE],
+        cwd=BASE_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    por_paquete: dict[str, float] = defaultdict(float)
+    for linea in proceso.stderr.splitlines():
+        match = IMPORTTIME_RE.match(linea)
+        # Tiempo propio de cada módulo sumado por paquete raíz: "flask.json" cuenta para flask,
+        # aunque lo haya arrastrado app.main.
+        if match:
+            por_paquete[match.group(2).split(".")[0]] += int(match.group(1)) / 1000
+    tiempos, modulos = proceso.stdout.strip().splitlines()[-2:]
+    ms_imports, ms_create_app = (float(t) for t in tiempos.split())
+    return ms_imports, ms_create_app, dict(por_paquete), set(modulos.split())
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Informe del tiempo de arranque: imports por paquete y create_app().")
+    parser.add_argument("--top", type=int, default=15, help="Paquetes a listar (por defecto 15).")
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=float(os.getenv("STARTUP_BUDGET_MS", "1500")),
+        help="Presupuesto de arranque en ms; si se supera, sale con código 1 (por defecto 1500).",
+    )
+    args = parser.parse_args()
+
+    ms_imports, ms_create_app, por_paquete, modulos = medir_arranque()
+    total = ms_imports + ms_create_app
+
+    print(f"{'Paquete':<28}{'ms':>10}")
+    for paquete, ms in sorted(por_paquete.items(), key=lambda item: item[1], reverse=True)[: args.top]:
+        print(f"{paquete:<28}{ms:>10.1f}")
+    print()
+    print(f"[OK] Imports: {ms_imports:.0f} ms")
+    print(f"[OK] create_app(): {ms_create_app:.0f} ms")
+
+    cargados = [m for m in DIFERIDOS if m in modulos]
+    if cargados:
+        print(f"[AVISO] Se cargan al arrancar y deberían diferirse: {', '.join(cargados)}")
+    if total > args.budget_ms:
+        print(f"[ERROR] Arranque {total:.0f} ms > presupuesto {args.budget_ms:.0f} ms")
+        return 1
+    print(f"[OK] Arranque {total:.0f} ms (presupuesto {args.budget_ms:.0f} ms)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
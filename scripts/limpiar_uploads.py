@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from app import create_app
+from app.images import VARIANTES, borrar_variantes
+from app.main import foto_referenciada
+from app.storage import get_storage
+
+SUFIJOS_VARIANTE = tuple(f".{variante}.webp" for variante in VARIANTES)
+
+
+def listar_originales(storage) -> list[tuple[str, int, float]]:
+    """(key, tamaño, mtime) de cada original bajo uploads/, sin sus variantes."""
+    return [
+        (key, tamano, mtime)
+        for key, tamano, mtime in storage.listar("uploads")
+        if not os.path.basename(key).startswith(".") and not key.endswith(SUFIJOS_VARIANTE)
+    ]
+
+
+def limpiar_huerfanas(storage, limite: float, dry_run: bool = False, informar=print) -> tuple[int, int]:
+    """Borra los originales (y sus variantes) sin referencias y sin tocar desde antes de `limite`,
+    y los temporales de subidas interrumpidas igual de antiguos.
+
+    Es el único sitio que borra fotos: las rutas solo sueltan la referencia. Una subida que
+    reutiliza un blob le renueva la fecha (storage.tocar), así que mientras guarda su referencia
+    queda dentro del periodo de gracia y aquí no se considera huérfano.
+    """
+    borradas = 0
+    liberados = 0
+    for path_relativo, tamano, mtime in listar_originales(storage):
+        # Temporales de subidas interrumpidas o blobs sin referencia.
+        if mtime > limite:
+            continue
+        if not path_relativo.endswith(".tmp") and foto_referenciada(path_relativo):
+            continue
+
+        borradas += 1
+        liberados += tamano
+        if dry_run:
+            informar(f"[SIMULACION] {path_relativo}")
+            continue
+        storage.borrar(path_relativo)
+        borrar_variantes(path_relativo)
+
+    # Temporales de subidas interrumpidas, que no están bajo uploads/.
+    for ruta, tamano, mtime in storage.temporales():
+        if mtime > limite:
+            continue
+        borradas += 1
+        liberados += tamano
+        if dry_run:
+            informar(f"[SIMULACION] {ruta}")
+            continue
+        try:
+            os.remove(ruta)
+        except OSError:
+            pass
+    return borradas, liberados
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Borra del storage las fotos que ya no usa ningún recuerdo ni cápsula.")
+    parser.add_argument(
+        "--min-age-hours",
+        type=float,
+        default=1.0,
+        help="Periodo de gracia: no toca ficheros creados o reutilizados hace menos. Por defecto 1 hora.",
+    )
+    parser.add_argument("--dry-run", action="store_true", help="Solo lista lo que se borraría.")
+    args = parser.parse_args()
+
+    limite = time.time() - args.min_age_hours * 3600
+    app = create_app()
+    with app.app_context():
+        borradas, liberados = limpiar_huerfanas(get_storage(), limite, args.dry_run)
+
+    mode = "SIMULACION" if args.dry_run else "OK"
+    print(f"[{mode}] Fotos huérfanas: {borradas}")
+    print(f"[{mode}] Espacio liberado: {liberados / (1024 * 1024):.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
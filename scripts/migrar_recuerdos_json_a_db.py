@@ -2,21 +2,27 @@
 from __future__ import annotations
 
 import argparse
+import hashlib
 import json
 import os
 import sys
-import uuid
+import time
+from collections.abc import Iterator
 from datetime import datetime
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if BASE_DIR not in sys.path:
     sys.path.insert(0, BASE_DIR)
 
+from sqlalchemy import insert, select, update
+
 from app import create_app, db
-from app.models import Memory, User
+from app.models import Memory, User, anio_desde_fecha
 
 LEGACY_JSON_PATH = os.path.join(BASE_DIR, "data", "backup", "recuerdos_legacy.json")
 LEGACY_JSON_OLD_PATH = os.path.join(BASE_DIR, "data", "recuerdos.json")
+BATCH_SIZE = 500
+READ_CHUNK_BYTES = 64 * 1024
 
 
 def parse_fecha(fecha_raw: str | None) -> tuple[str, datetime]:
@@ -31,72 +37,220 @@ def parse_fecha(fecha_raw: str | None) -> tuple[str, datetime]:
         return fecha[:20], datetime.utcnow()
 
 
-def load_legacy_recuerdos(path: str) -> list[dict]:
+def resolver_ruta(path: str) -> str:
     if path == LEGACY_JSON_PATH and not os.path.exists(path) and os.path.exists(LEGACY_JSON_OLD_PATH):
-        path = LEGACY_JSON_OLD_PATH
-    if not os.path.exists(path):
-        return []
-    try:
-        with open(path, "r", encoding="utf-8") as fh:
-            data = json.load(fh)
-    except (OSError, json.JSONDecodeError):
-        return []
-    return data if isinstance(data, list) else []
+        return LEGACY_JSON_OLD_PATH
+    return path
+
+
+def iterar_recuerdos_legacy(path: str, chunk_bytes: int = READ_CHUNK_BYTES) -> Iterator[object]:
+    """Recorre el array JSON de nivel superior elemento a elemento, sin cargar el fichero entero.
+
+    Lee a bloques y decodifica cada elemento con raw_decode; si uno queda cortado al final del
+    bloque, lee el siguiente y lo reintenta. Un fichero que no es un array no produce nada.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as fh:
+        buffer = ""
+        pos = 0
+        fin = False
+        dentro = False
+
+        def rellenar() -> bool:
+            nonlocal buffer, pos, fin
+            bloque = fh.read(chunk_bytes)
+            buffer = buffer[pos:] + bloque
+            pos = 0
+            fin = not bloque
+            return bool(bloque)
+
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buffer):
+                if fin or not rellenar():
+                    return
+                continue
+            if not dentro:
+                if buffer[pos] != "[":
+                    return
+                dentro = True
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                return
+            try:
+                elemento, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Elemento partido entre bloques: con más texto se vuelve a intentar.
+                if fin or not rellenar():
+                    raise
+                continue
+            yield elemento
 
 
 def resolve_user(email: str | None, user_id: int | None) -> User | None:
     if email:
         return User.query.filter_by(email=email.strip().lower()).first()
     if user_id:
-        return User.query.get(user_id)
+        return db.session.get(User, user_id)
     return None
 
 
-def migrate_for_user(target_user: User, legacy_recuerdos: list[dict], dry_run: bool) -> tuple[int, int]:
-    inserted = 0
-    skipped = 0
+def id_estable(user_id: int, raw: dict) -> str:
+    # Sin id en el JSON, uno derivado del contenido: repetir la importación no duplica recuerdos.
+    huella = json.dumps(
+        [user_id, raw.get("titulo"), raw.get("cancion"), raw.get("nota"), raw.get("fecha")], ensure_ascii=False
+    )
+    return hashlib.sha1(huella.encode("utf-8")).hexdigest()[:32]
 
-    for raw in legacy_recuerdos:
-        if not isinstance(raw, dict):
-            skipped += 1
-            continue
 
-        titulo = (raw.get("titulo") or "").strip()
-        cancion = (raw.get("cancion") or "").strip()
-        nota = (raw.get("nota") or "").strip()
-        if not titulo or not cancion or not nota:
-            skipped += 1
-            continue
+def fila_memory(target_user: User, raw: object) -> dict | None:
+    """Fila lista para el INSERT, o None si el registro no es válido."""
+    if not isinstance(raw, dict):
+        return None
+    titulo = (raw.get("titulo") or "").strip()
+    cancion = (raw.get("cancion") or "").strip()
+    nota = (raw.get("nota") or "").strip()
+    if not titulo or not cancion or not nota:
+        return None
+
+    fecha, created_at = parse_fecha(raw.get("fecha"))
+    fecha = fecha[:20]
+    return {
+        "id": (raw.get("id") or "").strip()[:32] or id_estable(target_user.id, raw),
+        "user_id": target_user.id,
+        "titulo": titulo[:255],
+        "cancion": cancion[:255],
+        "artista": (raw.get("artista") or "").strip() or None,
+        "spotify_url": (raw.get("spotify_url") or "").strip() or None,
+        "portada": (raw.get("portada") or "").strip() or None,
+        "preview_url": (raw.get("preview_url") or "").strip() or None,
+        "nota": nota,
+        "foto_personal": (raw.get("foto_personal") or "").strip() or None,
+        "fecha": fecha,
+        "favorito": bool(raw.get("favorito")),
+        # El INSERT en bloque no pasa por el @validates de Memory: el año se calcula aquí.
+        "year": anio_desde_fecha(fecha),
+        "created_at": created_at,
+    }
+
+
+def insert_ignorando_existentes():
+    """INSERT que se salta los ids ya presentes: ON CONFLICT DO NOTHING o INSERT OR IGNORE."""
+    dialecto = db.engine.dialect.name
+    if dialecto == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+        return pg_insert(Memory).on_conflict_do_nothing(index_elements=[Memory.id])
+    if dialecto == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+        return sqlite_insert(Memory).on_conflict_do_nothing(index_elements=[Memory.id])
+    return insert(Memory)
 
-        memory_id = (raw.get("id") or "").strip()[:32] or uuid.uuid4().hex
-        if Memory.query.filter_by(id=memory_id).first():
-            skipped += 1
-            continue
 
-        fecha, created_at = parse_fecha(raw.get("fecha"))
-        record = Memory(
-            id=memory_id,
-            user_id=target_user.id,
-            titulo=titulo[:255],
-            cancion=cancion[:255],
-            artista=((raw.get("artista") or "").strip() or None),
-            spotify_url=((raw.get("spotify_url") or "").strip() or None),
-            portada=((raw.get("portada") or "").strip() or None),
-            preview_url=((raw.get("preview_url") or "").strip() or None),
-            nota=nota,
-            foto_personal=((raw.get("foto_personal") or "").strip() or None),
-            fecha=fecha[:20],
-            favorito=bool(raw.get("favorito")),
-            created_at=created_at,
+def insertar_lote(target_user: User, filas: list[dict], dry_run: bool) -> int:
+    """Inserta las filas cuyo id aún no existe; devuelve cuántas entraron."""
+    por_id = {fila["id"]: fila for fila in filas}
+    existentes = set(db.session.scalars(select(Memory.id).where(Memory.id.in_(por_id))))
+    nuevas = [fila for memory_id, fila in por_id.items() if memory_id not in existentes]
+    if not nuevas or dry_run:
+        return len(nuevas)
+    resultado = db.session.connection().execute(insert_ignorando_existentes(), nuevas)
+    # Otro proceso pudo insertar alguno entre el SELECT y el INSERT; si el driver da el recuento, se usa.
+    insertadas = resultado.rowcount if resultado.supports_sane_multi_rowcount() else len(nuevas)
+    if insertadas:
+        # Misma transacción que los recuerdos: ETags y cachés de la biblioteca dejan de valer.
+        db.session.execute(
+            update(User).where(User.id == target_user.id).values(library_version=User.library_version + 1)
         )
-        db.session.add(record)
-        inserted += 1
+    return insertadas
 
-    if dry_run:
-        db.session.rollback()
-    else:
+
+def leer_checkpoint(path: str | None, json_path: str, user_id: int) -> dict:
+    vacio = {"json_path": os.path.abspath(json_path), "user_id": user_id, "procesados": 0, "insertados": 0, "omitidos": 0}
+    if not path or not os.path.exists(path):
+        return vacio
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            checkpoint = json.load(fh)
+    except (OSError, json.JSONDecodeError):
+        return vacio
+    # Un checkpoint de otro fichero u otra cuenta no sirve para reanudar esta importación.
+    if checkpoint.get("json_path") != vacio["json_path"] or checkpoint.get("user_id") != user_id:
+        return vacio
+    return {**vacio, **checkpoint}
+
+
+def guardar_checkpoint(path: str | None, checkpoint: dict) -> None:
+    if not path:
+        return
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(checkpoint, fh)
+    os.replace(tmp, path)
+
+
+def migrate_for_user(
+    target_user: User,
+    legacy_recuerdos,
+    dry_run: bool,
+    batch_size: int = BATCH_SIZE,
+    checkpoint_path: str | None = None,
+    json_path: str = LEGACY_JSON_PATH,
+    progreso=print,
+) -> tuple[int, int]:
+    """Importa en lotes de `batch_size` con un commit (y un checkpoint) por lote.
+
+    Si hay checkpoint de una ejecución anterior interrumpida, se saltan los registros ya
+    procesados; aun sin él la importación es idempotente, porque los ids existentes se omiten.
+    """
+    checkpoint = leer_checkpoint(None if dry_run else checkpoint_path, json_path, target_user.id)
+    reanudar_desde = checkpoint["procesados"]
+    if reanudar_desde:
+        progreso(f"[INFO] Reanudando tras {reanudar_desde} registros ya procesados.")
+    inserted = checkpoint["insertados"]
+    skipped = checkpoint["omitidos"]
+    procesados = 0
+    inicio = time.perf_counter()
+    lote: list[dict] = []
+
+    def cerrar_lote() -> None:
+        nonlocal inserted, skipped
+        if lote:
+            nuevos = insertar_lote(target_user, lote, dry_run)
+            inserted += nuevos
+            skipped += len(lote) - nuevos
+            lote.clear()
+        if dry_run:
+            db.session.rollback()
+            return
         db.session.commit()
+        checkpoint.update(procesados=procesados, insertados=inserted, omitidos=skipped)
+        guardar_checkpoint(checkpoint_path, checkpoint)
+        segundos = time.perf_counter() - inicio
+        nuevos_procesados = procesados - reanudar_desde
+        progreso(
+            f"[PROGRESO] {procesados} procesados, {inserted} insertados, {skipped} omitidos"
+            f" ({nuevos_procesados / segundos if segundos else 0:.0f} registros/s)"
+        )
 
+    for raw in legacy_recuerdos:
+        procesados += 1
+        if procesados <= reanudar_desde:
+            continue
+        fila = fila_memory(target_user, raw)
+        if fila is None:
+            skipped += 1
+        else:
+            lote.append(fila)
+        if len(lote) >= batch_size:
+            cerrar_lote()
+    cerrar_lote()
+
+    if checkpoint_path and not dry_run and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
     return inserted, skipped
 
 
@@ -110,11 +264,23 @@ def main() -> int:
         help="Ruta del JSON legacy (por defecto data/backup/recuerdos_legacy.json).",
     )
     parser.add_argument("--dry-run", action="store_true", help="Simula la migración sin guardar cambios.")
+    parser.add_argument(
+        "--batch-size", type=int, default=BATCH_SIZE, help=f"Registros por lote y commit (por defecto {BATCH_SIZE})."
+    )
+    parser.add_argument(
+        "--checkpoint",
+        help="Fichero de checkpoint para reanudar una importación interrumpida (por defecto <json>.checkpoint).",
+    )
     args = parser.parse_args()
 
     if not args.email and not args.user_id:
         parser.error("Debes indicar --email o --user-id.")
 
+    json_path = resolver_ruta(args.json_path)
+    if not os.path.exists(json_path):
+        print(f"No hay recuerdos para migrar en {args.json_path}.")
+        return 0
+
     app = create_app()
     with app.app_context():
         user = resolve_user(args.email, args.user_id)
@@ -122,16 +288,27 @@ def main() -> int:
             print("Usuario no encontrado.")
             return 1
 
-        recuerdos = load_legacy_recuerdos(args.json_path)
-        if not recuerdos:
-            print(f"No hay recuerdos para migrar en {args.json_path}.")
-            return 0
+        inicio = time.perf_counter()
+        try:
+            inserted, skipped = migrate_for_user(
+                user,
+                iterar_recuerdos_legacy(json_path),
+                args.dry_run,
+                batch_size=max(1, args.batch_size),
+                checkpoint_path=args.checkpoint or f"{json_path}.checkpoint",
+                json_path=json_path,
+            )
+        except (OSError, json.JSONDecodeError) as exc:
+            print(f"[ERROR] No se pudo leer {json_path}: {exc}")
+            return 1
+        segundos = time.perf_counter() - inicio
 
-        inserted, skipped = migrate_for_user(user, recuerdos, args.dry_run)
         mode = "SIMULACION" if args.dry_run else "OK"
+        total = inserted + skipped
         print(f"[{mode}] Usuario destino: {user.email} (id={user.id})")
         print(f"[{mode}] Insertados: {inserted}")
         print(f"[{mode}] Omitidos: {skipped}")
+        print(f"[{mode}] {total} registros en {segundos:.2f} s ({total / segundos if segundos else 0:.0f} registros/s)")
         return 0
 
 
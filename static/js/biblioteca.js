@@ -17,6 +17,9 @@ const secciones = document.querySelectorAll(".seccion-balda");
 const vacioEl = document.getElementById("bibEmpty");
 const favoritosSection = document.getElementById("favoritosSection");
 const favoritosShelf = document.getElementById("favoritosShelf");
+const todosShelf = document.getElementById("todosShelf");
+const bibMas = document.getElementById("bibMas");
+const statsEl = document.getElementById("bibStats");
 
 const editarTitulo = document.getElementById("editarTitulo");
 const editarCancion = document.getElementById("editarCancion");
@@ -31,6 +34,9 @@ const detalleEditor = document.getElementById("detalleEditor");
 
 let recuerdoActivoId = null;
 let toastTimer = null;
+let siguienteCursor = bibMas?.dataset.nextCursor || "";
+let cargandoPagina = null;
+let observerPaginas = null;
 
 function showToast(msg, tipo = "ok") {
   if (!toastEl) return;
@@ -142,6 +148,140 @@ function refrescarVistaBiblioteca() {
   aplicarFiltroYBusqueda();
 }
 
+async function refrescarStats() {
+  try {
+    const resp = await fetch("/biblioteca/stats");
+    const data = await resp.json();
+    if (!resp.ok || !data.ok) return;
+    if (statsEl) statsEl.textContent = `${data.total} recuerdos · ${data.favoritos} favoritos`;
+    if (filtroAnio) {
+      const seleccionado = filtroAnio.value;
+      filtroAnio.querySelectorAll("option[value]:not([value=''])").forEach((opt) => opt.remove());
+      (data.por_ano || []).forEach((a) => {
+        const opt = document.createElement("option");
+        opt.value = a.year;
+        opt.textContent = `${a.year} (${a.total})`;
+        filtroAnio.appendChild(opt);
+      });
+      filtroAnio.value = seleccionado;
+    }
+  } catch (_) {}
+}
+
+function crearVinilo(r) {
+  const vinilo = document.createElement("button");
+  vinilo.className = "vinilo-lomo";
+  vinilo.type = "button";
+  Object.assign(vinilo.dataset, {
+    id: r.id,
+    titulo: r.titulo || "",
+    cancion: r.cancion || "",
+    artista: r.artista || "",
+    fecha: r.fecha || "",
+    year: r.year || "Sin año",
+    cover: r.cover || "",
+    coverDetalle: r.cover_detalle || r.cover || "",
+    foto: r.foto_personal ? "1" : "0",
+    nota: r.nota || "",
+    preview: r.preview_url || "",
+    favorito: r.favorito ? "1" : "0"
+  });
+
+  vinilo.innerHTML = `
+    <span class="vinilo-fav" data-fav-toggle role="button" tabindex="0" aria-label="Marcar favorito">★</span>
+    <span class="lomo-columna">
+      <span class="lomo-texto-vertical">
+        <span class="lomo-momento"></span>
+      </span>
+      <span class="lomo-marca"></span>
+      <span class="card-meta">
+        <span class="card-meta-texts">
+          <span class="card-momento"></span>
+          <span class="card-cancion"></span>
+        </span>
+      </span>
+    </span>
+  `;
+
+  const estrella = vinilo.querySelector("[data-fav-toggle]");
+  estrella.classList.toggle("es-favorito", !!r.favorito);
+  estrella.setAttribute("aria-pressed", r.favorito ? "true" : "false");
+  vinilo.querySelector(".lomo-momento").textContent = r.nota || r.titulo || "";
+  vinilo.querySelector(".card-momento").textContent = r.nota || r.titulo || "";
+  vinilo.querySelector(".card-cancion").textContent = r.cancion || "";
+
+  const meta = vinilo.querySelector(".card-meta");
+  if (r.cover) {
+    const img = document.createElement("img");
+    img.src = r.cover;
+    if (r.cover_srcset) {
+      img.srcset = r.cover_srcset;
+      img.sizes = "(max-width: 520px) 40vw, 160px";
+    }
+    img.alt = "Foto del recuerdo";
+    img.className = "card-cover-mini";
+    img.loading = "lazy";
+    img.decoding = "async";
+    meta.prepend(img);
+  } else {
+    const vacio = document.createElement("span");
+    vacio.className = "card-cover-empty";
+    vacio.setAttribute("aria-hidden", "true");
+    meta.prepend(vacio);
+  }
+
+  aplicarCoverEnVinilo(vinilo);
+  return vinilo;
+}
+
+function cargarSiguientePagina() {
+  if (cargandoPagina) return cargandoPagina;
+  if (!siguienteCursor || !todosShelf) return Promise.resolve(false);
+
+  cargandoPagina = fetch(`/biblioteca/recuerdos?cursor=${encodeURIComponent(siguienteCursor)}`)
+    .then((resp) => resp.json().then((data) => ({ resp, data })))
+    .then(({ resp, data }) => {
+      if (!resp.ok || !data.ok) throw new Error(data.error || "No se pudieron cargar más recuerdos");
+      (data.recuerdos || []).forEach((r) => {
+        if (!todosShelf.querySelector(`.vinilo-lomo[data-id="${r.id}"]`)) {
+          todosShelf.appendChild(crearVinilo(r));
+        }
+      });
+      siguienteCursor = data.next_cursor || "";
+      reconstruirSeparadores(todosShelf);
+      refrescarVistaBiblioteca();
+      if (observerPaginas && bibMas) {
+        // Volver a observar fuerza otra comprobación por si el final sigue a la vista.
+        observerPaginas.unobserve(bibMas);
+        if (siguienteCursor) observerPaginas.observe(bibMas);
+      }
+      return true;
+    })
+    .catch((err) => {
+      showToast(err.message || "No se pudieron cargar más recuerdos", "error");
+      return false;
+    })
+    .finally(() => {
+      cargandoPagina = null;
+    });
+  return cargandoPagina;
+}
+
+async function cargarTodasLasPaginas() {
+  // Buscar o filtrar por año necesita ver toda la biblioteca, no solo lo ya cargado.
+  while (siguienteCursor) {
+    const ok = await cargarSiguientePagina();
+    if (!ok) break;
+  }
+}
+
+function filtrarBiblioteca() {
+  aplicarFiltroYBusqueda();
+  if ((searchInput?.value || "").trim() || filtroAnio?.value) {
+    cargarTodasLasPaginas();
+  }
+}
+
 function setVista(tipo) {
   if (!bibliotecaMain) return;
   bibliotecaMain.classList.toggle("vista-tarjetas", tipo === "cards");
@@ -154,7 +294,7 @@ function abrirDetalleDesdeVinilo(btn) {
   if (!btn) return;
   recuerdoActivoId = btn.dataset.id || null;
 
-  const cover = btn.dataset.cover || "";
+  const cover = btn.dataset.coverDetalle || btn.dataset.cover || "";
   const cancion = btn.dataset.cancion || "";
   const artista = btn.dataset.artista || "";
   const fecha = btn.dataset.fecha || "";
@@ -203,6 +343,7 @@ function actualizarRecuerdoEnDOM(recuerdo) {
       vinilo.dataset.foto = "1";
       if (recuerdo.foto_url) {
         vinilo.dataset.cover = recuerdo.foto_url;
+        vinilo.dataset.coverDetalle = recuerdo.foto_url_detalle || recuerdo.foto_url;
       }
     }
     aplicarCoverEnVinilo(vinilo);
@@ -271,6 +412,7 @@ async function manejarToggleFavorito(estrella) {
       showToast("Quitado de favoritos");
     }
     refrescarVistaBiblioteca();
+    refrescarStats();
   } catch (err) {
     showToast(err.message || "No se pudo actualizar favorito", "error");
   } finally {
@@ -325,6 +467,7 @@ guardarCambiosBtn?.addEventListener("click", async () => {
       const fotoRes = await subirFotoRecuerdo(recuerdoActivoId, editarFoto.files[0]);
       editRes.recuerdo.foto_personal = fotoRes.foto_personal;
       editRes.recuerdo.foto_url = fotoRes.foto_url;
+      editRes.recuerdo.foto_url_detalle = fotoRes.foto_url_detalle;
       showToast("Recuerdo y foto actualizados");
     } else {
       showToast("Recuerdo actualizado");
@@ -334,6 +477,7 @@ guardarCambiosBtn?.addEventListener("click", async () => {
     const actualizado = document.querySelector(`.vinilo-lomo[data-id="${recuerdoActivoId}"]`);
     abrirDetalleDesdeVinilo(actualizado);
     refrescarVistaBiblioteca();
+    refrescarStats();
   } catch (err) {
     showToast(err.message || "No se pudo guardar", "error");
   } finally {
@@ -358,6 +502,7 @@ borrarRecuerdoBtn?.addEventListener("click", async () => {
 
     cerrarModal();
     refrescarVistaBiblioteca();
+    refrescarStats();
     showToast("Recuerdo borrado");
   } catch (err) {
     showToast(err.message || "No se pudo borrar", "error");
@@ -371,8 +516,8 @@ modal?.addEventListener("click", (e) => {
   if (e.target === modal) cerrarModal();
 });
 
-searchInput?.addEventListener("input", aplicarFiltroYBusqueda);
-filtroAnio?.addEventListener("change", aplicarFiltroYBusqueda);
+searchInput?.addEventListener("input", filtrarBiblioteca);
+filtroAnio?.addEventListener("change", filtrarBiblioteca);
 vistaSelect?.addEventListener("change", () => {
   setVista(vistaSelect.value);
   refrescarVistaBiblioteca();
@@ -410,3 +555,15 @@ document.querySelectorAll(".vinilo-lomo").forEach(aplicarCoverEnVinilo);
 refrescarMood();
 window.setInterval(refrescarMood, 12000);
 refrescarVistaBiblioteca();
+
+if (bibMas && "IntersectionObserver" in window) {
+  observerPaginas = new IntersectionObserver(
+    (entradas) => {
+      if (entradas.some((entrada) => entrada.isIntersecting)) cargarSiguientePagina();
+    },
+    { rootMargin: "600px 0px" }
+  );
+  observerPaginas.observe(bibMas);
+} else {
+  cargarTodasLasPaginas();
+}
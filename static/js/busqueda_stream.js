@@ -0,0 +1,40 @@
+// Lee /buscar_spotify/stream (NDJSON): avisa de cada canción en cuanto llega
+// y después de cada preview_url que va encontrando el servidor.
+async function buscarCancionesStream(query, { onTrack, onPreview, signal } = {}) {
+    const resp = await fetch(`/buscar_spotify/stream?q=${encodeURIComponent(query)}`, { signal });
+    if (!resp.ok || !resp.body) {
+        throw new Error(`Búsqueda fallida (${resp.status})`);
+    }
+
+    const reader = resp.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    let total = 0;
+
+    const procesar = (linea) => {
+        if (!linea.trim()) return;
+        const evento = JSON.parse(linea);
+        if (evento.tipo === "track") {
+            total += 1;
+            onTrack?.(evento.indice, evento.track);
+        } else if (evento.tipo === "preview") {
+            onPreview?.(evento.indice, evento.preview_url);
+        }
+    };
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let salto = buffer.indexOf("\n");
+        while (salto >= 0) {
+            procesar(buffer.slice(0, salto));
+            buffer = buffer.slice(salto + 1);
+            salto = buffer.indexOf("\n");
+        }
+    }
+    procesar(buffer + decoder.decode());
+    return total;
+}
+
+window.buscarCancionesStream = buscarCancionesStream;
@@ -21,6 +21,7 @@ const params = new URLSearchParams(window.location.search);
 const isCrearMode = params.get("crear") === "1";
 
 let timeout = null;
+let busquedaEnCurso = null;
 const HOME_URL = "/";
 
 function abrirPanelNuevoRecuerdo() {
@@ -194,6 +195,66 @@ previewsRecuerdos.forEach((audio) => {
     audio.addEventListener("ended", quitarEfecto);
 });
 
+function crearResultadoSpotify(item) {
+    const track = {
+        titulo: item.titulo || item.nombre || "",
+        artista: item.artista || "",
+        portada: item.portada || "",
+        spotify_url: item.spotify_url || "",
+        preview_url: item.preview_url || ""
+    };
+
+    const resultado = document.createElement("div");
+    resultado.classList.add("spotify-item");
+    const tarjeta = resultado;
+
+    resultado.innerHTML = `
+        <img src="${track.portada}" class="spotify-portada">
+        <div>
+            <strong>${track.titulo}</strong><br>
+            <span>${track.artista}</span>
+            <div class="spotify-preview-slot"></div>
+        </div>
+    `;
+    const slotPreview = resultado.querySelector(".spotify-preview-slot");
+
+    const ponerPreview = (previewUrl) => {
+        track.preview_url = previewUrl || "";
+        slotPreview.innerHTML = track.preview_url
+            ? `<audio class="spotify-preview" controls preload="none" src="${track.preview_url}"></audio>`
+            : `<div class="spotify-vacio">Sin preview</div>`;
+
+        const audio = slotPreview.querySelector("audio");
+        if (audio) {
+            audio.addEventListener("play", () => {
+                tarjeta.classList.add("sonando");
+            });
+
+            audio.addEventListener("pause", () => {
+                tarjeta.classList.remove("sonando");
+            });
+
+            audio.addEventListener("click", (e) => {
+                e.stopPropagation();
+            });
+        }
+    };
+    ponerPreview(track.preview_url);
+
+    resultado.addEventListener("click", () => {
+        tituloCancionInput.value = track.titulo;
+        artistaInput.value = track.artista;
+        spotifyUrlInput.value = track.spotify_url;
+        portadaInput.value = track.portada;
+        previewUrlInput.value = track.preview_url;
+        inputCancion.value = `${track.titulo} - ${track.artista}`;
+        resultadosDiv.innerHTML = "";
+        mostrarCancionSeleccionada(track);
+    });
+
+    return { elemento: resultado, ponerPreview };
+}
+
 inputCancion.addEventListener("input", function () {
     clearTimeout(timeout);
 
@@ -208,75 +269,37 @@ inputCancion.addEventListener("input", function () {
     const query = this.value.trim();
 
     if (query.length < 3) {
+        busquedaEnCurso?.abort();
         resultadosDiv.innerHTML = "";
         return;
     }
 
     timeout = setTimeout(() => {
-        fetch(`/buscar_spotify?q=${encodeURIComponent(query)}`)
-            .then((res) => res.json())
-            .then((data) => {
-                resultadosDiv.innerHTML = "";
-                if (!Array.isArray(data.resultados) || data.resultados.length === 0) {
+        busquedaEnCurso?.abort();
+        const controller = new AbortController();
+        busquedaEnCurso = controller;
+        resultadosDiv.innerHTML = "";
+        const tarjetas = [];
+
+        buscarCancionesStream(query, {
+            signal: controller.signal,
+            onTrack: (indice, item) => {
+                tarjetas[indice] = crearResultadoSpotify(item);
+                resultadosDiv.appendChild(tarjetas[indice].elemento);
+            },
+            onPreview: (indice, previewUrl) => {
+                tarjetas[indice]?.ponerPreview(previewUrl);
+            }
+        })
+            .then((total) => {
+                if (total === 0 && busquedaEnCurso === controller) {
                     resultadosDiv.innerHTML = '<div class="spotify-vacio">Sin resultados para esa búsqueda.</div>';
-                    return;
                 }
-
-                data.resultados.forEach((item) => {
-                    const track = {
-                        titulo: item.titulo || item.nombre || "",
-                        artista: item.artista || "",
-                        portada: item.portada || "",
-                        spotify_url: item.spotify_url || "",
-                        preview_url: item.preview_url || ""
-                    };
-
-                    const resultado = document.createElement("div");
-                    resultado.classList.add("spotify-item");
-                    const tarjeta = resultado;
-
-                    resultado.innerHTML = `
-                        <img src="${track.portada}" class="spotify-portada">
-                        <div>
-                            <strong>${track.titulo}</strong><br>
-                            <span>${track.artista}</span>
-                            ${track.preview_url
-                                ? `<audio class="spotify-preview" controls preload="none" src="${track.preview_url}"></audio>`
-                                : `<div class="spotify-vacio">Sin preview</div>`}
-                        </div>
-                    `;
-
-                    const audio = resultado.querySelector("audio");
-                    if (audio) {
-                        audio.addEventListener("play", () => {
-                            tarjeta.classList.add("sonando");
-                        });
-
-                        audio.addEventListener("pause", () => {
-                            tarjeta.classList.remove("sonando");
-                        });
-
-                        audio.addEventListener("click", (e) => {
-                            e.stopPropagation();
-                        });
-                    }
-
-                    resultado.addEventListener("click", () => {
-                        tituloCancionInput.value = track.titulo;
-                        artistaInput.value = track.artista;
-                        spotifyUrlInput.value = track.spotify_url;
-                        portadaInput.value = track.portada;
-                        previewUrlInput.value = track.preview_url;
-                        inputCancion.value = `${track.titulo} - ${track.artista}`;
-                        resultadosDiv.innerHTML = "";
-                        mostrarCancionSeleccionada(track);
-                    });
-
-                    resultadosDiv.appendChild(resultado);
-                });
             })
             .catch(() => {
-                resultadosDiv.innerHTML = "";
+                if (busquedaEnCurso === controller) {
+                    resultadosDiv.innerHTML = "";
+                }
             });
     }, 300);
 });
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import pytest
+
+from app import create_app, db
+from app.models import User
+
+
+@pytest.fixture()
+def app_env() -> dict[str, str]:
+    """Variables de entorno extra para la app de los tests; cada módulo puede redefinirla."""
+    return {}
+
+
+@pytest.fixture()
+def app(tmp_path, monkeypatch, app_env):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'test_eco.db'}")
+    for nombre, valor in app_env.items():
+        monkeypatch.setenv(nombre, valor)
+    flask_app = create_app()
+    flask_app.config.update(TESTING=True)
+
+    with flask_app.app_context():
+        db.create_all()
+
+    yield flask_app
+
+    scheduler = flask_app.extensions.get("eco_unlock_scheduler")
+    if scheduler is not None:
+        scheduler.detener()
+    with flask_app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture()
+def client(app):
+    return app.test_client()
+
+
+def create_user(app, email: str = "user@test.local") -> User:
+    with app.app_context():
+        u = User(email=email)
+        u.set_password("123456")
+        db.session.add(u)
+        db.session.commit()
+        db.session.refresh(u)
+        return u
+
+
+def login(client, user: User) -> None:
+    with client.session_transaction() as session:
+        session["_user_id"] = str(user.id)
+        session["_fresh"] = True
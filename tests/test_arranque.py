@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import os
+import subprocess
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ARRANQUE = """
+import sys
+import app as paquete
+assert paquete._app is None, "importar el paquete no debe construir la app"
+wsgi_app = paquete.app
+assert paquete.app is wsgi_app
+print(",".join(m for m in ("requests", "alembic", "flask_migrate", "PIL") if m in sys.modules))
+"""
+
+
+def test_single_lazy_app_without_deferred_modules(tmp_path):
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{tmp_path / 'test_eco.db'}"}
+    env.pop("FLASK_RUN_FROM_CLI", None)
+    proceso = subprocess.run(
+        [sys.executable, "-c", ARRANQUE], cwd=BASE_DIR, env=env, capture_output=True, text=True, timeout=60
+    )
+    assert proceso.returncode == 0, proceso.stderr
+    assert proceso.stdout.strip() == ""
+
+
+ARRANQUE_WORKER = """
+import threading
+import wsgi
+print(",".join(sorted(h.name for h in threading.enumerate() if h.name.startswith("eco-"))))
+"""
+
+
+def test_worker_boot_starts_unlock_scheduler(tmp_path):
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{tmp_path / 'test_eco.db'}"}
+    env.pop("FLASK_RUN_FROM_CLI", None)
+    proceso = subprocess.run(
+        [sys.executable, "-c", ARRANQUE_WORKER], cwd=BASE_DIR, env=env, capture_output=True, text=True, timeout=60
+    )
+    assert proceso.returncode == 0, proceso.stderr
+    assert proceso.stdout.strip() == "eco-unlock-scheduler"
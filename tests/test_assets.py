@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import gzip
+import json
+
+import brotli
+import pytest
+from flask import render_template_string, url_for
+
+from app import create_app
+
+
+CSS = b"body{background:url('/static/build/img/noise.abc.png')}" * 40
+
+
+@pytest.fixture()
+def app(tmp_path, monkeypatch):
+    static_dir = tmp_path / "static"
+    build = static_dir / "build"
+    (build / "css").mkdir(parents=True)
+    (build / "css" / "style.0123456789ab.css").write_bytes(CSS)
+    (build / "css" / "style.0123456789ab.css.gz").write_bytes(gzip.compress(CSS, mtime=0))
+    (build / "css" / "style.0123456789ab.css.br").write_bytes(brotli.compress(CSS))
+    (build / "manifest.json").write_text(
+        json.dumps(
+            {
+                "files": {
+                    "css/style.css": "build/css/style.0123456789ab.css",
+                    "fondo_home.png": "build/fondo_home.0123456789ab.jpg",
+                },
+                "variants": {
+                    "fondo_home.png": {
+                        "avif": "build/fondo_home.aaaaaaaaaaaa.avif",
+                        "webp": "build/fondo_home.bbbbbbbbbbbb.webp",
+                    }
+                },
+            }
+        )
+    )
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'test_eco.db'}")
+    monkeypatch.setenv("ASSET_MANIFEST", str(build / "manifest.json"))
+    flask_app = create_app()
+    flask_app.config.update(TESTING=True)
+    flask_app.static_folder = str(static_dir)
+    return flask_app
+
+
+@pytest.fixture()
+def client(app):
+    return app.test_client()
+
+
+def test_url_for_static_points_to_fingerprinted_asset(app):
+    with app.test_request_context():
+        assert url_for("static", filename="css/style.css", v="20260214-4") == "/static/build/css/style.0123456789ab.css"
+        # Lo que no está en el manifest (fotos subidas) se sirve tal cual.
+        assert url_for("static", filename="uploads/ab/cd/x.png") == "/static/uploads/ab/cd/x.png"
+
+        image_set = render_template_string("{{ static_image_set('fondo_home.png') }}")
+        assert image_set.index('type("image/avif")') < image_set.index('type("image/webp")')
+        assert 'url("/static/build/fondo_home.0123456789ab.jpg") type("image/jpeg")' in image_set
+
+
+@pytest.mark.parametrize(
+    ("accept_encoding", "encoding", "cuerpo"),
+    [
+        ("gzip, deflate, br", "br", brotli.compress(CSS)),
+        ("gzip", "gzip", gzip.compress(CSS, mtime=0)),
+        ("identity", None, CSS),
+    ],
+)
+def test_fingerprinted_assets_are_precompressed_and_immutable(client, accept_encoding, encoding, cuerpo):
+    resp = client.get("/static/build/css/style.0123456789ab.css", headers={"Accept-Encoding": accept_encoding})
+    assert resp.status_code == 200
+    assert resp.headers.get("Content-Encoding") == encoding
+    assert resp.mimetype == "text/css"
+    assert resp.get_data() == cuerpo
+    assert resp.headers["Cache-Control"] == "public, max-age=31536000, immutable"
+    assert "Accept-Encoding" in resp.headers["Vary"]
+    resp.close()
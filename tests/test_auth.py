@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import pytest
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, generate_password_hash
+
+import app.passwords as passwords
+from app import create_app, db
+from app.models import User
+from app.rate_limit import MemoryCounterStore, SQLiteCounterStore
+
+
+@pytest.fixture()
+def app_env() -> dict[str, str]:
+    # Coste bajo para que los tests no pasen el rato hasheando.
+    return {"PASSWORD_HASH_METHOD": "pbkdf2:sha256:1000"}
+
+
+def _create_user(app, email: str, password_hash: str) -> None:
+    with app.app_context():
+        db.session.add(User(email=email, password_hash=password_hash))
+        db.session.commit()
+
+
+def _password_hash(app, email: str) -> str:
+    with app.app_context():
+        return User.query.filter_by(email=email).one().password_hash
+
+
+def test_login_rehashes_outdated_password_hash(client, app):
+    _create_user(app, "viejo@test.local", generate_password_hash("123456", method="pbkdf2:sha256:500"))
+
+    fallido = client.post("/login", data={"email": "viejo@test.local", "password": "otra"})
+    assert "auth=login" in fallido.headers["Location"]
+    assert _password_hash(app, "viejo@test.local").startswith("pbkdf2:sha256:500$")
+
+    ok = client.post("/login", data={"email": "viejo@test.local", "password": "123456"})
+    assert ok.status_code == 302 and "auth=login" not in ok.headers["Location"]
+    nuevo = _password_hash(app, "viejo@test.local")
+    assert nuevo.startswith("pbkdf2:sha256:1000$")
+
+    # Con el hash ya al día no se vuelve a escribir.
+    client.post("/logout")
+    client.post("/login", data={"email": "viejo@test.local", "password": "123456"})
+    assert _password_hash(app, "viejo@test.local") == nuevo
+
+
+def test_stronger_password_hashes_are_never_downgraded(client, app):
+    fuertes = {
+        "iteraciones@test.local": generate_password_hash("123456", method="pbkdf2:sha256:2000"),
+        "sha512@test.local": generate_password_hash("123456", method="pbkdf2:sha512:1000"),
+        "scrypt@test.local": generate_password_hash("123456", method="scrypt:1024:8:1"),
+    }
+    for email, password_hash in fuertes.items():
+        _create_user(app, email, password_hash)
+        ok = client.post("/login", data={"email": email, "password": "123456"})
+        assert ok.status_code == 302 and "auth=login" not in ok.headers["Location"]
+        assert _password_hash(app, email) == password_hash
+        client.post("/logout")
+
+    with app.app_context():
+        # Algoritmo más débil o menos coste que el configurado sí se reescribe.
+        assert passwords.necesita_rehash(generate_password_hash("x", method="pbkdf2:sha1:5000"))
+        assert passwords.necesita_rehash(generate_password_hash("x", method="pbkdf2:sha256:999"))
+
+
+def test_default_hash_method_keeps_werkzeug_iterations(monkeypatch, tmp_path):
+    monkeypatch.delenv("PASSWORD_HASH_METHOD", raising=False)
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'default.db'}")
+    flask_app = create_app()
+    with flask_app.app_context():
+        metodo = passwords.normalizar_metodo(passwords.metodo_hash())
+    assert metodo == f"pbkdf2:sha256:{DEFAULT_PBKDF2_ITERATIONS}"
+
+
+def test_password_verification_can_run_in_bounded_pool(app):
+    app.config["PASSWORD_VERIFY_THREADS"] = 2
+    with app.app_context():
+        user = User(email="pool@test.local")
+        user.set_password("123456")
+        assert user.check_password("123456")
+        assert not user.check_password("654321")
+        assert not user.password_needs_rehash()
+        assert app.extensions["eco_hash_pool"]._max_workers == 2
+
+
+def test_login_burst_is_throttled_before_hashing(client, app, monkeypatch):
+    _create_user(app, "victima@test.local", generate_password_hash("123456", method="pbkdf2:sha256:1000"))
+    app.config.update(AUTH_RATE_LIMIT_EMAIL=3, AUTH_RATE_LIMIT_IP=5)
+    hasheos = []
+    original = passwords.check_password_hash
+    monkeypatch.setattr(passwords, "check_password_hash", lambda *a: hasheos.append(1) or original(*a))
+
+    for _ in range(3):
+        assert client.post("/login", data={"email": "victima@test.local", "password": "x"}).status_code == 302
+    bloqueado = client.post("/login", data={"email": "victima@test.local", "password": "123456"})
+    assert bloqueado.status_code == 429
+    assert int(bloqueado.headers["Retry-After"]) > 0
+    assert len(hasheos) == 3
+
+    # Otro email desde la misma IP sigue pasando hasta agotar el límite por IP.
+    assert client.post("/register", data={"email": "nuevo@test.local", "password": "123456"}).status_code == 302
+    client.post("/logout")
+    assert client.post("/forgot-password", data={"email": "a@test.local", "password": "123456", "password2": "123456"}).status_code == 429
+
+    stats = app.extensions["eco_auth_throttle"].stats()
+    assert stats["rechazos"] == {"auth.login_post:email": 1, "auth.forgot_password_post:ip": 1}
+
+
+def test_sliding_window_weighs_previous_window(tmp_path):
+    for store in (MemoryCounterStore(), SQLiteCounterStore(str(tmp_path / "rl.sqlite3"))):
+        assert [store.hit("k", 4, 60, now=600 + i)[0] for i in range(5)] == [True] * 4 + [False]
+        # A mitad de la ventana siguiente la anterior aún pesa 4 * 0.5 = 2: caben dos intentos más.
+        assert [store.hit("k", 4, 60, now=690)[0] for _ in range(3)] == [True, True, False]
+        permitido, retry_after = store.hit("k", 4, 60, now=690)
+        assert not permitido and retry_after == pytest.approx(15)
+        assert store.hit("k", 4, 60, now=900) == (True, 0.0)
+
+
+def test_sqlite_counter_store_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "rl.sqlite3")
+    uno, otro = SQLiteCounterStore(path), SQLiteCounterStore(path)
+    assert uno.hit("ip:1.2.3.4", 2, 60, now=0)[0]
+    assert otro.hit("ip:1.2.3.4", 2, 60, now=1)[0]
+    assert not uno.hit("ip:1.2.3.4", 2, 60, now=2)[0]
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from app import db
+from app.memories import calcular_stats
+from app.models import Memory, User
+from conftest import create_user, login
+
+
+def _create_memories(app, user_id: int, count: int) -> list[str]:
+    base = datetime(2025, 1, 1, 12, 0)
+    ids = []
+    with app.app_context():
+        for i in range(count):
+            # Pares de recuerdos con el mismo created_at para ejercitar el desempate por id.
+            created_at = base + timedelta(minutes=i // 2)
+            m = Memory(
+                id=f"{i:032x}",
+                user_id=user_id,
+                titulo=f"Recuerdo {i}",
+                cancion=f"Cancion {i}",
+                nota=f"Nota {i}",
+                fecha=created_at.strftime("%d/%m/%Y %H:%M"),
+                created_at=created_at,
+            )
+            db.session.add(m)
+            ids.append(m.id)
+        db.session.commit()
+    return ids
+
+
+def test_biblioteca_api_paginates_by_keyset_without_gaps(client, app):
+    user = create_user(app)
+    login(client, user)
+    ids = _create_memories(app, user.id, 7)
+
+    vistos = []
+    cursor = None
+    for _ in range(10):
+        url = "/biblioteca/recuerdos?limit=3" + (f"&cursor={cursor}" if cursor else "")
+        data = client.get(url).get_json()
+        assert data["ok"] is True
+        vistos.extend(r["id"] for r in data["recuerdos"])
+        cursor = data["next_cursor"]
+        if not cursor:
+            break
+
+    assert vistos == list(reversed(ids))
+    assert data["recuerdos"][0]["year"] == "2025"
+
+
+def test_biblioteca_api_rejects_invalid_cursor(client, app):
+    user = create_user(app, email="cursor@test.local")
+    login(client, user)
+
+    resp = client.get("/biblioteca/recuerdos?cursor=no-es-un-cursor")
+    assert resp.status_code == 400
+
+
+def test_biblioteca_page_renders_only_first_shelf(client, app, monkeypatch):
+    monkeypatch.setattr("app.main.BIBLIOTECA_PAGE_SIZE", 2)
+    user = create_user(app, email="shelf@test.local")
+    login(client, user)
+    _create_memories(app, user.id, 5)
+
+    html = client.get("/biblioteca").get_data(as_text=True)
+    assert html.count('class="vinilo-lomo"') == 2
+    assert 'data-next-cursor=""' not in html
+
+
+def test_memory_year_follows_fecha_and_groups_in_db(client, app):
+    user = create_user(app, email="years@test.local")
+    login(client, user)
+    with app.app_context():
+        for i, fecha in enumerate(["03/02/2024 10:00", "04/05/2023 11:00", "05/06/2024 09:30", "sin fecha"]):
+            db.session.add(Memory(id=f"y{i}", user_id=user.id, titulo="t", cancion="c", nota="n", fecha=fecha))
+        db.session.commit()
+        assert db.session.get(Memory, "y3").year is None
+
+    resp = client.patch("/recuerdos/y1", json={"nota": "editada", "fecha": "01/01/2021 00:00"})
+    assert resp.status_code == 200
+
+    with app.app_context():
+        assert db.session.get(Memory, "y1").year == 2021
+        assert [a["year"] for a in calcular_stats(user.id)["por_ano"]] == ["2024", "2021", "Sin año"]
+
+
+def test_biblioteca_stats_are_cached_and_invalidated_on_writes(client, app):
+    user = create_user(app, email="stats@test.local")
+    login(client, user)
+    ids = _create_memories(app, user.id, 3)
+
+    stats = client.get("/biblioteca/stats").get_json()
+    assert stats["total"] == 3
+    assert stats["favoritos"] == 0
+    assert stats["por_ano"] == [{"year": "2025", "total": 3, "favoritos": 0}]
+
+    with app.app_context():
+        # Escritura directa sin pasar por las rutas: la caché sigue sirviendo el valor anterior.
+        db.session.delete(db.session.get(Memory, ids[0]))
+        db.session.commit()
+    assert client.get("/biblioteca/stats").get_json()["total"] == 3
+
+    client.post("/biblioteca/favorito", json={"id": ids[1]})
+    stats = client.get("/biblioteca/stats").get_json()
+    assert stats["total"] == 2
+    assert stats["favoritos"] == 1
+
+
+def test_biblioteca_returns_304_until_library_changes(client, app):
+    user = create_user(app, email="etag@test.local")
+    login(client, user)
+    ids = _create_memories(app, user.id, 2)
+
+    first = client.get("/biblioteca")
+    assert first.status_code == 200
+    assert first.headers["Cache-Control"] == "private, no-cache"
+    etag = first.headers["ETag"]
+
+    again = client.get("/biblioteca", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+
+    client.post("/biblioteca/favorito", json={"id": ids[0]})
+    changed = client.get("/biblioteca", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    with app.app_context():
+        assert db.session.get(User, user.id).library_version == 1
+
+
+def test_biblioteca_304_is_answered_without_queries(client, app):
+    user = create_user(app, email="sin-sql@test.local")
+    login(client, user)
+    _create_memories(app, user.id, 2)
+    etag = client.get("/biblioteca").headers["ETag"]
+
+    consultas = []
+
+    def contar(conn, cursor, statement, parameters, context, executemany):
+        consultas.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", contar)
+    try:
+        assert client.get("/biblioteca", headers={"If-None-Match": etag}).status_code == 304
+    finally:
+        event.remove(engine, "before_cursor_execute", contar)
+    assert consultas == []
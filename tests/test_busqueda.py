@@ -0,0 +1,420 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+
+import pytest
+
+from app import db, main
+from app.models import TrackPreview, User
+from app.search_cache import MemoryBackend, SearchCache, SQLiteBackend, get_search_cache, normalizar_consulta
+
+
+class FakeResponse:
+    def __init__(self, payload: dict, status_code: int = 200):
+        self._payload = payload
+        self.status_code = status_code
+
+    def json(self):
+        return self._payload
+
+
+@pytest.fixture(autouse=True)
+def spotify_env(monkeypatch):
+    monkeypatch.setenv("SPOTIFY_CLIENT_ID", "id")
+    monkeypatch.setenv("SPOTIFY_CLIENT_SECRET", "secret")
+    main.invalidar_spotify_token()
+    get_search_cache().clear()
+    yield
+    main.invalidar_spotify_token()
+    get_search_cache().clear()
+
+
+def test_spotify_token_is_cached_until_expiry(monkeypatch):
+    calls = []
+
+    def fake_post(url, **kwargs):
+        calls.append(url)
+        return FakeResponse({"access_token": f"tok-{len(calls)}", "expires_in": 3600})
+
+    monkeypatch.setattr(main.http_client, "post", fake_post)
+
+    assert main.get_spotify_token() == "tok-1"
+    assert main.get_spotify_token() == "tok-1"
+    assert len(calls) == 1
+
+    main._spotify_token_cache["expires_at"] = 0.0
+    assert main.get_spotify_token() == "tok-2"
+    assert len(calls) == 2
+
+
+def test_spotify_token_refresh_is_single_flight(monkeypatch):
+    calls = []
+    liberar = threading.Event()
+
+    def slow_post(url, **kwargs):
+        calls.append(url)
+        liberar.wait(5)
+        return FakeResponse({"access_token": "tok-nuevo", "expires_in": 3600})
+
+    monkeypatch.setattr(main.http_client, "post", slow_post)
+    # Token aún válido pero dentro del margen de renovación.
+    main._spotify_token_cache.update(access_token="tok-viejo", expires_at=time.monotonic() + 30)
+
+    tokens = []
+    lider = threading.Thread(target=lambda: tokens.append(main.get_spotify_token()))
+    lider.start()
+    while not calls:
+        time.sleep(0.01)
+    # Mientras se renueva, el resto sigue con el token anterior sin esperar ni pedir otro.
+    assert main.get_spotify_token() == "tok-viejo"
+
+    main._spotify_token_cache["expires_at"] = 0.0
+    seguidores = [threading.Thread(target=lambda: tokens.append(main.get_spotify_token())) for _ in range(4)]
+    for hilo in seguidores:
+        hilo.start()
+    time.sleep(0.05)
+    liberar.set()
+    for hilo in [lider, *seguidores]:
+        hilo.join(5)
+
+    assert len(calls) == 1
+    assert tokens == ["tok-nuevo"] * 5
+
+
+def test_failed_token_refresh_backs_off_and_stale_401_keeps_new_token(monkeypatch):
+    calls = []
+
+    def failing_post(url, **kwargs):
+        calls.append(url)
+        raise RuntimeError("spotify caído")
+
+    monkeypatch.setattr(main.http_client, "post", failing_post)
+    assert main.get_spotify_token() is None
+    assert main.get_spotify_token() is None
+    assert len(calls) == 1
+
+    main.invalidar_spotify_token()
+    main._spotify_token_cache.update(access_token="tok-2", expires_at=time.monotonic() + 3600)
+    main.invalidar_spotify_token("tok-1")
+    assert main.get_spotify_token() == "tok-2"
+    main.invalidar_spotify_token("tok-2")
+    assert main._spotify_token_cache["access_token"] is None
+
+
+def test_buscar_canciones_falls_back_to_itunes_when_token_refresh_fails(monkeypatch):
+    def failing_post(url, **kwargs):
+        raise OSError("spotify caído")
+
+    def fake_get(url, params=None, **kwargs):
+        assert "itunes" in url
+        return FakeResponse({"results": [{"trackName": "Tema", "artistName": "Artista", "previewUrl": "p.m4a"}]})
+
+    monkeypatch.setattr(main.http_client, "post", failing_post)
+    monkeypatch.setattr(main.http_client, "get", fake_get)
+
+    resultados = main.buscar_canciones("tema")
+    assert [r["titulo"] for r in resultados] == ["Tema"]
+    assert resultados[0]["preview_url"] == "p.m4a"
+
+
+def test_buscar_canciones_returns_stragglers_without_preview(monkeypatch):
+    liberar = threading.Event()
+    tracks = [
+        {"name": "Rapida", "artists": [{"name": "A"}], "album": {"images": []}, "external_urls": {}},
+        {"name": "Lenta", "artists": [{"name": "B"}], "album": {"images": []}, "external_urls": {}},
+    ]
+
+    def fake_post(url, **kwargs):
+        return FakeResponse({"access_token": "tok", "expires_in": 3600})
+
+    def fake_get(url, params=None, **kwargs):
+        return FakeResponse({"tracks": {"items": tracks}})
+
+    def fake_preview(titulo, artista):
+        if titulo == "Lenta":
+            liberar.wait(5)
+        return f"{titulo}.m4a"
+
+    monkeypatch.setattr(main.http_client, "post", fake_post)
+    monkeypatch.setattr(main.http_client, "get", fake_get)
+    monkeypatch.setattr(main, "consultar_preview_itunes", fake_preview)
+    monkeypatch.setattr(main, "PREVIEW_LOOKUP_DEADLINE_SECONDS", 0.2)
+
+    try:
+        resultados = main.buscar_canciones("algo")
+    finally:
+        liberar.set()
+
+    assert [r["preview_url"] for r in resultados] == ["Rapida.m4a", None]
+
+
+def test_normalizar_consulta_folds_case_accents_and_spaces():
+    assert normalizar_consulta("  Robe   El HOMBRE  Pájaro ") == "robe el hombre pajaro"
+
+
+def test_buscar_canciones_serves_repeated_queries_from_cache(monkeypatch):
+    calls = []
+
+    def fake_upstream(query):
+        calls.append(query)
+        return [{"titulo": "Tema", "artista": "A", "portada": None, "spotify_url": None, "preview_url": None}], True
+
+    monkeypatch.setattr(main, "buscar_canciones_sin_cache", fake_upstream)
+
+    primera = main.buscar_canciones("Canción")
+    primera[0]["titulo"] = "modificado"
+    segunda = main.buscar_canciones("  cancion ")
+
+    assert calls == ["Canción"]
+    assert segunda[0]["titulo"] == "Tema"
+    assert get_search_cache().stats() == {"hits": 1, "misses": 1}
+
+
+@pytest.mark.parametrize(
+    "backend_factory",
+    [
+        lambda tmp: MemoryBackend(max_entries=2),
+        lambda tmp: SQLiteBackend(str(tmp / "cache.db"), max_entries=2),
+    ],
+)
+def test_search_cache_backends_evict_and_expire(tmp_path, backend_factory):
+    cache = SearchCache(backend_factory(tmp_path), ttl_hit=60, ttl_empty=-1)
+
+    cache.set("a", [{"titulo": "A"}])
+    cache.set("b", [{"titulo": "B"}])
+    assert cache.get("a") == [{"titulo": "A"}]
+    cache.set("c", [{"titulo": "C"}])
+    cache.set("vacio", [])
+
+    assert cache.get("b") is None
+    assert cache.get("vacio") is None
+    assert cache.get("c") == [{"titulo": "C"}]
+
+
+def test_previews_are_persisted_and_reused(app, monkeypatch):
+    consultas = []
+    tracks = [{"name": "Hombre Pájaro", "artists": [{"name": "Robe"}], "album": {"images": []}, "external_urls": {}}]
+
+    def fake_post(url, **kwargs):
+        return FakeResponse({"access_token": "tok", "expires_in": 3600})
+
+    def fake_get(url, params=None, **kwargs):
+        return FakeResponse({"tracks": {"items": tracks}})
+
+    def fake_preview(titulo, artista):
+        consultas.append((titulo, artista))
+        return "robe.m4a"
+
+    monkeypatch.setattr(main.http_client, "post", fake_post)
+    monkeypatch.setattr(main.http_client, "get", fake_get)
+    monkeypatch.setattr(main, "consultar_preview_itunes", fake_preview)
+
+    with app.app_context():
+        assert main.buscar_canciones_sin_cache("robe")[0][0]["preview_url"] == "robe.m4a"
+        assert main.buscar_canciones_sin_cache("robe otra vez")[0][0]["preview_url"] == "robe.m4a"
+
+        fila = TrackPreview.query.one()
+        assert fila.lookup_key == "hombre pajaro|robe"
+        assert fila.not_found is False
+
+    assert consultas == [("Hombre Pájaro", "Robe")]
+
+
+def test_stale_preview_is_refreshed_once_while_in_flight(app, monkeypatch):
+    consultas = []
+    liberar = threading.Event()
+
+    def slow_preview(titulo, artista):
+        consultas.append(titulo)
+        liberar.wait(5)
+        return "nueva.m4a"
+
+    monkeypatch.setattr(main, "consultar_preview_itunes", slow_preview)
+
+    with app.app_context():
+        main.guardar_preview(main.clave_preview("Tema", "Artista"), "Tema", "Artista", "vieja.m4a")
+        fila = TrackPreview.query.one()
+        fila.fetched_at -= main.PREVIEW_CACHE_MAX_AGE
+        db.session.commit()
+
+        # Mientras el refresco sigue en vuelo, las lecturas sirven el valor guardado sin encolar otro.
+        for _ in range(5):
+            resultados = [{"preview_url": None}]
+            assert main.completar_previews(resultados, [("Tema", "Artista")]) is True
+            assert resultados[0]["preview_url"] == "vieja.m4a"
+
+    liberar.set()
+    deadline = time.monotonic() + 5
+    while main._refrescos_en_vuelo and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert consultas == ["Tema"]
+    assert not main._refrescos_en_vuelo
+    with app.app_context():
+        assert TrackPreview.query.one().preview_url == "nueva.m4a"
+
+
+def test_preview_network_errors_are_not_cached_as_missing(app, monkeypatch):
+    def failing_preview(titulo, artista):
+        raise OSError("itunes caído")
+
+    monkeypatch.setattr(main, "consultar_preview_itunes", failing_preview)
+
+    with app.app_context():
+        resultados = [{"preview_url": None}]
+        assert main.completar_previews(resultados, [("Tema", "Artista")]) is False
+        assert resultados[0]["preview_url"] is None
+        assert TrackPreview.query.count() == 0
+
+
+def test_searches_with_pending_previews_are_cached_only_briefly(monkeypatch):
+    cache = SearchCache(MemoryBackend(), ttl_hit=3600, ttl_empty=60)
+    monkeypatch.setattr(main, "get_search_cache", lambda: cache)
+    monkeypatch.setattr(main, "PREVIEW_LOOKUP_DEADLINE_SECONDS", 0.1)
+    monkeypatch.setattr(main, "get_spotify_token", lambda: "tok")
+    tracks = [{"name": "Lenta", "artists": [{"name": "A"}], "album": {"images": []}, "external_urls": {}}]
+    monkeypatch.setattr(main.http_client, "get", lambda url, **kwargs: FakeResponse({"tracks": {"items": tracks}}))
+    llega = threading.Event()
+
+    def slow_preview(titulo, artista):
+        llega.wait(5)
+        return "lenta.m4a"
+
+    monkeypatch.setattr(main, "consultar_preview_itunes", slow_preview)
+    guardados = []
+    original_set = cache.backend.set
+    monkeypatch.setattr(cache.backend, "set", lambda key, value, ttl: (guardados.append(ttl), original_set(key, value, ttl)))
+
+    assert main.buscar_canciones("lenta")[0]["preview_url"] is None
+    llega.set()
+    assert guardados == [60]
+
+    monkeypatch.setattr(main, "consultar_preview_itunes", lambda titulo, artista: "rapida.m4a")
+    cache.clear()
+    assert main.buscar_canciones("lenta")[0]["preview_url"] == "rapida.m4a"
+    assert guardados == [60, 3600]
+
+
+def _login_new_user(app, client, email: str = "busca@test.local") -> None:
+    with app.app_context():
+        u = User(email=email)
+        u.set_password("123456")
+        db.session.add(u)
+        db.session.commit()
+        user_id = u.id
+    with client.session_transaction() as session:
+        session["_user_id"] = str(user_id)
+        session["_fresh"] = True
+
+
+def test_stream_endpoint_emits_tracks_then_previews(app, monkeypatch):
+    client = app.test_client()
+    _login_new_user(app, client)
+
+    def fake_tracks(query):
+        resultados = [
+            {"titulo": "Uno", "artista": "A", "portada": None, "spotify_url": None, "preview_url": None},
+            {"titulo": "Dos", "artista": "B", "portada": None, "spotify_url": None, "preview_url": None},
+        ]
+        return resultados, [("Uno", "A"), ("Dos", "B")]
+
+    monkeypatch.setattr(main, "buscar_tracks", fake_tracks)
+    monkeypatch.setattr(main, "consultar_preview_itunes", lambda titulo, artista: "uno.m4a" if titulo == "Uno" else None)
+
+    resp = client.get("/buscar_spotify/stream?q=uno")
+    assert resp.status_code == 200
+    assert resp.mimetype == "application/x-ndjson"
+    eventos = [json.loads(linea) for linea in resp.get_data(as_text=True).splitlines()]
+
+    assert [e["tipo"] for e in eventos] == ["track", "track", "preview", "fin"]
+    assert eventos[2] == {"tipo": "preview", "indice": 0, "preview_url": "uno.m4a"}
+
+    cacheado = client.get("/buscar_spotify?q=UNO").get_json()["resultados"]
+    assert [r["preview_url"] for r in cacheado] == ["uno.m4a", None]
+
+
+def test_concurrent_identical_searches_share_one_upstream_call(monkeypatch):
+    calls = []
+    empezar = threading.Event()
+
+    def slow_upstream(query):
+        calls.append(query)
+        empezar.wait(5)
+        return [{"titulo": "Tema", "artista": "A", "portada": None, "spotify_url": None, "preview_url": None}], True
+
+    monkeypatch.setattr(main, "buscar_canciones_sin_cache", slow_upstream)
+
+    resultados = []
+    hilos = [
+        threading.Thread(target=lambda q=q: resultados.append(main.buscar_canciones(q)))
+        for q in ["Leiva", "leiva ", "LEIVA"]
+    ]
+    for hilo in hilos:
+        hilo.start()
+    while not calls:
+        time.sleep(0.01)
+    empezar.set()
+    for hilo in hilos:
+        hilo.join(5)
+
+    assert len(calls) == 1
+    assert [r[0]["titulo"] for r in resultados] == ["Tema", "Tema", "Tema"]
+
+
+def test_concurrent_stream_searches_share_one_upstream_call(app, monkeypatch):
+    client = app.test_client()
+    _login_new_user(app, client)
+    calls = []
+    empezar = threading.Event()
+
+    def slow_tracks(query):
+        calls.append(query)
+        empezar.wait(5)
+        return [{"titulo": "Tema", "artista": "A", "portada": None, "spotify_url": None, "preview_url": None}], []
+
+    monkeypatch.setattr(main, "buscar_tracks", slow_tracks)
+
+    respuestas = []
+
+    def pedir(q):
+        respuestas.append(client.get(f"/buscar_spotify/stream?q={q}").get_data(as_text=True))
+
+    hilos = [threading.Thread(target=pedir, args=("Leiva",))]
+    hilos[0].start()
+    while not calls:
+        time.sleep(0.01)
+    hilos += [
+        threading.Thread(target=pedir, args=("leiva",)),
+        threading.Thread(target=lambda: respuestas.append(main.buscar_canciones("LEIVA"))),
+    ]
+    for hilo in hilos[1:]:
+        hilo.start()
+    time.sleep(0.1)
+    empezar.set()
+    for hilo in hilos:
+        hilo.join(5)
+
+    assert len(calls) == 1
+    streams = [r for r in respuestas if isinstance(r, str)]
+    assert len(streams) == 2
+    for texto in streams:
+        eventos = [json.loads(linea) for linea in texto.splitlines()]
+        assert eventos[0]["track"]["titulo"] == "Tema"
+        assert eventos[-1] == {"tipo": "fin", "total": 1}
+    assert [r for r in respuestas if isinstance(r, list)][0][0]["titulo"] == "Tema"
+
+
+def test_search_rate_limit_sheds_excess_requests(app, monkeypatch):
+    app.config.update(SEARCH_RATE_LIMIT_BURST=2, SEARCH_RATE_LIMIT_PER_SECOND=0.01)
+    client = app.test_client()
+    _login_new_user(app, client, email="rapido@test.local")
+    monkeypatch.setattr(main, "buscar_canciones", lambda query: [])
+
+    assert client.get("/buscar_spotify?q=a").status_code == 200
+    assert client.get("/buscar_spotify?q=b").status_code == 200
+    rechazada = client.get("/buscar_spotify?q=c")
+
+    assert rechazada.status_code == 429
+    assert int(rechazada.headers["Retry-After"]) >= 1
+    assert rechazada.get_json()["resultados"] == []
@@ -1,49 +1,16 @@
 from __future__ import annotations
 
+import json
+import threading
 from datetime import datetime, timedelta
 
 import pytest
+from sqlalchemy import event
 
 from app import create_app, db
-from app.models import Capsule, User
-
-
-@pytest.fixture()
-def app(tmp_path, monkeypatch):
-    db_path = tmp_path / "test_eco.db"
-    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{db_path}")
-    flask_app = create_app()
-    flask_app.config.update(TESTING=True)
-
-    with flask_app.app_context():
-        db.create_all()
-
-    yield flask_app
-
-    with flask_app.app_context():
-        db.session.remove()
-        db.drop_all()
-
-
-@pytest.fixture()
-def client(app):
-    return app.test_client()
-
-
-def _create_user(app, email: str = "caps@test.local") -> User:
-    with app.app_context():
-        u = User(email=email)
-        u.set_password("123456")
-        db.session.add(u)
-        db.session.commit()
-        db.session.refresh(u)
-        return u
-
-
-def _login(client, user: User) -> None:
-    with client.session_transaction() as session:
-        session["_user_id"] = str(user.id)
-        session["_fresh"] = True
+from app.models import Capsule, CapsuleUnlockJob, User
+from app.scheduler import get_unlock_scheduler
+from conftest import create_user, login
 
 
 def _create_capsule(app, user_id: int, **kwargs) -> Capsule:
@@ -62,8 +29,8 @@ def _create_capsule(app, user_id: int, **kwargs) -> Capsule:
 
 
 def test_capsules_create_and_list(client, app):
-    user = _create_user(app)
-    _login(client, user)
+    user = create_user(app)
+    login(client, user)
 
     open_date = (datetime.utcnow() + timedelta(hours=1)).isoformat()
     resp = client.post(
@@ -90,8 +57,8 @@ def test_capsules_create_and_list(client, app):
 
 
 def test_capsules_allows_multiple_closed_active(client, app):
-    user = _create_user(app, email="limit@test.local")
-    _login(client, user)
+    user = create_user(app, email="limit@test.local")
+    login(client, user)
 
     first_open_date = (datetime.utcnow() + timedelta(hours=2)).isoformat()
     second_open_date = (datetime.utcnow() + timedelta(hours=3)).isoformat()
@@ -104,8 +71,8 @@ def test_capsules_allows_multiple_closed_active(client, app):
 
 
 def test_capsules_open_denied_before_open_date_even_if_client_forces(client, app):
-    user = _create_user(app, email="gate@test.local")
-    _login(client, user)
+    user = create_user(app, email="gate@test.local")
+    login(client, user)
     capsule = _create_capsule(
         app,
         user.id,
@@ -119,8 +86,8 @@ def test_capsules_open_denied_before_open_date_even_if_client_forces(client, app
 
 
 def test_capsules_open_success_when_server_time_allows(client, app):
-    user = _create_user(app, email="open@test.local")
-    _login(client, user)
+    user = create_user(app, email="open@test.local")
+    login(client, user)
     capsule = _create_capsule(
         app,
         user.id,
@@ -141,8 +108,8 @@ def test_capsules_open_success_when_server_time_allows(client, app):
 
 
 def test_admin_premium_toggle_returns_404_when_feature_disabled(client, app):
-    user = _create_user(app, email="celiafm17@gmail.com")
-    _login(client, user)
+    user = create_user(app, email="celiafm17@gmail.com")
+    login(client, user)
 
     resp = client.post("/admin/premium-toggle")
     assert resp.status_code == 404
@@ -160,8 +127,8 @@ def test_capsules_limit_is_reenabled_with_feature_flag(tmp_path, monkeypatch):
 
     try:
         client = flask_app.test_client()
-        user = _create_user(flask_app, email="limit2@test.local")
-        _login(client, user)
+        user = create_user(flask_app, email="limit2@test.local")
+        login(client, user)
 
         first_open_date = (datetime.utcnow() + timedelta(hours=2)).isoformat()
         second_open_date = (datetime.utcnow() + timedelta(hours=3)).isoformat()
@@ -176,3 +143,236 @@ def test_capsules_limit_is_reenabled_with_feature_flag(tmp_path, monkeypatch):
         with flask_app.app_context():
             db.session.remove()
             db.drop_all()
+
+
+def test_session_user_is_cached_and_refreshed_after_premium_toggle(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'test_eco_identity.db'}")
+    monkeypatch.setenv("PREMIUM_ENABLED", "true")
+    monkeypatch.setenv("ECO_ADMIN_EMAILS", " Admin@Test.local , otra@test.local")
+    flask_app = create_app()
+    flask_app.config.update(TESTING=True)
+    assert flask_app.config["ADMIN_EMAILS"] == frozenset({"admin@test.local", "otra@test.local"})
+
+    with flask_app.app_context():
+        db.create_all()
+        consultas_usuario = []
+        event.listen(
+            db.engine,
+            "before_cursor_execute",
+            lambda conn, cursor, sql, *args: consultas_usuario.append(sql) if sql.startswith("SELECT user.") else None,
+        )
+
+    try:
+        client = flask_app.test_client()
+        user = create_user(flask_app, email="admin@test.local")
+        login(client, user)
+        consultas_usuario.clear()
+
+        assert client.get("/capsulas/panel").status_code == 200
+        assert len(consultas_usuario) == 1
+        panel = client.get("/capsulas/panel")
+        assert "Activar premium" in panel.get_data(as_text=True)
+        assert len(consultas_usuario) == 1
+
+        toggle = client.post("/admin/premium-toggle")
+        assert toggle.get_json()["is_premium"] is True
+        assert "Premium ON" in client.get("/capsulas/panel").get_data(as_text=True)
+    finally:
+        with flask_app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+
+def _eventos_sse(resp) -> list[tuple[str, dict]]:
+    eventos = []
+    for bloque in resp.get_data(as_text=True).split("\n\n"):
+        campos = dict(linea.split(": ", 1) for linea in bloque.splitlines() if not linea.startswith(":"))
+        if "event" in campos:
+            eventos.append((campos["event"], json.loads(campos["data"])))
+    return eventos
+
+
+def test_capsule_creation_persists_unlock_job_and_far_events_return_retry(client, app):
+    user = create_user(app, email="sse@test.local")
+    login(client, user)
+    open_date = datetime.utcnow() + timedelta(hours=2)
+    creada = client.post("/capsulas", json={"title": "Lejos", "open_date": open_date.isoformat()})
+    capsule_id = creada.get_json()["capsula"]["id"]
+
+    with app.app_context():
+        job = db.session.get(CapsuleUnlockJob, capsule_id)
+        assert job.run_at == open_date and job.done_at is None
+
+    resp = client.get(f"/capsulas/{capsule_id}/eventos")
+    assert resp.mimetype == "text/event-stream"
+    assert _eventos_sse(resp)[0][0] == "programada"
+    retry_ms = int(resp.get_data(as_text=True).split("retry: ")[1].split("\n")[0])
+    assert retry_ms == 3600 * 1000
+    # Lejos de la apertura no hace falta el scheduler.
+    assert "eco_unlock_scheduler" not in app.extensions
+
+
+def test_unlock_scheduler_recovers_pending_jobs_and_pushes_unlock(client, app):
+    user = create_user(app, email="ritual@test.local")
+    login(client, user)
+    vencida = _create_capsule(app, user.id, open_date=datetime.utcnow() - timedelta(minutes=5))
+    inminente = _create_capsule(app, user.id, open_date=datetime.utcnow() + timedelta(seconds=1))
+    with app.app_context():
+        # Como si el proceso se hubiera reiniciado con los trabajos aún pendientes en la tabla.
+        for c in (vencida, inminente):
+            db.session.add(CapsuleUnlockJob(capsule_id=c.id, run_at=c.open_date))
+        db.session.commit()
+
+    resp = client.get(f"/capsulas/{inminente.id}/eventos")
+    eventos = _eventos_sse(resp)
+    assert [nombre for nombre, _ in eventos] == ["abrible"]
+    assert datetime.fromisoformat(eventos[0][1]["ahora"].rstrip("Z")) >= inminente.open_date
+
+    with app.app_context():
+        scheduler = get_unlock_scheduler()
+        assert scheduler.disparadas == 2
+        assert all(job.done_at is not None for job in CapsuleUnlockJob.query.all())
+    ritual = client.get(f"/capsulas/{inminente.id}/ritual")
+    assert b'id="startRitualBtn"' in ritual.data
+
+
+def test_capsule_views_read_the_unlock_mark_set_by_the_scheduler(client, app):
+    user = create_user(app, email="marca@test.local")
+    login(client, user)
+    open_date = datetime.utcnow() + timedelta(hours=1)
+    creada = client.post("/capsulas", json={"title": "Vence", "open_date": open_date.isoformat()})
+    capsule_id = creada.get_json()["capsula"]["id"]
+    with app.app_context():
+        # Como si ya hubiera llegado la hora pero el scheduler aún no la hubiera marcado.
+        pasado = datetime.utcnow() - timedelta(seconds=1)
+        db.session.get(Capsule, capsule_id).open_date = pasado
+        db.session.get(CapsuleUnlockJob, capsule_id).run_at = pasado
+        db.session.commit()
+
+    cerradas = client.get("/capsulas?estado=cerradas").get_json()["capsulas"]
+    assert [c["is_unlockable_now"] for c in cerradas] == [False]
+
+    with app.app_context():
+        scheduler = get_unlock_scheduler()
+        for _ in range(200):
+            if scheduler.disparadas:
+                break
+            threading.Event().wait(0.01)
+    cerradas = client.get("/capsulas?estado=cerradas").get_json()["capsulas"]
+    assert [c["is_unlockable_now"] for c in cerradas] == [True]
+    assert b"let canUnlockNow = true;" in client.get(f"/capsulas/{capsule_id}/ritual").data
+
+
+@pytest.fixture()
+def premium_app(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'test_eco_premium.db'}")
+    monkeypatch.setenv("PREMIUM_ENABLED", "true")
+    flask_app = create_app()
+    flask_app.config.update(TESTING=True)
+    with flask_app.app_context():
+        db.create_all()
+
+    yield flask_app
+
+    with flask_app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+def test_concurrent_creates_cannot_both_pass_free_limit(premium_app, monkeypatch):
+    import app.main as main
+
+    user = create_user(premium_app, email="carrera@test.local")
+    # Las dos peticiones pasan la comprobación rápida antes de que ninguna reserve.
+    barrera = threading.Barrier(2)
+    original = main.can_create_capsule
+    monkeypatch.setattr(main, "can_create_capsule", lambda u: original(u) and barrera.wait(timeout=5) >= 0)
+
+    estados = []
+
+    def crear(titulo):
+        client = premium_app.test_client()
+        login(client, user)
+        open_date = (datetime.utcnow() + timedelta(hours=2)).isoformat()
+        estados.append(client.post("/capsulas", json={"title": titulo, "open_date": open_date}).status_code)
+
+    hilos = [threading.Thread(target=crear, args=(t,)) for t in ("Uno", "Dos")]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join(timeout=15)
+
+    assert sorted(estados) == [201, 403]
+    with premium_app.app_context():
+        assert Capsule.query.filter_by(user_id=user.id).count() == 1
+        assert db.session.get(User, user.id).sealed_capsules == 1
+
+
+def test_sealed_counter_is_read_without_count_and_expires_with_open_date(premium_app):
+    user = create_user(premium_app, email="contador@test.local")
+    client = premium_app.test_client()
+    login(client, user)
+    open_date = (datetime.utcnow() + timedelta(hours=2)).isoformat()
+    assert client.post("/capsulas", json={"title": "Uno", "open_date": open_date}).status_code == 201
+
+    sentencias = []
+    with premium_app.app_context():
+        event.listen(db.engine, "before_cursor_execute", lambda *a: sentencias.append(a[2].lower()))
+    rechazada = client.post("/capsulas", json={"title": "Dos", "open_date": open_date})
+    assert rechazada.status_code == 403
+    assert not any("count(" in sql for sql in sentencias)
+
+    # Llega la fecha de la primera: el contador caduca y se recalcula una sola vez.
+    with premium_app.app_context():
+        hace_un_rato = datetime.utcnow() - timedelta(minutes=1)
+        Capsule.query.filter_by(user_id=user.id).update({"open_date": hace_un_rato})
+        db.session.get(User, user.id).sealed_capsules_until = hace_un_rato
+        db.session.commit()
+    sentencias.clear()
+    assert client.post("/capsulas", json={"title": "Dos", "open_date": open_date}).status_code == 201
+    assert sum("count(" in sql for sql in sentencias) == 1
+    with premium_app.app_context():
+        actualizado = db.session.get(User, user.id)
+        assert actualizado.sealed_capsules == 1
+        assert actualizado.sealed_capsules_until == datetime.fromisoformat(open_date)
+
+
+def test_capsules_listing_filters_paginates_and_hides_sealed_messages(client, app):
+    user = create_user(app, email="lista@test.local")
+    login(client, user)
+    base = datetime.utcnow() - timedelta(days=1)
+    for i in range(5):
+        _create_capsule(app, user.id, title=f"Cerrada {i}", created_at=base + timedelta(minutes=i))
+    for i in range(2):
+        _create_capsule(
+            app,
+            user.id,
+            title=f"Abierta {i}",
+            open_date=base,
+            opened_at=base + timedelta(hours=1),
+            created_at=base + timedelta(minutes=10 + i),
+        )
+
+    primera = client.get("/capsulas?estado=cerradas&limit=2").get_json()
+    assert [c["title"] for c in primera["capsulas"]] == ["Cerrada 4", "Cerrada 3"]
+    assert all("message" not in c for c in primera["capsulas"])
+    titulos = [c["title"] for c in primera["capsulas"]]
+    cursor = primera["next_cursor"]
+    while cursor:
+        pagina = client.get("/capsulas", query_string={"estado": "cerradas", "limit": 2, "cursor": cursor}).get_json()
+        titulos += [c["title"] for c in pagina["capsulas"]]
+        cursor = pagina["next_cursor"]
+    assert titulos == [f"Cerrada {i}" for i in range(4, -1, -1)]
+
+    abiertas = client.get("/capsulas?estado=abiertas").get_json()
+    assert [c["title"] for c in abiertas["capsulas"]] == ["Abierta 1", "Abierta 0"]
+    assert abiertas["capsulas"][0]["message"] == "Mensaje sellado"
+    assert abiertas["next_cursor"] is None
+
+    panel = client.get("/capsulas?limit=3").get_json()
+    assert panel["total"] == 7
+    assert len(panel["cerradas"]) == 3 and panel["next_cursor"]["cerradas"]
+    assert len(panel["abiertas"]) == 2 and panel["next_cursor"]["abiertas"] is None
+
+    assert client.get("/capsulas?estado=todas").status_code == 400
+    assert client.get("/capsulas?estado=cerradas&cursor=basura").status_code == 400
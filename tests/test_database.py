@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+from sqlalchemy import text
+
+from app import create_app, db
+from app.database import opciones_engine
+
+
+def test_postgres_engine_options_come_from_environment(monkeypatch):
+    monkeypatch.setenv("GUNICORN_THREADS", "4")
+    monkeypatch.setenv("DB_STATEMENT_TIMEOUT_MS", "2500")
+    monkeypatch.delenv("DB_POOL_SIZE", raising=False)
+    opciones = opciones_engine("postgresql://eco@localhost/eco")
+
+    assert opciones["pool_pre_ping"] is True
+    assert opciones["pool_size"] == 6
+    assert opciones["pool_recycle"] < 300
+    assert opciones["connect_args"]["options"] == "-c statement_timeout=2500"
+
+    monkeypatch.setenv("DB_STATEMENT_TIMEOUT_MS", "0")
+    assert "options" not in opciones_engine("postgresql://eco@localhost/eco")["connect_args"]
+
+
+def test_sqlite_file_database_uses_wal_and_busy_timeout(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'test_eco.db'}")
+    monkeypatch.setenv("DB_BUSY_TIMEOUT_MS", "3000")
+    app = create_app()
+
+    with app.app_context():
+        with db.engine.connect() as conn:
+            assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+            # 1 = NORMAL
+            assert conn.execute(text("PRAGMA synchronous")).scalar() == 1
+            assert conn.execute(text("PRAGMA busy_timeout")).scalar() == 3000
+        db.engine.dispose()
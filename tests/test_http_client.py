@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import pytest
+import requests
+
+from app import http_client
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, headers: dict | None = None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def close(self):
+        pass
+
+
+class FakeSession:
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture(autouse=True)
+def fast_client(monkeypatch):
+    http_client.reset()
+    sleeps = []
+    monkeypatch.setattr(http_client.time, "sleep", sleeps.append)
+    monkeypatch.setattr(http_client, "MAX_RETRIES", 2)
+    yield sleeps
+    http_client.reset()
+
+
+def _use_session(monkeypatch, outcomes) -> FakeSession:
+    session = FakeSession(outcomes)
+    monkeypatch.setattr(http_client, "get_session", lambda: session)
+    return session
+
+
+def test_retries_5xx_and_honours_retry_after(monkeypatch, fast_client):
+    session = _use_session(
+        monkeypatch,
+        [FakeResponse(503), FakeResponse(429, {"Retry-After": "1"}), FakeResponse(200)],
+    )
+
+    response = http_client.get("https://api.example/search")
+
+    assert response.status_code == 200
+    assert session.calls == 3
+    assert fast_client[1] == 1.0
+
+
+def test_long_retry_after_is_returned_without_waiting(monkeypatch, fast_client):
+    session = _use_session(monkeypatch, [FakeResponse(429, {"Retry-After": "120"})])
+
+    response = http_client.get("https://api.example/search")
+
+    assert response.status_code == 429
+    assert session.calls == 1
+    assert fast_client == []
+
+
+def test_breaker_opens_after_consecutive_failures(monkeypatch):
+    monkeypatch.setattr(http_client, "MAX_RETRIES", 0)
+    breaker = http_client.get_breaker("slow.example")
+    breaker.threshold = 2
+    session = _use_session(monkeypatch, [requests.Timeout(), requests.Timeout()])
+
+    for _ in range(2):
+        with pytest.raises(requests.Timeout):
+            http_client.get("https://slow.example/search")
+
+    with pytest.raises(http_client.CircuitOpenError):
+        http_client.get("https://slow.example/search")
+    assert session.calls == 2
+    assert http_client.get_breaker("other.example").allow() is True
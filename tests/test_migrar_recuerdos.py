@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import importlib.util
+import json
+import os
+
+import pytest
+
+from app import db
+from app.models import Memory, User
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_spec = importlib.util.spec_from_file_location(
+    "migrar_recuerdos_json_a_db", os.path.join(BASE_DIR, "scripts", "migrar_recuerdos_json_a_db.py")
+)
+migrar = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(migrar)
+
+
+def _recuerdos(n: int) -> list[dict]:
+    recuerdos = [
+        {
+            "id": f"legacy{i:04d}",
+            "titulo": f"Título [{i}], con «comillas»",
+            "cancion": f"Canción {i}",
+            "nota": "nota {con llaves} y \"escapes\"",
+            "fecha": f"14/02/20{10 + i % 10} 22:35",
+        }
+        for i in range(n)
+    ]
+    recuerdos.append({"titulo": "Sin id", "cancion": "X", "nota": "y", "fecha": "01/01/2020 10:00"})
+    recuerdos.append({"titulo": "", "cancion": "inválido", "nota": "z"})
+    return recuerdos
+
+
+def test_streaming_parser_handles_elements_split_across_chunks(tmp_path):
+    path = tmp_path / "recuerdos.json"
+    recuerdos = _recuerdos(20)
+    path.write_text(json.dumps(recuerdos, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    assert list(migrar.iterar_recuerdos_legacy(str(path), chunk_bytes=7)) == recuerdos
+
+    path.write_text('{"no": "es un array"}', encoding="utf-8")
+    assert list(migrar.iterar_recuerdos_legacy(str(path))) == []
+
+
+def test_import_is_idempotent_and_resumes_from_checkpoint(app, tmp_path):
+    json_path = str(tmp_path / "recuerdos.json")
+    checkpoint = str(tmp_path / "recuerdos.json.checkpoint")
+    recuerdos = _recuerdos(9)
+
+    def interrumpido():
+        for i, raw in enumerate(recuerdos):
+            if i == 5:
+                raise KeyboardInterrupt
+            yield raw
+
+    with app.app_context():
+        user = User(email="import@test.local", password_hash="x")
+        db.session.add(user)
+        db.session.commit()
+
+        mensajes: list[str] = []
+        with pytest.raises(KeyboardInterrupt):
+            migrar.migrate_for_user(
+                user, interrumpido(), False, batch_size=2, checkpoint_path=checkpoint, json_path=json_path
+            )
+        db.session.rollback()
+        assert Memory.query.count() == 4
+        with open(checkpoint, encoding="utf-8") as fh:
+            assert json.load(fh)["procesados"] == 4
+
+        inserted, skipped = migrar.migrate_for_user(
+            user,
+            iter(recuerdos),
+            False,
+            batch_size=2,
+            checkpoint_path=checkpoint,
+            json_path=json_path,
+            progreso=mensajes.append,
+        )
+        assert (inserted, skipped) == (10, 1)
+        assert mensajes[0].startswith("[INFO] Reanudando tras 4")
+        assert not os.path.exists(checkpoint)
+        assert Memory.query.count() == 10
+        assert db.session.get(Memory, "legacy0003").year == 2013
+        assert db.session.get(User, user.id).library_version > 0
+
+        # Una segunda pasada completa no inserta nada: ni los ids del JSON ni el derivado del contenido.
+        assert migrar.migrate_for_user(user, iter(recuerdos), False, progreso=mensajes.append) == (0, 11)
+        assert Memory.query.count() == 10
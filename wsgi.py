@@ -1,4 +1,8 @@
 from app import create_app
+from app.scheduler import iniciar_unlock_scheduler
 
 app = create_app()
 
+# Cada worker de gunicorn importa este módulo (sin --preload): el scheduler de aperturas arranca
+# con el proceso y marca las cápsulas vencidas aunque nadie tenga abierto el ritual.
+iniciar_unlock_scheduler(app)